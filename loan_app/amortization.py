@@ -0,0 +1,147 @@
+# File: amortization.py
+# Description: Batch amortization engine computing EMIs, installment splits, balances and due dates for many loans at once.
+
+import calendar
+import math
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+from django.utils.timezone import now
+
+# Quantum used when rounding carried balances to whole cents
+CENT = Decimal("0.01")
+
+
+def calculate_emi(amount, tenure, interest_rate):
+    # Calculate the monthly installment as a float (same formula LoanView has always used)
+    monthly_interest_rate = (interest_rate / 100) / 12
+    if monthly_interest_rate == 0:
+        return amount / tenure
+    growth = math.pow(1 + monthly_interest_rate, tenure)
+    return (amount * monthly_interest_rate * growth) / (growth - 1)
+
+
+def calculate_loan_terms(amount, tenure, interest_rate):
+    # Calculate EMI, total interest and total payable for a single loan application
+    emi = calculate_emi(amount, tenure, interest_rate)
+    interest_amount_after_all_emi = emi * tenure - amount
+    interest_total = amount * (interest_rate / 100)
+    total_interest = interest_total + interest_amount_after_all_emi
+    return {
+        "monthly_installment": round(emi, 2),
+        "total_interest": round(total_interest, 2),
+        "total_payable": round(amount + total_interest, 2),
+    }
+
+
+@lru_cache(maxsize=4096)
+def due_dates(start_date, tenure):
+    # Return the due date of every installment (start_date + N months, clamped to month end)
+    dates = []
+    month_index = start_date.year * 12 + start_date.month - 1
+    for i in range(1, tenure + 1):
+        year, month = divmod(month_index + i, 12)
+        month += 1
+        day = min(start_date.day, calendar.monthrange(year, month)[1])
+        dates.append(date(year, month, day))
+    return tuple(dates)
+
+
+def _to_cents(value):
+    # Round a Decimal to an integer number of cents (half-even, like round(value, 2))
+    return int(value.quantize(CENT).scaleb(2))
+
+
+def cents_to_decimal(cents):
+    # Convert an integer number of cents to a two-place Decimal
+    return Decimal(cents).scaleb(-2)
+
+
+class Schedule:
+    # Column arrays describing one loan's amortization schedule (money columns in integer cents)
+    __slots__ = ("installment_numbers", "due_dates", "principal", "interest", "balance")
+
+    def __init__(self, installment_numbers, due_dates, principal, interest, balance):
+        self.installment_numbers = installment_numbers
+        self.due_dates = due_dates
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+
+    def __len__(self):
+        return len(self.installment_numbers)
+
+    def rows(self):
+        # Yield (installment_number, due_date, principal, interest, remaining_balance) with Decimal amounts
+        for number, due_date, principal, interest, balance in zip(
+            self.installment_numbers, self.due_dates, self.principal, self.interest, self.balance
+        ):
+            yield (
+                number,
+                due_date,
+                cents_to_decimal(principal),
+                cents_to_decimal(interest),
+                cents_to_decimal(balance),
+            )
+
+
+def _amortize(amount, tenure, interest_rate, monthly_installment, start_date):
+    # Build the schedule columns for one loan.
+    # Balances are carried in the default Decimal context, exactly as the original per-row loop did,
+    # and every column is emitted as integer cents so callers can aggregate without Decimal objects.
+    balance = Decimal(amount)
+    emi = Decimal(float(monthly_installment))  # Stored EMIs round-trip to the float they were computed from
+    rate = Decimal(interest_rate) / 12 / 100
+
+    principal_cents = []
+    interest_cents = []
+    balance_cents = []
+    for _ in range(tenure - 1):
+        interest = balance * rate
+        principal = emi - interest
+        balance -= principal
+        interest_cents.append(_to_cents(interest))
+        principal_cents.append(_to_cents(principal))
+        balance_cents.append(_to_cents(balance))
+
+    # Final installment clears whatever principal the rounded installments left behind
+    interest_cents.append(_to_cents(balance * rate))
+    principal_cents.append(_to_cents(Decimal(amount)) - sum(principal_cents))
+    balance_cents.append(0)
+
+    return Schedule(
+        range(1, tenure + 1),
+        due_dates(start_date, tenure),
+        principal_cents,
+        interest_cents,
+        balance_cents,
+    )
+
+
+def legacy_final_installment(amount, tenure, interest_rate, monthly_installment):
+    # (principal, remaining balance) of the final installment as schedules were written before it was
+    # reconciled: a full EMI less interest, leaving a few cents of balance either way
+    balance = Decimal(amount)
+    emi = Decimal(float(monthly_installment))
+    rate = Decimal(interest_rate) / 12 / 100
+    for _ in range(tenure):
+        principal = emi - balance * rate
+        balance -= principal
+    return cents_to_decimal(_to_cents(principal)), cents_to_decimal(_to_cents(balance))
+
+
+def amortize_batch(loans, start_date=None):
+    # Compute schedules for many loans in one pass.
+    # `loans` is an iterable of (amount, tenure, interest_rate, monthly_installment[, start_date]) tuples;
+    # loans without their own start date are scheduled from `start_date` (today by default).
+    start_date = start_date or now().date()
+    return [
+        _amortize(*terms[:4], terms[4] if len(terms) > 4 and terms[4] else start_date)
+        for terms in loans
+    ]
+
+
+def amortize(amount, tenure, interest_rate, monthly_installment, start_date=None):
+    # Compute the schedule for a single loan
+    return amortize_batch([(amount, tenure, interest_rate, monthly_installment)], start_date)[0]
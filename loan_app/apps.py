@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LoanAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loan_app'
+
+    def ready(self):
+        # Register model signal handlers and system checks
+        from . import checks, signals  # noqa: F401
@@ -1,14 +1,109 @@
 # File: authentication.py
 # Description: Custom JWT authentication class for validating user tokens in API requests.
 
+import time
+
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+
+from .user_cache import change_log_shared, get_user, user_changed_at
 
 # Get the active user model
 User = get_user_model()
 
+# User attributes embedded in issued tokens so permission checks can skip the database
+ROLE_CLAIMS = ("role", "is_verified", "is_staff", "is_active")
+
+
+def tokens_for_user(user):
+    # Create a refresh token (and, through it, access tokens) carrying the user's role claims
+    refresh = RefreshToken.for_user(user)
+    for claim in ROLE_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    refresh["claims_at"] = int(time.time())  # When the claims were read from the database
+    return refresh
+
+
+def load_active_user(user_id):
+    # Fetch the user through the per-process cache, rejecting deleted or deactivated accounts
+    try:
+        user = get_user(user_id)
+    except User.DoesNotExist:
+        raise AuthenticationFailed("User not found")
+    if not user.is_active:
+        raise AuthenticationFailed("User is inactive")
+    return user
+
+
+def _has_claims(access_token):
+    # Whether the token carries claims that may stand in for the user row: all of them, for an active user,
+    # with a change log every worker sees (otherwise a change made through another worker would go unnoticed)
+    return (
+        "claims_at" in access_token
+        and all(claim in access_token for claim in ROLE_CLAIMS)
+        and access_token["is_active"]
+        and change_log_shared()
+    )
+
+
+def claims_are_current(access_token, user_id):
+    # Claims can be trusted unless the user changed after they were issued
+    if not _has_claims(access_token):
+        return False
+    changed_at = user_changed_at(user_id)
+    return changed_at is None or changed_at < access_token["claims_at"]
+
+
+# Authenticated user backed by token claims; the user row is only loaded when the view needs more
+# than the id or the role claims (e.g. to filter a queryset by the user)
+class ClaimsUser(SimpleLazyObject):
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, claims):
+        super().__init__(lambda: load_active_user(user_id))
+        self.__dict__["_user_id"] = user_id
+        self.__dict__["_claims"] = claims
+
+    def __bool__(self):
+        return True
+
+    @property
+    def pk(self):
+        return self._user_id
+
+    id = pk
+
+    @property
+    def role(self):
+        return self._claims["role"]
+
+    @property
+    def is_verified(self):
+        return self._claims["is_verified"]
+
+    @property
+    def is_staff(self):
+        return self._claims["is_staff"]
+
+    @property
+    def is_active(self):
+        return self._claims["is_active"]
+
+
+def validate_token(auth_header):
+    # Return (access token, user id) for a "Bearer <token>" header, raising AuthenticationFailed
+    try:
+        # Extract and validate the token and retrieve the user ID
+        access_token = AccessToken(auth_header.split(" ")[1])
+        return access_token, access_token["user_id"]
+    except Exception:
+        # Raise an error if token is invalid or expired
+        raise AuthenticationFailed("Invalid or expired token")
+
 
 # Custom JWT Authentication class
 class JWTAuthentication(BaseAuthentication):
@@ -20,18 +115,18 @@ class JWTAuthentication(BaseAuthentication):
         if not auth_header or not auth_header.startswith("Bearer "):
             return None  # No credentials provided, let other authentication handle it
 
-        # Extract the token from the header
-        token = auth_header.split(" ")[1]
-
-        try:
-            # Validate the token and retrieve user ID
-            access_token = AccessToken(token)
-            user_id = access_token["user_id"]
-            # Fetch the user from the database
-            user = User.objects.get(id=user_id)
-        except Exception:
-            # Raise an error if token is invalid or expired
-            raise AuthenticationFailed("Invalid or expired token")
-
-        # Return the authenticated user and token (None for token since it's handled by JWT)
-        return (user, None)
\ No newline at end of file
+        access_token, user_id = validate_token(auth_header)
+
+        if claims_are_current(access_token, user_id):
+            # Role checks read the claims; the user is loaded lazily from the cache
+            user = ClaimsUser(user_id, {claim: access_token[claim] for claim in ROLE_CLAIMS})
+        else:
+            # Old token format or the user changed since the token was issued: use the stored user
+            user = load_active_user(user_id)
+
+        # Return the authenticated user and the validated token
+        return (user, access_token)
+
+    def authenticate_header(self, request):
+        # Makes DRF answer failed authentication with 401 instead of 403
+        return 'Bearer realm="api"'
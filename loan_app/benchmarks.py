@@ -0,0 +1,476 @@
+# File: benchmarks.py
+# Description: Endpoint micro-benchmarks: seeds data, drives the API through the test client and records latency, queries and memory.
+
+import asyncio
+import json
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import django
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .authentication import tokens_for_user
+from .compression import compress, supported_encodings
+from .models import Loan, PaymentSchedule
+from .origination import originate_loans
+from .projections import load_schedules, loan_rows, serialize_loans
+from .renderers import ColumnarJSONRenderer, FastJSONRenderer, MessagePackRenderer, orjson
+from .serializers import LoanSerializer
+
+# Get the active user model
+User = get_user_model()
+
+# Schedule rows seeded for each named size
+SIZES = {"small": 1_000, "medium": 100_000, "large": 1_000_000}
+
+# Terms of seeded loans (rows per loan = tenure)
+SEED_TENURE = 12
+FILLER_LOANS_PER_USER = 5  # Loans per background borrower
+
+BORROWER_EMAIL = "bench-borrower@example.com"
+ADMIN_EMAIL = "bench-admin@example.com"
+PASSWORD = "bench-password"
+
+# Most queries a single request of each scenario may run with the default settings. Authenticated requests
+# include loading the user row, which token claims save when AUTH_REVOCATION_CACHE is shared.
+QUERY_BUDGETS = {
+    "loan_list": 2,
+    "loan_list_revalidate": 2,  # Without the list query when the response cache is on (RESPONSE_CACHE_BACKEND)
+    "admin_loan_list": 3,
+    "pay_installment": 10,
+    "foreclosure_details": 3,
+    "foreclose_loan": 9,
+    "jwt_login": 1,
+}
+
+# Loans serialized by the serialization benchmark
+SERIALIZATION_LOANS = 10_000
+
+# Clients sending requests at once in the concurrency benchmark, and requests each client sends
+CONCURRENCY_LEVELS = (1, 8, 32, 128)
+REQUESTS_PER_CLIENT = 4
+
+# Changes below these are treated as noise when comparing runs
+MIN_LATENCY_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KB = 256
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def seed(rows, borrower_loans):
+    # Create a benchmark borrower with `borrower_loans` loans, an admin, and background borrowers holding the
+    # rest of about `rows` schedule rows. Returns (borrower, admin).
+    borrower = User.objects.create_user(
+        username="bench-borrower", email=BORROWER_EMAIL, password=PASSWORD, role="user", is_verified=True
+    )
+    admin = User.objects.create_user(
+        username="bench-admin", email=ADMIN_EMAIL, password=PASSWORD, role="admin", is_staff=True, is_verified=True
+    )
+    loans = max(rows // SEED_TENURE, borrower_loans)
+    fillers = -(-(loans - borrower_loans) // FILLER_LOANS_PER_USER)
+    User.objects.bulk_create(
+        [User(username=f"bench{i}", email=f"bench{i}@example.com", role="user") for i in range(fillers)],
+        batch_size=5000,
+    )
+
+    applications = [
+        {"email": BORROWER_EMAIL, "amount": 10000 + i, "tenure": SEED_TENURE, "interest_rate": 10}
+        for i in range(borrower_loans)
+    ] + [
+        {"email": f"bench{i // FILLER_LOANS_PER_USER}@example.com", "amount": 5000 + i % 50000,
+         "tenure": SEED_TENURE, "interest_rate": 8 + i % 10}
+        for i in range(loans - borrower_loans)
+    ]
+    results = originate_loans(applications)
+    if not all(result["success"] for result in results):
+        raise BenchmarkError("Seeding failed: some loans could not be originated.")
+    return borrower, admin
+
+
+def _client(user):
+    # API client authenticating every request through the JWT path
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+    return client
+
+
+def _percentile(values, share):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(share * len(ordered) + 0.5) - 1))]
+
+
+def _check(name, response, expected):
+    if response.status_code != expected:
+        raise BenchmarkError(f"{name}: expected HTTP {expected}, got {response.status_code}.")
+
+
+def measure(name, call, expected, iterations, warmup):
+    # Run call(i) for warmup + iterations + 1 distinct i; time and count queries of the measured calls,
+    # then trace memory of the last one (tracing would distort the timings)
+    for i in range(warmup):
+        _check(name, call(i), expected)
+
+    timings, queries = [], []
+    for i in range(warmup, warmup + iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = call(i)
+            timings.append((time.perf_counter() - start) * 1000)
+        _check(name, response, expected)
+        queries.append(len(captured))
+
+    tracemalloc.start()
+    try:
+        _check(name, call(warmup + iterations), expected)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(_percentile(timings, 0.50), 3),
+        "p95_ms": round(_percentile(timings, 0.95), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "queries": max(queries),
+        "query_budget": QUERY_BUDGETS.get(name),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def _clear_responses():
+    if getattr(settings, "LOAN_RESPONSE_CACHE", None) is not None:
+        caches[settings.LOAN_RESPONSE_CACHE].clear()
+
+
+def scenarios(borrower, admin, targets):
+    # (name, call(i), expected status) for every benchmarked endpoint; each call works on its own target
+    # (installment, loan) where the endpoint changes state
+    user_client, admin_client, anonymous = _client(borrower), _client(admin), APIClient()
+    loan_ids = list(Loan.objects.filter(user=borrower).order_by("id").values_list("loan_id", flat=True))
+    if len(loan_ids) < 3 * targets:
+        raise BenchmarkError(f"The benchmark borrower needs at least {3 * targets} loans.")
+    quoted, foreclosed = loan_ids[targets:2 * targets], loan_ids[2 * targets:3 * targets]
+    payments = list(PaymentSchedule.objects.filter(
+        loan_id__in=loan_ids[:targets], installment_number=1
+    ).order_by("id").values_list("pk", flat=True))
+
+    list_url = reverse("list_loan")
+    etag = user_client.get(list_url)["ETag"]
+
+    def loan_list(i):
+        _clear_responses()  # Measure the work, not the response cache
+        return user_client.get(list_url)
+
+    def admin_loan_list(i):
+        _clear_responses()
+        return admin_client.get(reverse("admin-loans-api"))
+
+    return [
+        ("loan_list", loan_list, 200),
+        ("loan_list_revalidate", lambda i: user_client.get(list_url, headers={"if-none-match": etag}), 304),
+        ("admin_loan_list", admin_loan_list, 200),
+        ("pay_installment", lambda i: user_client.post(
+            reverse("pay_installment"), {"payment_id": payments[i]}, format="json"), 200),
+        ("foreclosure_details", lambda i: user_client.get(reverse("foreclosure_details", args=[quoted[i]])), 200),
+        ("foreclose_loan", lambda i: user_client.post(reverse("foreclose-loan", args=[foreclosed[i]])), 200),
+        ("jwt_login", lambda i: anonymous.post(
+            reverse("login"), {"email": BORROWER_EMAIL, "password": PASSWORD}, format="json"), 200),
+    ]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows, iterations=50, warmup=3, only=None):
+    # Seed the current (empty) database, run every scenario and return the report dict
+    targets = warmup + iterations + 1
+    for cache in caches.all():
+        cache.clear()
+    borrower, admin = seed(rows, borrower_loans=3 * targets)
+
+    results = {}
+    for name, call, expected in scenarios(borrower, admin, targets):
+        if only and name not in only:
+            continue
+        results[name] = measure(name, call, expected, iterations, warmup)
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "schedule_rows": PaymentSchedule.objects.count(),
+            "loans": Loan.objects.count(),
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        },
+        "results": results,
+    }
+
+
+def over_budget(report):
+    # Scenarios whose query count exceeds their budget
+    return [
+        f"{name}: {result['queries']} queries (budget {result['query_budget']})"
+        for name, result in report["results"].items()
+        if result["query_budget"] is not None and result["queries"] > result["query_budget"]
+    ]
+
+
+def compare(baseline, report, tolerance=0.25):
+    # Regressions of `report` against `baseline`: more queries, or median latency / peak memory worse by
+    # more than `tolerance` (and above the noise floor). p95 is reported but too noisy to gate on.
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+        if (result["p50_ms"] > before["p50_ms"] * (1 + tolerance)
+                and result["p50_ms"] - before["p50_ms"] >= MIN_LATENCY_DELTA_MS):
+            regressions.append(f"{name}: p50 {before['p50_ms']}ms -> {result['p50_ms']}ms")
+        if (result["peak_memory_kb"] > before["peak_memory_kb"] * (1 + tolerance)
+                and result["peak_memory_kb"] - before["peak_memory_kb"] >= MIN_MEMORY_DELTA_KB):
+            regressions.append(f"{name}: peak memory {before['peak_memory_kb']}KB -> {result['peak_memory_kb']}KB")
+    return regressions
+
+
+def load_report(path):
+    with open(path, encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump(report, stream, indent=2, sort_keys=True)
+        stream.write("\n")
+
+
+@contextmanager
+def database_latency(milliseconds):
+    # Make every statement take `milliseconds` longer, like a database across the network
+    if not milliseconds:
+        yield
+        return
+    active = threading.Event()
+    active.set()
+
+    def slow(execute, sql, params, many, context):
+        if active.is_set():  # Worker threads may keep their connections after the benchmark
+            time.sleep(milliseconds / 1000)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow)
+
+    connection_created.connect(install, weak=False)
+    connection.execute_wrappers.append(slow)
+    try:
+        yield
+    finally:
+        active.clear()
+        connection_created.disconnect(install)
+        connection.execute_wrappers.remove(slow)
+
+
+def concurrency_requests(borrower):
+    # (name, method, path, headers, body) of the busiest endpoints
+    token = tokens_for_user(borrower).access_token
+    loan_id = Loan.objects.filter(user=borrower).values_list("loan_id", flat=True).first()
+    auth = {"authorization": f"Bearer {token}"}
+    return [
+        ("loan_list", "get", reverse("list_loan"), auth, None),
+        ("foreclosure_details", "get", reverse("foreclosure_details", args=[loan_id]), auth, None),
+        ("jwt_login", "post", reverse("login"), {}, {"email": BORROWER_EMAIL, "password": PASSWORD}),
+    ]
+
+
+def _summary(latencies, elapsed):
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+    }
+
+
+def drive_asgi(method, path, headers, body, clients, per_client):
+    # `clients` clients sending `per_client` requests each, one after the other, to the ASGI handler on one
+    # event loop (a single uvicorn worker)
+    async def run():
+        client, latencies = AsyncClient(), []
+
+        async def user():
+            for _ in range(per_client):
+                start = time.perf_counter()
+                response = await getattr(client, method)(path, body, content_type="application/json", headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise BenchmarkError(f"ASGI {path}: HTTP {response.status_code}.")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(clients)))
+        return _summary(latencies, time.perf_counter() - start)
+
+    return asyncio.run(run())
+
+
+def drive_wsgi(method, path, headers, body, clients, per_client, threads):
+    # The same load against the WSGI handler with `threads` request threads (a gthread worker); requests
+    # wait for a free thread, and that wait counts in their latency
+    server, local, latencies = threading.Semaphore(threads), threading.local(), []
+
+    def user():
+        local.client = getattr(local, "client", None) or Client()
+        for _ in range(per_client):
+            start = time.perf_counter()
+            with server:
+                response = getattr(local.client, method)(path, body, content_type="application/json", headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise BenchmarkError(f"WSGI {path}: HTTP {response.status_code}.")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for future in [pool.submit(user) for _ in range(clients)]:
+            future.result()
+    return _summary(latencies, time.perf_counter() - start)
+
+
+def run_concurrency(rows, levels=CONCURRENCY_LEVELS, per_client=REQUESTS_PER_CLIENT, wsgi_threads=4,
+                    db_latency_ms=0, only=None):
+    # Seed the current (empty) database and compare the WSGI and ASGI handlers serving the same views at each
+    # concurrency level. The response cache is off so that every request does its work.
+    for cache in caches.all():
+        cache.clear()
+    borrower, _ = seed(rows, borrower_loans=1)
+
+    results = {}
+    with override_settings(LOAN_RESPONSE_CACHE_TTL=0), database_latency(db_latency_ms):
+        for name, method, path, headers, body in concurrency_requests(borrower):
+            if only and name not in only:
+                continue
+            results[name] = {}
+            for clients in levels:
+                wsgi = drive_wsgi(method, path, headers, body, clients, per_client, wsgi_threads)
+                asgi = drive_asgi(method, path, headers, body, clients, per_client)
+                results[name][clients] = {"wsgi": wsgi, "asgi": asgi}
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "database": connection.vendor,
+            "loans": Loan.objects.count(),
+            "requests_per_client": per_client,
+            "wsgi_threads": wsgi_threads,
+            "db_latency_ms": db_latency_ms,
+        },
+        "results": results,
+    }
+
+
+def _fetch_models():
+    return list(Loan.objects.with_schedule_summary().order_by("id"))
+
+
+def _fetch_rows():
+    rows = list(loan_rows(Loan.objects.order_by("id")))
+    return rows, load_schedules(rows)
+
+
+def serialization_paths():
+    # name -> (fetch(), serialize(fetched), renderer) of the admin loan list's serialization, old and new
+    return {
+        "drf": (_fetch_models, lambda loans: LoanSerializer(loans, many=True).data, JSONRenderer()),
+        "projection": (_fetch_rows, lambda fetched: serialize_loans(*fetched), JSONRenderer()),
+        "projection_orjson": (_fetch_rows, lambda fetched: serialize_loans(*fetched), FastJSONRenderer()),
+    }
+
+
+def run_serialization(loans=SERIALIZATION_LOANS, iterations=3):
+    # Seed the current (empty) database with `loans` loans and time fetching, serializing and rendering all
+    # of them (with their schedules) through each path; best of `iterations` per phase. Also checks that
+    # every path renders the same bytes.
+    for cache in caches.all():
+        cache.clear()
+    seed(loans * SEED_TENURE, borrower_loans=1)
+
+    results, outputs = {}, {}
+    for name, (fetch, serialize, renderer) in serialization_paths().items():
+        phases = {"fetch_ms": [], "serialize_ms": [], "render_ms": []}
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fetched = fetch()
+            fetched_at = time.perf_counter()
+            data = serialize(fetched)
+            serialized_at = time.perf_counter()
+            outputs[name] = renderer.render(data)
+            rendered_at = time.perf_counter()
+            phases["fetch_ms"].append((fetched_at - start) * 1000)
+            phases["serialize_ms"].append((serialized_at - fetched_at) * 1000)
+            phases["render_ms"].append((rendered_at - serialized_at) * 1000)
+        result = {phase: round(min(timings), 3) for phase, timings in phases.items()}
+        result["total_ms"] = round(sum(result.values()), 3)
+        result["bytes"] = len(outputs[name])
+        results[name] = result
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "database": connection.vendor,
+            "loans": Loan.objects.count(),
+            "schedule_rows": PaymentSchedule.objects.count(),
+            "iterations": iterations,
+        },
+        "identical": len(set(outputs.values())) == 1,
+        "results": results,
+        "formats": payload_formats({"success": True, "loans": data, "next_cursor": None}, iterations),
+    }
+
+
+def payload_formats(data, iterations=3):
+    # Size of the admin loan list body per response format and content coding, and the time a client takes
+    # to decode it (best of `iterations`; with orjson when installed, as a fast client would)
+    loads = orjson.loads if orjson is not None else json.loads
+    formats = {
+        "json": (FastJSONRenderer().render(data), loads),
+        "columnar": (ColumnarJSONRenderer().render(data), loads),
+        "msgpack": (MessagePackRenderer().render(data), msgpack.unpackb),
+    }
+
+    report = {}
+    for name, (body, decode) in formats.items():  # Columnar clients use the columns as they are decoded
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            decode(body)
+            timings.append((time.perf_counter() - start) * 1000)
+        report[name] = {"bytes": len(body), "parse_ms": round(min(timings), 3)}
+        for encoding in supported_encodings():
+            report[name][f"{encoding}_bytes"] = len(compress(body, encoding))
+    return report
@@ -0,0 +1,62 @@
+# File: checks.py
+# Description: System checks making sure state that worker processes share lives in a cache they all see.
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# Cache backends whose entries no other worker process sees (DummyCache keeps nothing at all)
+LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def is_shared_cache(alias):
+    # Whether what one worker process writes to the cache alias is read by all the others
+    return settings.CACHES[alias]["BACKEND"] not in LOCAL_BACKENDS
+
+
+def worker_processes():
+    # Worker processes serving the app per host (WEB_CONCURRENCY, which gunicorn and uvicorn read as well)
+    return getattr(settings, "WEB_CONCURRENCY", 1)
+
+
+@register(Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    # Cached loan lists are invalidated by the worker handling the write only, unless the cache is shared
+    alias = getattr(settings, "LOAN_RESPONSE_CACHE", None)
+    if alias is None or is_shared_cache(alias) or worker_processes() <= 1:
+        return []
+    return [Error(
+        f"The loan list response cache ({alias!r}) is kept per process, but WEB_CONCURRENCY is {worker_processes()}.",
+        hint='Workers would serve lists from before writes handled by other workers. Set RESPONSE_CACHE_BACKEND '
+             'to "file" or "db", or to "off".',
+        id="loan_app.E001",
+    )]
+
+
+@register(Tags.caches)
+def check_sticky_cache(app_configs, **kwargs):
+    # Read-your-writes only holds if every worker sees who wrote recently, whichever worker handled the write
+    alias = getattr(settings, "DATABASE_STICKY_CACHE", "default")
+    if not getattr(settings, "DATABASE_REPLICAS", []) or is_shared_cache(alias):
+        return []
+    return [Error(
+        f"Read replicas are configured but DATABASE_STICKY_CACHE ({alias!r}) is kept per process.",
+        hint='Users would read replicas without their own writes on workers other than the one that handled them. '
+             'Set RESPONSE_CACHE_BACKEND to "file" or "db", or point DATABASE_STICKY_CACHE at another shared cache.',
+        id="loan_app.E002",
+    )]
+
+
+@register(Tags.caches)
+def check_revocation_cache(app_configs, **kwargs):
+    # Token claims and cached users are only trusted when every worker sees the user change log
+    alias = getattr(settings, "AUTH_REVOCATION_CACHE", "default")
+    if is_shared_cache(alias) or worker_processes() <= 1:
+        return []
+    return [Warning(
+        f"AUTH_REVOCATION_CACHE ({alias!r}) is kept per process, so every request loads the user row.",
+        hint='Set AUTH_CACHE_BACKEND to "file" (one host) or "db" (several hosts).',
+        id="loan_app.W001",
+    )]
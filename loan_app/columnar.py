@@ -0,0 +1,74 @@
+# File: columnar.py
+# Description: Column-oriented layout of record lists (one array per field) for bulk API consumers, and its inverse.
+
+# A list of records becomes a block {"count": n, "columns": {field: column}}, where each column is
+# - a list of n values for scalar fields,
+# - {"columns": {...}} with one list of n values per key for object fields (e.g. the loan's user),
+# - a block with "offsets" for list-of-record fields (e.g. payment_schedule): the records of row i are
+#   rows offsets[i] to offsets[i + 1] - 1 of the nested block, which holds every row's records in order.
+# Field names are taken from the first record; all records must have the same fields.
+
+
+def _kind(records, name):
+    # "records", "object" or "scalar", judged by the first non-null, non-empty value of the field
+    empty_lists = False
+    for record in records:
+        value = record[name]
+        if isinstance(value, dict):
+            return "object"
+        if isinstance(value, list):
+            if value:
+                return "records" if isinstance(value[0], dict) else "scalar"
+            empty_lists = True
+        elif value is not None:
+            return "scalar"
+    return "records" if empty_lists else "scalar"
+
+
+def to_columns(records):
+    # Block of the records (dicts with the same keys, in the same order)
+    if not records:
+        return {"count": 0, "columns": {}}
+    columns = {}
+    for name in records[0]:
+        kind = _kind(records, name)
+        if kind == "scalar":
+            columns[name] = [record[name] for record in records]
+        elif kind == "object":
+            values = [record[name] or {} for record in records]
+            keys = next((value for value in values if value), {})  # Every value may be an empty object
+            columns[name] = {"columns": {key: [value.get(key) for value in values] for key in keys}}
+        else:
+            offsets, children = [0], []
+            for record in records:
+                children.extend(record[name] or ())
+                offsets.append(len(children))
+            columns[name] = {"offsets": offsets, **to_columns(children)}
+    return {"count": len(records), "columns": columns}
+
+
+def from_columns(block):
+    # Records of a block (the inverse of to_columns)
+    count = block["count"]
+    fields = []
+    for name, column in block["columns"].items():
+        if isinstance(column, list):
+            fields.append((name, column))
+        elif "offsets" in column:
+            children, offsets = from_columns(column), column["offsets"]
+            fields.append((name, [children[offsets[i]:offsets[i + 1]] for i in range(count)]))
+        else:
+            keys = list(column["columns"])
+            values = list(zip(*column["columns"].values())) if keys else [()] * count
+            fields.append((name, [dict(zip(keys, row)) for row in values]))
+    return [{name: values[i] for name, values in fields} for i in range(count)]
+
+
+def columnar_response(data):
+    # Response data with every top-level list of records (e.g. "loans") in the columnar layout
+    if not isinstance(data, dict):
+        return data
+    return {
+        key: to_columns(value) if isinstance(value, list) and all(isinstance(item, dict) for item in value) else value
+        for key, value in data.items()
+    }
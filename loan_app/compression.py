@@ -0,0 +1,215 @@
+# File: compression.py
+# Description: gzip / brotli compression of API responses above a size threshold, negotiated from Accept-Encoding.
+
+import threading
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+# Bodies smaller than this many bytes are sent as they are when COMPRESSION_MIN_SIZE is not configured
+DEFAULT_MIN_SIZE = 1024
+
+# Path prefixes whose responses are compressed when COMPRESSION_PATHS is not configured
+DEFAULT_PATHS = ("/api/",)
+
+# Compression effort when not configured: fast settings suited to dynamic responses
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4
+
+# Bodies compressed in a worker thread rather than on the event loop (async stacks), in bytes
+OFFLOAD_SIZE = 64 * 1024
+
+# Bytes of compressed bodies kept per process (keyed on ETag) when COMPRESSION_CACHE_BYTES is not configured
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def supported_encodings():
+    # Content codings in order of preference
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding):
+    # The supported coding the client accepts with the highest q-value (ties go to our preference), or None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            weights[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _gzip_level():
+    return getattr(settings, "COMPRESSION_GZIP_LEVEL", DEFAULT_GZIP_LEVEL)
+
+
+def _brotli_quality():
+    return getattr(settings, "COMPRESSION_BROTLI_QUALITY", DEFAULT_BROTLI_QUALITY)
+
+
+def compress(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=_brotli_quality())
+    compressor = zlib.compressobj(_gzip_level(), zlib.DEFLATED, 31)  # 31: gzip container, no file name or mtime
+    return compressor.compress(content) + compressor.flush()
+
+
+class _StreamCompressor:
+    # Incremental compressor: output is emitted as the compressor fills its blocks, not per (small) chunk
+    def __init__(self, encoding):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=_brotli_quality())
+            self.process, self.finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(_gzip_level(), zlib.DEFLATED, 31)
+            self.process, self.finish = compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    for chunk in chunks:
+        data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    async for chunk in chunks:
+        data = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressedBodies:
+    # Compressed bodies of responses with a strong ETag (cached loan lists), so that every client polling
+    # the same list does not pay for compressing it again. Bounded by total size, least recently used out.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (etag, encoding) -> compressed body
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        limit = getattr(settings, "COMPRESSION_CACHE_BYTES", DEFAULT_CACHE_BYTES)
+        if len(body) > limit // 4:
+            return  # One body may not push out everything else
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > limit:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# Compressed bodies of this process
+compressed_bodies = CompressedBodies()
+
+
+def _eligible(request, response):
+    paths = getattr(settings, "COMPRESSION_PATHS", DEFAULT_PATHS)
+    return (
+        request.path.startswith(tuple(paths))
+        and not response.has_header("Content-Encoding")
+        and response.status_code not in (204, 206, 304)
+        and "no-transform" not in response.get("Cache-Control", "")
+    )
+
+
+def compress_response(request, response):
+    # Compress the response in place when the client accepts a supported coding and it is worth it
+    if not _eligible(request, response):
+        return response
+    if not response.streaming and len(response.content) < getattr(settings, "COMPRESSION_MIN_SIZE", DEFAULT_MIN_SIZE):
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if encoding is None:
+        return response
+
+    etag = response.get("ETag")
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = acompress_stream(response.streaming_content, encoding)
+        else:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+        del response["Content-Length"]
+    else:
+        key = (etag, encoding) if etag and etag.startswith('"') else None
+        body = compressed_bodies.get(key) if key else None
+        if body is None:
+            body = compress(response.content, encoding)
+            if len(body) >= len(response.content):
+                return response
+            if key:
+                compressed_bodies.set(key, body)
+        response.content = body
+        response["Content-Length"] = str(len(body))
+
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag  # The representation changed; caches must not mix the encodings
+    response["Content-Encoding"] = encoding
+    return response
+
+
+class CompressionMiddleware:
+    # Compresses responses of COMPRESSION_PATHS (the API) of at least COMPRESSION_MIN_SIZE bytes with brotli
+    # (when installed) or gzip, whichever Accept-Encoding prefers. Streaming exports are compressed as they
+    # are sent. Works in sync and async stacks.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if not response.streaming and len(response.content) >= OFFLOAD_SIZE:
+            return await sync_to_async(compress_response, thread_sensitive=False)(request, response)
+        return compress_response(request, response)
@@ -0,0 +1,121 @@
+# File: counters.py
+# Description: Stored repayment counters on Loan (paid installments, amount paid and remaining) and their reconciliation.
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Round
+
+from .models import Loan, PaymentSchedule
+from .response_cache import loans_changed
+from .virtual_schedule import paid_count
+
+# Loan ids checked per reconciliation query
+DEFAULT_CHUNK_SIZE = 20000
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal("0.00")
+
+
+def counter_values(paid_installments, late_fees=F("late_fees_paid")):
+    # Column expressions for all three counters given an expression for the number of paid installments
+    # (and for the late fees collected, the stored ones by default). Installments are paid at the EMI plus
+    # their late fee; a foreclosed loan has paid its total less the foreclosure discount, plus late fees.
+    # A closed loan (foreclosed, or with every installment paid) owes nothing more.
+    foreclosed = Q(foreclosure_date__isnull=False)
+    settled = foreclosed | Q(tenure__lte=paid_installments)
+    return {
+        "paid_installments": paid_installments,
+        "amount_paid": Case(
+            When(foreclosed, then=F("total_payable") - Coalesce(F("foreclosure_discount"), Value(ZERO)) + late_fees),
+            default=Round(paid_installments * F("monthly_installment"), 2) + late_fees,
+            output_field=MONEY,
+        ),
+        "amount_remaining": Case(
+            When(settled, then=Value(ZERO)),
+            default=Round(F("total_payable") - paid_installments * F("monthly_installment"), 2),
+            output_field=MONEY,
+        ),
+    }
+
+
+def expected_counters(loan, paid_installments):
+    # The same values computed in Python, for a loan object
+    if loan.foreclosure_date is not None:
+        return {
+            "paid_installments": paid_installments,
+            "amount_paid": loan.total_payable - (loan.foreclosure_discount or ZERO) + loan.late_fees_paid,
+            "amount_remaining": ZERO,
+        }
+    amount_paid = round(paid_installments * loan.monthly_installment, 2)
+    return {
+        "paid_installments": paid_installments,
+        "amount_paid": amount_paid + loan.late_fees_paid,
+        "amount_remaining": ZERO if paid_installments >= loan.tenure else round(loan.total_payable - amount_paid, 2),
+    }
+
+
+def _paid_rows():
+    # Correlated count of a loan's PAID schedule rows
+    counts = PaymentSchedule.objects.filter(loan_id=OuterRef("loan_id"), status="PAID").order_by().values(
+        "loan_id"
+    ).annotate(paid=Count("id")).values("paid")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def _reconcile_materialized(loans, fix):
+    # Find (and optionally repair) drifted materialized loans with one SELECT and one UPDATE
+    expected = counter_values(F("expected_paid"))
+    drifted = loans.filter(schedule_mode="MATERIALIZED").annotate(
+        expected_paid=_paid_rows(),
+        expected_amount_paid=expected["amount_paid"],
+        expected_amount_remaining=expected["amount_remaining"],
+    ).filter(
+        ~Q(paid_installments=F("expected_paid"))
+        | ~Q(amount_paid=F("expected_amount_paid"))
+        | ~Q(amount_remaining=F("expected_amount_remaining"))
+    )
+    loan_ids = list(drifted.values_list("loan_id", flat=True))
+    if fix and loan_ids:
+        Loan.objects.filter(loan_id__in=loan_ids).update(**counter_values(_paid_rows()))
+    return loan_ids
+
+
+def _reconcile_virtual(loans, fix):
+    # Virtual loans keep paid installments in a bitmap, which is counted in Python
+    drifted = []
+    fields = ("paid_installments", "amount_paid", "amount_remaining")
+    for loan in loans.filter(schedule_mode="VIRTUAL").only(
+        "loan_id", "paid_mask", "tenure", "monthly_installment", "total_payable", "foreclosure_date",
+        "foreclosure_discount", "late_fees_paid", *fields
+    ):
+        values = expected_counters(loan, paid_count(loan.paid_mask))
+        if any(getattr(loan, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(loan, field, value)
+            drifted.append(loan)
+    if fix and drifted:
+        Loan.objects.bulk_update(drifted, fields)
+    return [loan.loan_id for loan in drifted]
+
+
+def reconcile_counters(chunk_size=DEFAULT_CHUNK_SIZE, fix=True):
+    # Compare every loan's stored counters with its schedule, chunk by chunk of loan ids, repairing drift
+    # when `fix` is set. Returns the loan ids that had drifted.
+    bounds = Loan.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return []
+
+    drifted = []
+    for start in range(bounds["low"], bounds["high"] + 1, chunk_size):
+        with transaction.atomic():
+            loans = Loan.objects.filter(id__gte=start, id__lt=start + chunk_size)
+            if fix:
+                # Hold the rows so a concurrent payment cannot interleave with the repair
+                list(loans.select_for_update().values_list("id", flat=True))
+            drifted += _reconcile_materialized(loans, fix)
+            drifted += _reconcile_virtual(loans, fix)
+    if fix and drifted:
+        loans_changed()
+    return drifted
@@ -0,0 +1,171 @@
+# File: db_routing.py
+# Description: Routes reads of read-only views to replicas, keeping a user on the primary for a while after a write.
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject, empty
+
+# Seconds a user's reads stay on the primary after they wrote, when DATABASE_REPLICA_STICKY_SECONDS is not set
+DEFAULT_STICKY_SECONDS = 10
+
+# Apps always read from the primary and whose writes do not make a user sticky (database cache entries)
+PRIMARY_ONLY = {"django_cache"}
+
+# Routing state of the request being handled in this context (None outside requests)
+_state = ContextVar("db_routing", default=None)
+
+
+class RoutingState:
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self):
+        self.replica = None  # Alias the current read-only view reads from
+        self.wrote = False
+
+
+def replicas():
+    # Aliases of the configured read replicas
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def _sticky_cache():
+    return caches[getattr(settings, "DATABASE_STICKY_CACHE", "default")]
+
+
+def _sticky_key(user_id):
+    return f"db-primary:{user_id}"
+
+
+def sticks_to_primary(user):
+    # Whether the user wrote recently enough that replicas may not have their changes yet
+    return user is not None and user.is_authenticated and bool(_sticky_cache().get(_sticky_key(user.pk)))
+
+
+def sticky_seconds():
+    # How long replicas may lag behind the primary, as far as routing is concerned
+    return getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", DEFAULT_STICKY_SECONDS)
+
+
+def stick_to_primary(user):
+    _sticky_cache().set(_sticky_key(user.pk), True, sticky_seconds())
+
+
+async def astick_to_primary(user):
+    await _sticky_cache().aset(_sticky_key(user.pk), True, sticky_seconds())
+
+
+class ReplicaRouter:
+    # Reads go to a replica only inside views marked @replica_reads; everything else, and every write,
+    # uses the primary ("default")
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if model._meta.app_label not in PRIMARY_ONLY:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY:
+            state.wrote = True
+            state.replica = None  # Read back what was just written from the primary
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replicas() else None  # Replicas get their schema from replication
+
+
+@contextmanager
+def primary_reads(active=True):
+    # Reads inside the block go to the primary, even within a view marked @replica_reads
+    state = _state.get()
+    replica = state.replica if state is not None and active else None
+    if replica is not None:
+        state.replica = None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            state.replica = replica
+
+
+def _request_of(args):
+    return next((arg for arg in args if isinstance(arg, HttpRequest) or hasattr(arg, "_request")), None)
+
+
+def replica_reads(view):
+    # Let a read-only view (function or APIView method) read from a replica, one per request, unless its
+    # user wrote within DATABASE_REPLICA_STICKY_SECONDS
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        state = _state.get()
+        aliases = replicas()
+        if state is None or not aliases or sticks_to_primary(getattr(_request_of(args), "user", None)):
+            return view(*args, **kwargs)
+        state.replica = random.choice(aliases)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            state.replica = None
+    return wrapper
+
+
+def _wrote(request, state):
+    return state.wrote or request.method not in ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRoutingMiddleware:
+    # Tracks writes made while handling a request; after one (or any unsafe method) the user's reads stick
+    # to the primary for DATABASE_REPLICA_STICKY_SECONDS
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not replicas():
+            return self.get_response(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        user = getattr(request, "user", None)  # Set by DRF authentication too
+        if _wrote(request, state) and user is not None and user.is_authenticated:
+            stick_to_primary(user)
+        return response
+
+    async def __acall__(self, request):
+        if not replicas():
+            return await self.get_response(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if _wrote(request, state):
+            user = getattr(request, "user", None)
+            if type(user) is SimpleLazyObject and user._wrapped is empty:
+                user = await request.auser()  # Session user; loading it lazily would block the event loop
+            if user is not None and user.is_authenticated:
+                await astick_to_primary(user)
+        return response
@@ -0,0 +1,125 @@
+# File: email_outbox.py
+# Description: Persistent email outbox; requests enqueue messages and a background dispatcher delivers them.
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import EmailOutbox
+
+# Defaults used when the EMAIL_OUTBOX_* settings are not configured
+DEFAULT_BATCH_SIZE = 100  # Messages claimed per dispatch round
+DEFAULT_WORKERS = 4  # Sender threads, each holding one mail server connection
+DEFAULT_MAX_ATTEMPTS = 5  # Attempts before a message is marked FAILED
+DEFAULT_RETRY_DELAY = 30  # Seconds before the first retry; doubles with every failed attempt
+MAX_RETRY_DELAY = 3600
+CLAIM_LEASE = timedelta(minutes=5)  # Claimed messages of a crashed dispatcher become due again after this
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_email(subject, message, recipients, from_email=None):
+    # Store a message for the dispatcher and return the outbox row (no network I/O)
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def retry_delay(attempts):
+    # Exponential backoff after the given number of failed attempts
+    base = _setting("EMAIL_OUTBOX_RETRY_DELAY", DEFAULT_RETRY_DELAY)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    # Mark up to batch_size due messages as SENDING and return them. On databases supporting
+    # SKIP LOCKED, concurrent dispatchers claim disjoint batches without waiting on each other.
+    current = now()
+    using = router.db_for_write(EmailOutbox)
+    with transaction.atomic(using=using):
+        due = EmailOutbox.objects.using(using).filter(
+            status__in=("PENDING", "SENDING"), next_attempt_at__lte=current
+        ).order_by("next_attempt_at", "id")
+        if connections[using].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list("id", flat=True)[:batch_size])
+        EmailOutbox.objects.using(using).filter(id__in=ids).update(
+            status="SENDING", attempts=F("attempts") + 1, next_attempt_at=current + CLAIM_LEASE
+        )
+    return list(EmailOutbox.objects.using(using).filter(id__in=ids).order_by("id"))
+
+
+def _send_share(messages):
+    # Deliver messages over a single mail server connection; return (message id, error or None) pairs.
+    # Runs in a worker thread and never touches the database.
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        return [(message.id, e) for message in messages]
+
+    results = []
+    try:
+        for message in messages:
+            email = EmailMessage(message.subject, message.body, message.from_email, message.recipients, connection=connection)
+            try:
+                connection.send_messages([email])
+                results.append((message.id, None))
+            except Exception as e:
+                results.append((message.id, e))
+                # The connection may be unusable after an error; start a fresh one for the rest
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+    finally:
+        connection.close()
+    return results
+
+
+def dispatch_batch(batch_size=None, workers=None):
+    # Claim one batch, deliver it from a pool of threads and record the outcome.
+    # Returns counts of sent, retried and failed messages.
+    batch_size = batch_size or _setting("EMAIL_OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    workers = workers or _setting("EMAIL_OUTBOX_WORKERS", DEFAULT_WORKERS)
+    max_attempts = _setting("EMAIL_OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+
+    messages = claim_batch(batch_size)
+    counts = {"claimed": len(messages), "sent": 0, "retried": 0, "failed": 0}
+    if not messages:
+        return counts
+
+    # Spread messages round-robin over the threads
+    shares = [messages[index::workers] for index in range(min(workers, len(messages)))]
+    with ThreadPoolExecutor(max_workers=len(shares)) as executor:
+        results = [result for share_results in executor.map(_send_share, shares) for result in share_results]
+
+    # Record outcomes from the calling thread
+    attempts = {message.id: message.attempts for message in messages}
+    sent_ids = [message_id for message_id, error in results if error is None]
+    EmailOutbox.objects.filter(id__in=sent_ids).update(status="SENT", sent_at=now(), last_error="")
+    counts["sent"] = len(sent_ids)
+
+    for message_id, error in results:
+        if error is None:
+            continue
+        if attempts[message_id] >= max_attempts:
+            EmailOutbox.objects.filter(id=message_id).update(status="FAILED", last_error=str(error))
+            counts["failed"] += 1
+        else:
+            EmailOutbox.objects.filter(id=message_id).update(
+                status="PENDING", next_attempt_at=now() + retry_delay(attempts[message_id]), last_error=str(error)
+            )
+            counts["retried"] += 1
+    return counts
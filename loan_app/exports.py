@@ -0,0 +1,144 @@
+# File: exports.py
+# Description: Streams loans joined with their payment schedules as CSV or NDJSON with flat memory use.
+
+import csv
+import json
+
+from .models import Loan, PaymentSchedule
+
+# Loans read per server-side cursor fetch (and per schedule query)
+DEFAULT_CHUNK_SIZE = 2000
+
+# Supported output formats and their content types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Loan columns: (output name, ORM lookup)
+LOAN_COLUMNS = [
+    ("loan_id", "loan_id"),
+    ("email", "user__email"),
+    ("amount", "amount"),
+    ("tenure", "tenure"),
+    ("interest_rate", "interest_rate"),
+    ("monthly_installment", "monthly_installment"),
+    ("total_interest", "total_interest"),
+    ("total_payable", "total_payable"),
+    ("status", "status"),
+    ("next_due_date", "next_due_date"),
+    ("created_at", "created_at"),
+]
+
+# Schedule columns (CSV headers prefix the payment status to keep it apart from the loan status)
+SCHEDULE_COLUMNS = [
+    "installment_number", "due_date", "principal_component",
+    "interest_component", "remaining_balance", "status",
+]
+
+
+def _text(value):
+    # Render a value the way the JSON API does (Decimals as strings, dates in ISO format)
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+# Extra loan fields read to derive virtual schedules (not exported)
+VIRTUAL_SCHEDULE_FIELDS = ["schedule_mode", "schedule_start", "paid_mask"]
+
+
+def iter_loans_with_schedules(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yield (loan_values, schedule_rows) pairs, reading loans through a server-side cursor and
+    # streaming the schedules of each chunk of loans from a single query
+    loan_rows = queryset.order_by("id").values_list(
+        *[lookup for _, lookup in LOAN_COLUMNS], *VIRTUAL_SCHEDULE_FIELDS
+    ).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for loan_row in loan_rows:
+        chunk.append(loan_row)
+        if len(chunk) >= chunk_size:
+            yield from _with_schedules(chunk, chunk_size)
+            chunk = []
+    if chunk:
+        yield from _with_schedules(chunk, chunk_size)
+
+
+def _virtual_rows(loan_row):
+    # Derive schedule rows (in SCHEDULE_COLUMNS order) for a loan stored with a virtual schedule
+    values = dict(zip([name for name, _ in LOAN_COLUMNS] + VIRTUAL_SCHEDULE_FIELDS, loan_row))
+    loan = Loan(**{name: values[name] for name in (
+        "loan_id", "amount", "tenure", "interest_rate", "monthly_installment", "schedule_mode", "schedule_start", "paid_mask"
+    )})
+    return [
+        (row.installment_number, row.due_date, row.principal_component, row.interest_component,
+         row.remaining_balance, row.status)
+        for row in loan.installments()
+    ]
+
+
+def _with_schedules(loan_rows, chunk_size):
+    # Attach ordered schedule rows to a chunk of loans (in id order). Installments are streamed through a
+    # server-side cursor in the same order, so only one loan's schedule is held in memory at a time.
+    mode_index = len(LOAN_COLUMNS)
+    stored = [loan_row[0] for loan_row in loan_rows if loan_row[mode_index] != "VIRTUAL"]
+    installments = PaymentSchedule.objects.filter(loan_id__in=stored).order_by(
+        "loan__id", "installment_number"
+    ).values_list("loan_id", *SCHEDULE_COLUMNS).iterator(chunk_size=chunk_size)
+    pending = next(installments, None) if stored else None
+    for loan_row in loan_rows:
+        if loan_row[mode_index] == "VIRTUAL":
+            yield loan_row[:mode_index], _virtual_rows(loan_row)
+            continue
+        schedule = []
+        while pending is not None and pending[0] == loan_row[0]:
+            schedule.append(pending[1:])
+            pending = next(installments, None)
+        yield loan_row[:mode_index], schedule
+
+
+class _Echo:
+    # File-like object whose write() returns the line instead of storing it
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yield CSV lines: one row per installment, loan columns repeated on each row
+    writer = csv.writer(_Echo())
+    yield writer.writerow(
+        [name for name, _ in LOAN_COLUMNS] + [f"payment_{name}" if name == "status" else name for name in SCHEDULE_COLUMNS]
+    )
+    empty = [""] * len(SCHEDULE_COLUMNS)
+    for loan_row, schedule in iter_loans_with_schedules(queryset, chunk_size):
+        loan_values = [_text(value) for value in loan_row]
+        if not schedule:
+            yield writer.writerow(loan_values + empty)
+        for row in schedule:
+            yield writer.writerow(loan_values + [_text(value) for value in row])
+
+
+def stream_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yield one JSON object per loan, with its schedule nested under "payment_schedule"
+    for loan_row, schedule in iter_loans_with_schedules(queryset, chunk_size):
+        loan = {name: _text(value) for (name, _), value in zip(LOAN_COLUMNS, loan_row)}
+        loan["payment_schedule"] = [
+            {name: _text(value) for name, value in zip(SCHEDULE_COLUMNS, row)} for row in schedule
+        ]
+        yield json.dumps(loan) + "\n"
+
+
+def stream_export(export_format, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Return a generator of text chunks for the requested format
+    queryset = Loan.objects.all() if queryset is None else queryset
+    if export_format == "csv":
+        return stream_csv(queryset, chunk_size)
+    if export_format == "ndjson":
+        return stream_ndjson(queryset, chunk_size)
+    raise ValueError(f"Unsupported export format: {export_format!r}")
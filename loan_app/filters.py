@@ -0,0 +1,70 @@
+# File: filters.py
+# Description: Query-string filters shared by the loan list and export endpoints.
+
+from datetime import datetime, time, timedelta
+
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import get_current_timezone, is_naive, make_aware
+
+# Loan statuses accepted by the status filter
+LOAN_STATUSES = {"ACTIVE", "CLOSED"}
+
+
+def _parse_bound(value, upper=False):
+    # Parse a date or datetime bound, returning (aware datetime, exclusive).
+    # A bare date used as an upper bound covers that whole day.
+    parsed = parse_datetime(value)
+    exclusive = False
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        if upper:
+            day += timedelta(days=1)
+            exclusive = True
+        parsed = datetime.combine(day, time.min)
+    if is_naive(parsed):
+        parsed = make_aware(parsed, get_current_timezone())
+    return parsed, exclusive
+
+
+def _parse_day(value):
+    # Parse a YYYY-MM-DD date
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"Invalid date: {value!r}")
+    return day
+
+
+def filter_loans(queryset, params):
+    # Apply status, created_at range, next_due_date range and borrower email filters from
+    # request/command parameters. Raises ValueError with a readable message for invalid values.
+    loan_status = params.get("status")
+    if loan_status:
+        loan_status = loan_status.upper()
+        if loan_status not in LOAN_STATUSES:
+            raise ValueError(f"Invalid status: {loan_status!r}")
+        queryset = queryset.filter(status=loan_status)
+
+    created_from = params.get("created_from")
+    if created_from:
+        queryset = queryset.filter(created_at__gte=_parse_bound(created_from)[0])
+
+    created_to = params.get("created_to")
+    if created_to:
+        bound, exclusive = _parse_bound(created_to, upper=True)
+        queryset = queryset.filter(created_at__lt=bound) if exclusive else queryset.filter(created_at__lte=bound)
+
+    due_from = params.get("due_from")
+    if due_from:
+        queryset = queryset.filter(next_due_date__gte=_parse_day(due_from))
+
+    due_to = params.get("due_to")
+    if due_to:
+        queryset = queryset.filter(next_due_date__lte=_parse_day(due_to))
+
+    email = params.get("email")
+    if email:
+        queryset = queryset.filter(user__email=email)
+
+    return queryset
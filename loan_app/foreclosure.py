@@ -0,0 +1,78 @@
+# File: foreclosure.py
+# Description: Foreclosure quotes computed with one aggregate query and cached per loan version.
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from .models import PaymentSchedule
+from .virtual_schedule import virtual_schedule
+
+# Share of the remaining interest waived when a loan is foreclosed
+FORECLOSURE_DISCOUNT_RATE = Decimal("0.05")
+
+ZERO = Decimal("0.00")
+
+# Seconds a cached quote is kept (quotes are also keyed by date, so they never outlive their day's key)
+QUOTE_TIMEOUT = 24 * 60 * 60
+
+
+def _quote_cache():
+    return caches[getattr(settings, "FORECLOSURE_QUOTE_CACHE", "default")]
+
+
+def quote_cache_key(loan, on_date):
+    # Quotes change with every payment or status change (loan.version) and with the date
+    return f"foreclosure-quote:{loan.loan_id}:{loan.version}:{on_date.isoformat()}"
+
+
+def compute_quote(loan, on_date):
+    # Foreclosure quote for settling the loan on the given date. Only PAID installments count as paid;
+    # everything else is owed, overdue installments in full together with their late fees, and 5% of the
+    # remaining interest (less that of installments paid or already due) is waived. Virtual schedules are
+    # summed in memory.
+    if loan.is_virtual:
+        totals = {"paid": ZERO, "settled_interest": ZERO, "late_fees": ZERO}
+        for installment in virtual_schedule(loan, on_date):
+            if installment.status == "PAID":
+                totals["paid"] += installment.principal_component + installment.interest_component
+            totals["late_fees"] += installment.late_fee
+            if installment.status == "PAID" or installment.due_date <= on_date:
+                totals["settled_interest"] += installment.interest_component
+    else:
+        money = DecimalField(max_digits=12, decimal_places=2)
+        zero = Value(ZERO, output_field=money)
+        paid = Q(status="PAID")
+        totals = PaymentSchedule.objects.filter(loan_id=loan.loan_id).aggregate(
+            paid=Coalesce(Sum(F("principal_component") + F("interest_component"), filter=paid, output_field=money), zero),
+            settled_interest=Coalesce(
+                Sum("interest_component", filter=paid | Q(due_date__lte=on_date), output_field=money), zero
+            ),
+            late_fees=Coalesce(Sum("late_fee", filter=~paid, output_field=money), zero),
+        )
+
+    remaining_balance = loan.total_payable - totals["paid"]
+    remaining_interest = loan.total_interest - totals["settled_interest"]
+    foreclosure_discount = remaining_interest * FORECLOSURE_DISCOUNT_RATE
+    return {
+        "total_paid": round(totals["paid"], 2),
+        "remaining_balance": round(remaining_balance, 2),
+        "late_fees": round(totals["late_fees"], 2),
+        "foreclosure_discount": round(foreclosure_discount, 2),
+        "final_settlement_amount": round(remaining_balance - foreclosure_discount + totals["late_fees"], 2),
+    }
+
+
+def foreclosure_quote(loan, on_date=None):
+    # Return the (possibly cached) quote for the loan's current version
+    on_date = on_date or now().date()
+    key = quote_cache_key(loan, on_date)
+    quote = _quote_cache().get(key)
+    if quote is None:
+        quote = compute_quote(loan, on_date)
+        _quote_cache().set(key, quote, QUOTE_TIMEOUT)
+    return quote
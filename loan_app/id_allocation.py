@@ -0,0 +1,96 @@
+# File: id_allocation.py
+# Description: Block-reserving allocator that hands out loan numbers from memory without a lookup per insert.
+
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+
+# PostgreSQL sequence backing loan numbers (created by migration 0003)
+LOAN_NUMBER_SEQUENCE = "loan_app_loan_number_seq"
+
+# Loan numbers reserved per round trip when settings.LOAN_ID_BLOCK_SIZE is not set
+DEFAULT_BLOCK_SIZE = 100
+
+
+def highest_loan_number(loan_ids):
+    # Return the largest numeric suffix among LOANnnn identifiers (0 if there are none)
+    numbers = [int(loan_id[4:]) for loan_id in loan_ids if loan_id.startswith("LOAN") and loan_id[4:].isdigit()]
+    return max(numbers, default=0)
+
+
+class BlockAllocator:
+    # Reserves ranges of numbers from the database and hands them out from memory.
+    # On PostgreSQL blocks come from a sequence, which never blocks other workers and is unaffected by
+    # rollbacks. Elsewhere (e.g. SQLite) a row in IdSequence is bumped with a single UPDATE.
+
+    def __init__(self, name, sequence):
+        self.name = name
+        self.sequence = sequence
+        self._lock = threading.Lock()
+        self._numbers = deque()
+        self._pid = os.getpid()
+
+    @property
+    def block_size(self):
+        return getattr(settings, "LOAN_ID_BLOCK_SIZE", DEFAULT_BLOCK_SIZE)
+
+    def allocate(self, count=1):
+        # Return `count` unused numbers, reserving a new block when the local one runs out
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: numbers reserved by the parent may be handed out by siblings too
+                self._numbers.clear()
+                self._pid = os.getpid()
+
+            missing = count - len(self._numbers)
+            if missing > 0:
+                self._numbers.extend(self._reserve(missing))
+            return [self._numbers.popleft() for _ in range(count)]
+
+    def reset(self):
+        # Drop any locally reserved numbers (they are simply never used)
+        with self._lock:
+            self._numbers.clear()
+
+    def _reserve(self, needed):
+        from .models import Loan
+
+        using = router.db_for_write(Loan)
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            return self._reserve_from_sequence(connection, max(needed, self.block_size))
+
+        # A counter bumped inside someone else's transaction is rolled back with it, so only keep
+        # spare numbers when the reservation commits on its own.
+        size = needed if connection.in_atomic_block else max(needed, self.block_size)
+        return self._reserve_from_table(using, size)
+
+    def _reserve_from_sequence(self, connection, size):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [self.sequence, size])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _reserve_from_table(self, using, size):
+        from .models import IdSequence, Loan
+
+        with transaction.atomic(using=using):
+            updated = IdSequence.objects.using(using).filter(name=self.name).update(last_value=F("last_value") + size)
+            if not updated:
+                # First reservation on this database: start after the highest existing loan number
+                start = highest_loan_number(Loan.objects.using(using).values_list("loan_id", flat=True))
+                try:
+                    with transaction.atomic(using=using):
+                        IdSequence.objects.using(using).create(name=self.name, last_value=start + size)
+                except IntegrityError:
+                    # Another worker created the counter first
+                    IdSequence.objects.using(using).filter(name=self.name).update(last_value=F("last_value") + size)
+            last_value = IdSequence.objects.using(using).values_list("last_value", flat=True).get(name=self.name)
+        return range(last_value - size + 1, last_value + 1)
+
+
+# Process-wide allocator for Loan.loan_id numbers
+loan_numbers = BlockAllocator("loan", LOAN_NUMBER_SEQUENCE)
@@ -0,0 +1,261 @@
+# File: instrumentation.py
+# Description: Per-request timings (SQL, serializers, rendering) as Server-Timing headers and Prometheus histograms.
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Upper bounds of the histogram buckets: durations in seconds, query counts
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# Timings of the sampled request being handled in this context (None when not sampled)
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    # Accumulated SQL, serializer and render time (seconds) of one request
+    __slots__ = ("queries", "db", "serialize", "render", "serializing", "render_start")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.serializing = False  # Set while the outermost serializer runs, so nested ones are not counted twice
+        self.render_start = None
+
+    def header(self, total):
+        return ", ".join([
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+            f"serialize;dur={self.serialize * 1000:.2f}",
+            f"render;dur={self.render * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+def current_timings():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    # Execute wrapper installed on every database connection (see signals.py): times the statements of
+    # sampled requests. The timings travel in a context variable, so queries that views run in a thread
+    # under the ASGI handler are counted too.
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+@contextmanager
+def timed_serialization():
+    # Adds the time spent inside to the current request's "serialize" timing; nested blocks count once
+    timings = _current.get()
+    if timings is None or timings.serializing:
+        yield
+        return
+    timings.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialize += time.perf_counter() - start
+        timings.serializing = False
+
+
+class TimedSerializerMixin:
+    # Adds the time spent in to_representation() to the current request's "serialize" timing.
+    # Put it first in the bases of a serializer; nested and many=True children count once.
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [count per bucket..., sum, count]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [0] * len(self.buckets) + [0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def lines(self, label_names):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}'
+            yield f"{self.name}_sum{{{base}}} {series[-2]:.6f}"
+            yield f"{self.name}_count{{{base}}} {series[-1]}"
+
+
+def _labels(names, values):
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in zip(names, values)
+    )
+
+
+class MetricsRegistry:
+    # In-process request metrics. Every request is counted; histograms only see sampled requests.
+    LABELS = ("view", "method")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}  # (view, method, status) -> count
+            self.histograms = {
+                "duration": Histogram("loan_http_request_duration_seconds", "Total time spent handling the request.", DURATION_BUCKETS),
+                "db": Histogram("loan_http_request_db_duration_seconds", "Time spent executing SQL.", DURATION_BUCKETS),
+                "queries": Histogram("loan_http_request_db_queries", "SQL statements executed.", QUERY_BUCKETS),
+                "serialize": Histogram("loan_http_request_serialize_duration_seconds", "Time spent in DRF serializers.", DURATION_BUCKETS),
+                "render": Histogram("loan_http_request_render_duration_seconds", "Time spent rendering the response.", DURATION_BUCKETS),
+            }
+
+    def count(self, view, method, status):
+        key = (view, method, status)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def observe(self, view, method, timings, total):
+        labels = (view, method)
+        with self.lock:
+            self.histograms["duration"].observe(labels, total)
+            self.histograms["db"].observe(labels, timings.db)
+            self.histograms["queries"].observe(labels, timings.queries)
+            self.histograms["serialize"].observe(labels, timings.serialize)
+            self.histograms["render"].observe(labels, timings.render)
+
+    def render(self):
+        # Prometheus text exposition format (version 0.0.4)
+        with self.lock:
+            lines = [
+                "# HELP loan_http_requests_total Requests handled, sampled or not.",
+                "# TYPE loan_http_requests_total counter",
+            ]
+            lines += [
+                f"loan_http_requests_total{{{_labels(('view', 'method', 'status'), key)}}} {count}"
+                for key, count in sorted(self.requests.items())
+            ]
+            lines += [
+                "# HELP loan_http_request_sample_rate Share of requests whose timings are recorded.",
+                "# TYPE loan_http_request_sample_rate gauge",
+                f"loan_http_request_sample_rate {sample_rate()}",
+            ]
+            for histogram in self.histograms.values():
+                lines += histogram.lines(self.LABELS)
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this process (each worker process exposes its own)
+registry = MetricsRegistry()
+
+
+def sample_rate():
+    if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+        return 0.0
+    return float(getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0))
+
+
+def _view_name(request):
+    # URL name of the matched route: a bounded label set, unlike raw paths
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or match._func_path
+
+
+class RequestMetricsMiddleware:
+    # Times sampled requests: SQL on every database connection, DRF serializers (TimedSerializerMixin) and
+    # response rendering. Results go to the metrics registry and, when SERVER_TIMING_HEADER is on, to a
+    # Server-Timing header. Unsampled requests are only counted. Works in sync and async stacks.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        rate = sample_rate()
+        return rate >= 1 or random.random() < rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+            return self.get_response(request)
+        if not self._sampled():
+            response = self.get_response(request)
+            registry.count(_view_name(request), request.method, response.status_code)
+            return response
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+            return await self.get_response(request)
+        if not self._sampled():
+            response = await self.get_response(request)
+            registry.count(_view_name(request), request.method, response.status_code)
+            return response
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        # Streaming bodies are produced later and not included in `total`
+        view = _view_name(request)
+        registry.count(view, request.method, response.status_code)
+        registry.observe(view, request.method, timings, total)
+        if getattr(settings, "SERVER_TIMING_HEADER", False):
+            response["Server-Timing"] = timings.header(total)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called just before DRF / template responses are rendered; the callback runs right after
+        timings = _current.get()
+        if timings is not None:
+            timings.render_start = time.perf_counter()
+
+            def rendered(response):
+                timings.render += time.perf_counter() - timings.render_start
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,76 @@
+# File: benchmark.py
+# Description: Management command that benchmarks the main API endpoints on a throwaway database and compares runs.
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from loan_app.benchmarks import (
+    SIZES, BenchmarkError, compare, load_report, over_budget, run_benchmarks, write_report,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a test database with loans and measure p50/p95 latency, queries and peak memory of the loan, "
+        "payment, foreclosure and login endpoints. Optionally write a JSON baseline or compare with one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", choices=sorted(SIZES), default="small", help="Seeded schedule rows: small=1k, medium=100k, large=1M.")
+        parser.add_argument("--rows", type=int, help="Seed this many schedule rows instead of a named size.")
+        parser.add_argument("--iterations", type=int, default=50, help="Measured requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests per scenario.")
+        parser.add_argument("--scenario", action="append", help="Only run this scenario (repeatable).")
+        parser.add_argument("--output", help="Write the report to this JSON file (e.g. a baseline).")
+        parser.add_argument("--compare", help="Baseline JSON file to check for regressions.")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown / memory growth.")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database (it is emptied and reseeded).")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["warmup"] < 0:
+            raise CommandError("--iterations must be positive and --warmup non-negative.")
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = load_report(options["compare"])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline: {e}")
+
+        # Never touch the configured database: run on its test database (test_<name>, or in-memory SQLite)
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            if options["keepdb"]:
+                call_command("flush", interactive=False, verbosity=0)  # Leftovers of the previous run
+            report = run_benchmarks(
+                options["rows"] or SIZES[options["size"]], options["iterations"], options["warmup"], options["scenario"]
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        meta = report["meta"]
+        self.stdout.write(f"{meta['loans']} loans, {meta['schedule_rows']} schedule rows on {meta['database']}")
+        self.stdout.write(f"{'scenario':<22}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KB':>11}")
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['queries']:>9}{result['peak_memory_kb']:>11.1f}"
+            )
+
+        if options["output"]:
+            write_report(report, options["output"])
+            self.stdout.write(f"Report written to {options['output']}")
+
+        problems = over_budget(report)
+        if baseline is not None:
+            problems += compare(baseline, report, options["tolerance"])
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f"{len(problems)} benchmark regression(s).")
+        self.stdout.write(self.style.SUCCESS("No regressions."))
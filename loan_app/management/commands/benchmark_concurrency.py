@@ -0,0 +1,63 @@
+# File: benchmark_concurrency.py
+# Description: Management command comparing the WSGI and ASGI handlers under concurrent clients.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from loan_app.benchmarks import (
+    CONCURRENCY_LEVELS, REQUESTS_PER_CLIENT, SIZES, BenchmarkError, run_concurrency, write_report,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a test database and measure throughput and p50/p95 latency of the loan list, foreclosure details "
+        "and login endpoints at several client concurrencies, served by WSGI threads and by the ASGI handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", choices=sorted(SIZES), default="small", help="Seeded schedule rows: small=1k, medium=100k, large=1M.")
+        parser.add_argument("--concurrency", type=int, action="append", help=f"Clients at once (repeatable, default {' '.join(map(str, CONCURRENCY_LEVELS))}).")
+        parser.add_argument("--requests", type=int, default=REQUESTS_PER_CLIENT, help="Requests each client sends.")
+        parser.add_argument("--wsgi-threads", type=int, default=4, help="Request threads of the WSGI worker.")
+        parser.add_argument("--db-latency-ms", type=float, default=0, help="Added to every SQL statement, like a remote database.")
+        parser.add_argument("--scenario", action="append", help="Only run this scenario (repeatable).")
+        parser.add_argument("--output", help="Write the report to this JSON file.")
+
+    def handle(self, *args, **options):
+        levels = options["concurrency"] or CONCURRENCY_LEVELS
+        if min(levels) < 1 or options["requests"] < 1 or options["wsgi_threads"] < 1:
+            raise CommandError("--concurrency, --requests and --wsgi-threads must be positive.")
+
+        # Never touch the configured database: run on its test database (test_<name>, or in-memory SQLite)
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = run_concurrency(
+                SIZES[options["size"]], levels, options["requests"], options["wsgi_threads"],
+                options["db_latency_ms"], options["scenario"],
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        meta = report["meta"]
+        self.stdout.write(
+            f"{meta['loans']} loans on {meta['database']}, {meta['wsgi_threads']} WSGI threads, "
+            f"+{meta['db_latency_ms']}ms per statement"
+        )
+        self.stdout.write(f"{'scenario':<22}{'clients':>8}{'':>3}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, levels in report["results"].items():
+            for clients, servers in levels.items():
+                for server, result in servers.items():
+                    self.stdout.write(
+                        f"{name:<22}{clients:>8} {server:<5}{result['rps']:>7.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                    )
+
+        if options["output"]:
+            write_report(report, options["output"])
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,60 @@
+# File: benchmark_serialization.py
+# Description: Management command comparing DRF serializers with the projection serializers and orjson renderer.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from loan_app.benchmarks import SERIALIZATION_LOANS, BenchmarkError, run_serialization, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a test database with loans and time fetching, serializing and rendering all of them with their "
+        "schedules through LoanSerializer, the projection serializers, and the projections with orjson."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loans", type=int, default=SERIALIZATION_LOANS, help="Loans to seed and serialize.")
+        parser.add_argument("--iterations", type=int, default=3, help="Runs per path (the best one is reported).")
+        parser.add_argument("--output", help="Write the report to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["loans"] < 1 or options["iterations"] < 1:
+            raise CommandError("--loans and --iterations must be positive.")
+
+        # Never touch the configured database: run on its test database (test_<name>, or in-memory SQLite)
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = run_serialization(options["loans"], options["iterations"])
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        meta = report["meta"]
+        self.stdout.write(f"{meta['loans']} loans, {meta['schedule_rows']} schedule rows on {meta['database']}")
+        self.stdout.write(f"{'path':<20}{'fetch ms':>11}{'serialize ms':>14}{'render ms':>11}{'total ms':>11}{'KB':>9}")
+        baseline = report["results"]["drf"]["total_ms"]
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name:<20}{result['fetch_ms']:>11.1f}{result['serialize_ms']:>14.1f}{result['render_ms']:>11.1f}"
+                f"{result['total_ms']:>11.1f}{result['bytes'] / 1024:>9.0f}  x{baseline / result['total_ms']:.1f}"
+            )
+
+        self.stdout.write(f"\n{'format':<20}{'KB':>9}{'gzip KB':>10}{'br KB':>8}{'parse ms':>10}")
+        for name, result in report["formats"].items():
+            brotli_kb = f"{result['br_bytes'] / 1024:>8.0f}" if "br_bytes" in result else f"{'-':>8}"
+            self.stdout.write(
+                f"{name:<20}{result['bytes'] / 1024:>9.0f}{result['gzip_bytes'] / 1024:>10.0f}{brotli_kb}{result['parse_ms']:>10.1f}"
+            )
+
+        if options["output"]:
+            write_report(report, options["output"])
+            self.stdout.write(f"Report written to {options['output']}")
+        if not report["identical"]:
+            raise CommandError("The paths rendered different bytes.")
+        self.stdout.write(self.style.SUCCESS("All paths rendered identical bytes."))
@@ -0,0 +1,36 @@
+# File: check_query_plans.py
+# Description: Management command that EXPLAINs hot-path queries and fails if any falls back to a sequential scan
+# or does not use its intended index.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan_app.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every hot-path query against the current (seeded) database and fail on sequential scans "
+        "or queries not using their intended index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--show-plans", action="store_true", help="Print the plan of every query.")
+
+    def handle(self, *args, **options):
+        try:
+            results = check_query_plans()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        failures = 0
+        for name, plan, problems in results:
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FAIL      {name} ({', '.join(problems)})"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK        {name}"))
+            if problems or options["show_plans"]:
+                self.stdout.write("    " + plan.replace("\n", "\n    "))
+
+        if failures:
+            raise CommandError(f"{failures} hot queries fall back to sequential scans or other indexes.")
@@ -0,0 +1,45 @@
+# File: convert_schedules.py
+# Description: Management command that converts loans between stored (materialized) and virtual payment schedules.
+
+from django.core.management.base import BaseCommand
+
+from loan_app.models import Loan
+from loan_app.virtual_schedule import materialize_loans, virtualize_loans
+
+
+class Command(BaseCommand):
+    help = "Convert existing loans to virtual schedules (dropping their PaymentSchedule rows) or back to stored rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["virtual", "materialized"], default="virtual", help="Target schedule mode.")
+        parser.add_argument("--loan-id", action="append", dest="loan_ids", help="Only convert this loan (repeatable).")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Loans converted per transaction.")
+
+    def handle(self, *args, **options):
+        source_mode = "MATERIALIZED" if options["to"] == "virtual" else "VIRTUAL"
+        loans = Loan.objects.filter(schedule_mode=source_mode)
+        if options["loan_ids"]:
+            loans = loans.filter(loan_id__in=options["loan_ids"])
+        chunk_size = max(options["chunk_size"], 1)
+
+        converted = 0
+        skipped = []
+        last_id = 0
+        while True:
+            # Walk the primary key so converted loans never shift the next chunk
+            chunk = list(loans.filter(id__gt=last_id).order_by("id").only("id")[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            if options["to"] == "virtual":
+                done, not_converted = virtualize_loans(chunk)
+                skipped.extend(not_converted)
+            else:
+                done = materialize_loans(chunk)
+            converted += len(done)
+
+        for loan_id in skipped[:20]:
+            self.stderr.write(f"{loan_id}: stored schedule differs from its terms; left materialized.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} loans to {options['to']} schedules; {len(skipped)} skipped."
+        ))
@@ -0,0 +1,35 @@
+# File: export_loans.py
+# Description: Management command that streams loans and their payment schedules to a CSV or NDJSON file.
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan_app.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, stream_export
+from loan_app.filters import filter_loans
+from loan_app.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Export loans joined with their payment schedules as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output-format", choices=sorted(EXPORT_FORMATS), default="csv", help="Output format.")
+        parser.add_argument("--output", default="-", help="Output file, or '-' for stdout.")
+        parser.add_argument("--status", help="Only export loans with this status (ACTIVE/CLOSED).")
+        parser.add_argument("--created-from", help="Only loans created on or after this date/datetime.")
+        parser.add_argument("--created-to", help="Only loans created on or before this date/datetime.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Loans fetched per cursor round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            loans = filter_loans(Loan.objects.all(), options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = stream_export(options["output_format"], loans, chunk_size=max(options["chunk_size"], 1))
+        if options["output"] == "-":
+            sys.stdout.writelines(chunks)
+        else:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(chunks)
@@ -0,0 +1,47 @@
+# File: originate_loans.py
+# Description: Management command that originates loans in bulk from a JSON array or NDJSON file.
+
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan_app.origination import DEFAULT_CHUNK_SIZE, originate_loans, parse_applications
+
+
+class Command(BaseCommand):
+    help = "Originate loans in bulk from a JSON array or NDJSON file of applications (email, amount, tenure, interest_rate)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or '-' to read from stdin.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Applications written per transaction.")
+        parser.add_argument("--results", help="Write one NDJSON result line per application to this file.")
+
+    def handle(self, *args, **options):
+        # Load applications
+        try:
+            if options["path"] == "-":
+                applications = parse_applications(sys.stdin)
+            else:
+                with open(options["path"], encoding="utf-8") as stream:
+                    applications = parse_applications(stream)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read applications: {e}")
+
+        if not isinstance(applications, list):
+            raise CommandError("Expected a JSON array or NDJSON lines of loan applications.")
+
+        results = originate_loans(applications, chunk_size=max(options["chunk_size"], 1))
+
+        # Write per-item results
+        if options["results"]:
+            with open(options["results"], "w", encoding="utf-8") as output:
+                for result in results:
+                    output.write(json.dumps(result, default=str) + "\n")
+
+        failed = [result for result in results if not result["success"]]
+        for result in failed[:20]:
+            self.stderr.write(f"Application {result['index']}: {json.dumps(result['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(results) - len(failed)} loans; {len(failed)} applications failed."
+        ))
@@ -0,0 +1,18 @@
+# File: rebuild_portfolio.py
+# Description: Management command that recomputes the portfolio summary buckets from the loan and schedule tables.
+
+from django.core.management.base import BaseCommand
+
+from loan_app.portfolio import DEFAULT_CHUNK_SIZE, rebuild_portfolio
+
+
+class Command(BaseCommand):
+    help = "Rebuild the portfolio summary buckets from scratch (after migrating, or to repair drift)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Loan ids aggregated per query.")
+        parser.add_argument("--workers", type=int, default=1, help="Threads aggregating loan id ranges in parallel.")
+
+    def handle(self, *args, **options):
+        buckets = rebuild_portfolio(chunk_size=max(options["chunk_size"], 1), workers=max(options["workers"], 1))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} portfolio buckets."))
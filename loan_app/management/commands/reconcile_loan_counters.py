@@ -0,0 +1,23 @@
+# File: reconcile_loan_counters.py
+# Description: Management command that finds and repairs drift in the stored loan repayment counters.
+
+from django.core.management.base import BaseCommand
+
+from loan_app.counters import DEFAULT_CHUNK_SIZE, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Check paid_installments, amount_paid and amount_remaining of every loan against its schedule and repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Loan ids checked per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report drifted loans.")
+        parser.add_argument("--verbose-ids", action="store_true", help="List the drifted loan ids.")
+
+    def handle(self, *args, **options):
+        drifted = reconcile_counters(chunk_size=max(options["chunk_size"], 1), fix=not options["dry_run"])
+        if options["verbose_ids"]:
+            for loan_id in drifted:
+                self.stdout.write(loan_id)
+        action = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(drifted)} loans with drifted counters."))
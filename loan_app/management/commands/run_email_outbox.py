@@ -0,0 +1,42 @@
+# File: run_email_outbox.py
+# Description: Management command that delivers queued emails from the outbox using a pool of sender threads.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from loan_app.email_outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails (OTP messages) from the email outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the messages due now and exit.")
+        parser.add_argument("--batch-size", type=int, help="Messages claimed per round (default: EMAIL_OUTBOX_BATCH_SIZE).")
+        parser.add_argument("--workers", type=int, help="Sender threads / mail server connections (default: EMAIL_OUTBOX_WORKERS).")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] and max(options["batch_size"], 1)
+        workers = options["workers"] and max(options["workers"], 1)
+        totals = {"sent": 0, "retried": 0, "failed": 0}
+
+        try:
+            while True:
+                counts = dispatch_batch(batch_size, workers)
+                for key in totals:
+                    totals[key] += counts[key]
+                if counts["claimed"] and options["verbosity"] > 1:
+                    self.stdout.write(f"Sent {counts['sent']}, retrying {counts['retried']}, failed {counts['failed']}.")
+
+                if not counts["claimed"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])  # Nothing due; wait for new messages
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']} emails; {totals['retried']} scheduled for retry; {totals['failed']} failed."
+        ))
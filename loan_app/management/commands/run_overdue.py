@@ -0,0 +1,36 @@
+# File: run_overdue.py
+# Description: Management command that marks overdue installments, accrues late fees and refreshes loan due dates.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from loan_app.overdue import DEFAULT_CHUNK_SIZE, run_overdue
+
+
+class Command(BaseCommand):
+    help = "Age active loans: mark overdue installments, compute days past due and late fees, refresh next due dates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--as-of", help="Business date to age loans to (YYYY-MM-DD, default: today).")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Loan ids per UPDATE batch.")
+        parser.add_argument("--workers", type=int, default=1, help="Threads issuing batches in parallel.")
+        parser.add_argument("--shard", default="0/1", help="Process only shard N of M loan id ranges (e.g. 2/4), for running several processes.")
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options["as_of"]:
+            as_of = parse_date(options["as_of"])
+            if as_of is None:
+                raise CommandError(f"Invalid date: {options['as_of']!r}")
+
+        try:
+            shard, shards = (int(part) for part in options["shard"].split("/"))
+        except ValueError:
+            raise CommandError("--shard must look like N/M, e.g. 0/4.")
+        if not 0 <= shard < shards:
+            raise CommandError("--shard N/M needs 0 <= N < M.")
+
+        batches, overdue = run_overdue(
+            as_of, chunk_size=max(options["chunk_size"], 1), workers=max(options["workers"], 1), shard=shard, shards=shards
+        )
+        self.stdout.write(self.style.SUCCESS(f"Aged {batches} loan batches; {overdue} installments are overdue."))
@@ -0,0 +1,94 @@
+# File: seed_loans.py
+# Description: Management command that fills the database with synthetic users, loans and payment schedules.
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+from loan_app.models import User
+from loan_app.portfolio import rebuild_portfolio
+from loan_app.response_cache import loans_changed
+from loan_app.seeding import DEFAULT_CHUNK_SIZE, SeedConfig, parse_range, parse_weights, seed_loans
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate N users and M loans with full payment schedules (multi-row INSERTs, or COPY on PostgreSQL). "
+        "Output is deterministic for a given --seed and --as-of."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Borrowers to create.")
+        parser.add_argument("--loans", type=int, default=10000, help="Loans to create (spread randomly over the borrowers).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--as-of", help="Date the data is generated relative to (YYYY-MM-DD, default: today).")
+        parser.add_argument("--amount", default="10000:1000000", help="Loan amount range LOW:HIGH (log-uniform).")
+        parser.add_argument("--amount-step", type=int, default=1000, help="Amounts are multiples of this.")
+        parser.add_argument("--tenure", default="12:4,24:3,36:2,60:1", help="Tenures in months with weights, MONTHS:WEIGHT,...")
+        parser.add_argument("--rate", default="6:18", help="Yearly interest rate range LOW:HIGH (whole percent, uniform).")
+        parser.add_argument("--paid", default="0:1", help="Range of the fraction of each loan's installments already paid.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Loans generated and written per transaction.")
+        parser.add_argument("--workers", type=int, help="Writer processes (default: CPU count on PostgreSQL, 1 on SQLite).")
+        parser.add_argument("--prefix", default="seed", help="Username/email prefix of the generated users.")
+        parser.add_argument("--password", default="password", help="Password shared by the generated users.")
+        parser.add_argument("--skip-portfolio", action="store_true", help="Do not rebuild the portfolio summary afterwards.")
+
+    def handle(self, *args, **options):
+        try:
+            config = SeedConfig(
+                seed=options["seed"],
+                as_of=self.parse_as_of(options["as_of"]),
+                amount=parse_range(options["amount"]),
+                amount_step=max(options["amount_step"], 1),
+                tenures=parse_weights(options["tenure"]),
+                rate=parse_range(options["rate"]),
+                paid=parse_range(options["paid"], float),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["users"] < 1 or options["loans"] < 0:
+            raise CommandError("--users must be positive and --loans non-negative.")
+        if not 0 <= config.paid[0] <= config.paid[1] <= 1:
+            raise CommandError("--paid must be a range within 0:1.")
+        if config.amount[0] < 1 or config.amount[1] >= 10 ** 8:
+            raise CommandError("--amount must be within 1:99999999.")
+        if User.objects.filter(email__startswith=options["prefix"], email__endswith="@example.com").exists():
+            raise CommandError(f"Users with prefix {options['prefix']!r} already exist; pick another --prefix.")
+
+        workers = options["workers"]
+        if workers is None:
+            workers = (os.cpu_count() or 1) if connection.vendor == "postgresql" else 1
+        if connection.vendor == "sqlite" and workers > 1:
+            self.stderr.write("SQLite allows one writer at a time; using a single worker.")
+            workers = 1
+
+        started = time.monotonic()
+        verbosity = options["verbosity"]
+
+        def progress(loans, rows):
+            if verbosity >= 2:
+                self.stdout.write(f"{loans} loans, {rows} schedule rows ({rows / max(time.monotonic() - started, 1e-9):,.0f} rows/s)")
+
+        users, loans, rows = seed_loans(
+            options["users"], options["loans"], config, chunk_size=max(options["chunk_size"], 1), workers=workers,
+            prefix=options["prefix"], password=options["password"], progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        loans_changed()  # Cached loan lists predate the new data
+        if not options["skip_portfolio"]:
+            rebuild_portfolio(workers=workers)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {users} users, {loans} loans and {rows} schedule rows in {elapsed:.1f}s "
+            f"({rows / max(elapsed, 1e-9) * 60:,.0f} rows/min)."
+        ))
+
+    def parse_as_of(self, value):
+        if not value:
+            return None
+        as_of = parse_date(value)
+        if as_of is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        return as_of
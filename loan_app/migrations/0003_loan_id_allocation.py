@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+LOAN_NUMBER_SEQUENCE = 'loan_app_loan_number_seq'
+
+
+def seed_loan_numbers(apps, schema_editor):
+    # Start loan number allocation after the highest existing LOANnnn id
+    Loan = apps.get_model('loan_app', 'Loan')
+    IdSequence = apps.get_model('loan_app', 'IdSequence')
+    db_alias = schema_editor.connection.alias
+    numbers = [
+        int(loan_id[4:]) for loan_id in Loan.objects.using(db_alias).values_list('loan_id', flat=True)
+        if loan_id.startswith('LOAN') and loan_id[4:].isdigit()
+    ]
+    last_number = max(numbers, default=0)
+    IdSequence.objects.using(db_alias).create(name='loan', last_value=last_number)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {LOAN_NUMBER_SEQUENCE} START WITH {last_number + 1}')
+
+
+def drop_loan_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {LOAN_NUMBER_SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0002_customuser_is_verified_customuser_otp_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_loan_numbers, drop_loan_number_sequence),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0005_email_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentschedule',
+            name='schedule_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='paymentschedule',
+            name='days_past_due',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentschedule',
+            name='late_fee',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='paymentschedule',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('OVERDUE', 'Overdue'), ('PAID', 'Paid')], default='PENDING', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='paymentschedule',
+            index=models.Index(condition=models.Q(('status__in', ('PENDING', 'OVERDUE'))), fields=['loan', 'installment_number'], name='schedule_unpaid_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0007_loan_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='paid_mask',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_mode',
+            field=models.CharField(choices=[('MATERIALIZED', 'Materialized'), ('VIRTUAL', 'Virtual')], default='MATERIALIZED', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
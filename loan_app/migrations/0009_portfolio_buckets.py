@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0008_virtual_schedules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('LOAN', 'Loans by origination month and loan status'), ('INSTALLMENT', 'Installments by due month, DUE (unpaid) or PAID')], max_length=12)),
+                ('month', models.DateField()),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.BigIntegerField(default=0)),
+                ('principal', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('interest', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'month', 'status'), name='portfolio_bucket_key')],
+            },
+        ),
+    ]
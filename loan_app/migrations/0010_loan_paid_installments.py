@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0009_portfolio_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='paid_installments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0010_loan_paid_installments'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentschedule',
+            name='schedule_loan_inst_idx',
+        ),
+    ]
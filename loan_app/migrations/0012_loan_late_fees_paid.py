@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan_app', '0011_drop_schedule_loan_inst_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='late_fees_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
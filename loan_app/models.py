@@ -35,6 +35,50 @@ class CustomUser(AbstractUser):
 User = get_user_model()
 
 
+# Named counter used to reserve blocks of identifiers (fallback for databases without sequences)
+class IdSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)  # Counter name (e.g., "loan")
+    last_value = models.BigIntegerField(default=0)  # Highest value handed out so far
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"  # String representation of the counter
+
+
+# Query helpers for Loan
+class LoanQuerySet(models.QuerySet):
+    def with_schedule_summary(self):
+        # Prefetch users and ordered schedules, so listing loans runs a fixed number of queries however
+        # many loans there are (repayment totals are stored on the loan)
+        return self.select_related("user").prefetch_related(
+            models.Prefetch("schedule", queryset=PaymentSchedule.objects.order_by("installment_number"))
+        )
+
+    def closable(self):
+        # Active loans refresh_due_state() would close: materialized schedules with no unpaid installment left
+        unpaid = PaymentSchedule.objects.filter(loan_id=models.OuterRef("loan_id"), status__in=UNPAID_STATUSES)
+        return self.filter(status="ACTIVE", schedule_mode="MATERIALIZED").filter(
+            models.Exists(PaymentSchedule.objects.filter(loan_id=models.OuterRef("loan_id"))), ~models.Exists(unpaid)
+        )
+
+    def refresh_due_state(self, **values):
+        # In one UPDATE, set next_due_date to the earliest unpaid installment and close loans with nothing
+        # left to pay (loans without any schedule rows stay as they are), bumping the version.
+        # Extra column values may be passed. Virtual-schedule loans are skipped; payments keep them current.
+        unpaid = PaymentSchedule.objects.filter(loan_id=models.OuterRef("loan_id"), status__in=UNPAID_STATUSES)
+        return self.filter(schedule_mode="MATERIALIZED").update(
+            next_due_date=models.Subquery(unpaid.order_by("installment_number").values("due_date")[:1]),
+            status=models.Case(
+                models.When(
+                    models.Exists(PaymentSchedule.objects.filter(loan_id=models.OuterRef("loan_id"))) & ~models.Exists(unpaid),
+                    then=models.Value("CLOSED"),
+                ),
+                default=models.F("status"),
+            ),
+            version=models.F("version") + 1,
+            **values,
+        )
+
+
 # Loan Model
 class Loan(models.Model):
     # Loan fields
@@ -52,28 +96,73 @@ class Loan(models.Model):
         default='ACTIVE'
     )  # Loan status
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Amount paid so far
-    amount_remaining = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Remaining balance
+    amount_remaining = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Left of total_payable
+    paid_installments = models.PositiveIntegerField(default=0)  # Installments paid (kept with the amounts, see counters.py)
+    late_fees_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Late fees collected (part of amount_paid)
     next_due_date = models.DateField(null=True, blank=True)  # Next payment due date
     foreclosure_date = models.DateField(null=True, blank=True)  # Date of foreclosure, if applicable
     foreclosure_discount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Discount on foreclosure
     final_settlement_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Final settlement amount
     created_at = models.DateTimeField(auto_now_add=True)  # Loan creation timestamp
-    
+    version = models.PositiveIntegerField(default=0)  # Bumped on every payment or status change (cache key)
+    schedule_mode = models.CharField(
+        max_length=12,
+        choices=[('MATERIALIZED', 'Materialized'), ('VIRTUAL', 'Virtual')],
+        default='MATERIALIZED'
+    )  # MATERIALIZED: one PaymentSchedule row per installment; VIRTUAL: derived from the terms on demand
+    schedule_start = models.DateField(null=True, blank=True)  # Date due dates count from (virtual schedules)
+    paid_mask = models.BinaryField(default=b"", blank=True)  # Bit per paid installment (virtual schedules)
+
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="loan_user_status_idx"),  # A user's loans by status
+            models.Index(fields=["created_at", "id"], name="loan_created_id_idx"),  # Keyset pagination order
+            models.Index(fields=["user", "created_at", "id"], name="loan_user_created_idx"),  # A user's loans in page order
+            models.Index(
+                fields=["next_due_date"], condition=models.Q(status="ACTIVE"), name="loan_active_due_idx"
+            ),  # Active loans by next due date
+        ]
+
+    @classmethod
+    def allocate_loan_ids(cls, count):
+        # Hand out `count` loan ids from this worker's reserved block of loan numbers
+        from .id_allocation import loan_numbers
+        return [f"LOAN{number:03}" for number in loan_numbers.allocate(count)]  # Incremental IDs (e.g., LOAN002)
+
+    @property
+    def is_virtual(self):
+        return self.schedule_mode == "VIRTUAL"
+
+    def installments(self, as_of=None):
+        # Ordered installments of the loan: PaymentSchedule rows, or equivalent rows derived from the
+        # loan terms for virtual schedules
+        if self.is_virtual:
+            from .virtual_schedule import virtual_schedule
+            return virtual_schedule(self, as_of)
+        if "schedule" in getattr(self, "_prefetched_objects_cache", {}):
+            return list(self.schedule.all())  # Prefetched in installment order (with_schedule_summary)
+        return list(self.schedule.order_by("installment_number"))
+
     def save(self, *args, **kwargs):
         # Generate unique loan_id if not already set
         if not self.loan_id:
-            last_loan = Loan.objects.order_by("-id").first()
-            if last_loan and last_loan.loan_id.startswith("LOAN"):
-                last_number = int(last_loan.loan_id.replace("LOAN", ""))
-                self.loan_id = f"LOAN{last_number + 1:03}"  # Incremental ID (e.g., LOAN002)
-            else:
-                self.loan_id = "LOAN001"  # Default ID for first loan
+            self.loan_id = self.allocate_loan_ids(1)[0]
+        elif self.pk:
+            self.version += 1  # Invalidate data cached for the previous state
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.loan_id} - {self.user.email}"  # String representation of the loan
 
 
+# Installment statuses that still have to be paid
+UNPAID_STATUSES = ("PENDING", "OVERDUE")
+
+
 # Payment Schedule Model
 class PaymentSchedule(models.Model):
     # Payment schedule fields
@@ -85,6 +174,76 @@ class PaymentSchedule(models.Model):
     remaining_balance = models.DecimalField(max_digits=10, decimal_places=2)  # Remaining loan balance
     status = models.CharField(
         max_length=20, 
-        choices=[('PENDING', 'Pending'), ('PAID', 'Paid')], 
+        choices=[('PENDING', 'Pending'), ('OVERDUE', 'Overdue'), ('PAID', 'Paid')], 
         default='PENDING'
-    )  # Payment status
\ No newline at end of file
+    )  # Payment status
+    days_past_due = models.PositiveIntegerField(default=0)  # Days since due_date while unpaid (set by run_overdue)
+    late_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Late penalty accrued so far
+
+    # Every bulk-inserted schedule row updates each of these indexes as well as the one on the loan foreign key,
+    # which already serves whole-schedule reads (a loan has at most MAX_TENURE rows to sort), exports and cascade
+    # deletes. Each one below backs a query that runs per request or per loan of a batch job.
+    class Meta:
+        indexes = [
+            # Paid installment counts of each loan (counter reconciliation)
+            models.Index(fields=["loan", "status", "installment_number"], name="schedule_loan_status_idx"),
+            # Foreclosure totals of the installments due by a date
+            models.Index(fields=["loan", "due_date"], name="schedule_loan_due_idx"),
+            # Next unpaid installment (payments, next_due_date) and the overdue job; rows leave it once paid
+            models.Index(
+                fields=["loan", "installment_number"], condition=models.Q(status__in=UNPAID_STATUSES),
+                name="schedule_unpaid_idx"
+            ),
+        ]
+
+
+# Outgoing email waiting to be delivered by the outbox dispatcher (run_email_outbox)
+class EmailOutbox(models.Model):
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)  # Email subject
+    body = models.TextField()  # Plain-text message
+    from_email = models.CharField(max_length=254)  # Sender address
+    recipients = models.JSONField(default=list)  # List of recipient addresses
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')  # Delivery status
+    attempts = models.PositiveIntegerField(default=0)  # Delivery attempts made so far
+    next_attempt_at = models.DateTimeField(default=now)  # Earliest next attempt (claim lease while SENDING)
+    last_error = models.TextField(blank=True, default="")  # Error raised by the last failed attempt
+    created_at = models.DateTimeField(auto_now_add=True)  # Enqueue timestamp
+    sent_at = models.DateTimeField(null=True, blank=True)  # Delivery timestamp
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),  # Rows ready to be claimed
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"  # String representation of the email
+
+
+# Running portfolio totals, kept up to date by loan creation, payments, foreclosure and deletion
+class PortfolioBucket(models.Model):
+    KIND_CHOICES = (
+        ('LOAN', 'Loans by origination month and loan status'),
+        ('INSTALLMENT', 'Installments by due month, DUE (unpaid) or PAID'),
+    )
+
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)  # What is counted
+    month = models.DateField()  # First day of the bucket's month
+    status = models.CharField(max_length=10)  # ACTIVE/CLOSED (and WAIVED discounts) for loans, DUE/PAID for installments
+    count = models.BigIntegerField(default=0)  # Loans or installments in the bucket
+    principal = models.DecimalField(max_digits=18, decimal_places=2, default=0)  # Loan amounts / principal components
+    interest = models.DecimalField(max_digits=18, decimal_places=2, default=0)  # Total interest / interest components
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "month", "status"], name="portfolio_bucket_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.month:%Y-%m} {self.status}: {self.count}"  # String representation of the bucket
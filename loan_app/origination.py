@@ -0,0 +1,189 @@
+# File: origination.py
+# Description: Bulk loan origination - validates loan applications and writes loans and schedules in chunked transactions.
+
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.utils.timezone import now
+
+from .amortization import amortize_batch, calculate_loan_terms, due_dates
+from .models import Loan, PaymentSchedule
+from .portfolio import record_new_loans
+from .quotes import MAX_AMOUNT, MAX_INTEREST_RATE, MAX_TENURE, quote_terms
+from .response_cache import loans_changed
+from .virtual_schedule import default_schedule_mode, schedule_rows
+
+# Get the active user model
+User = get_user_model()
+
+# Number of applications written per transaction
+DEFAULT_CHUNK_SIZE = 1000
+
+# Rows sent per INSERT statement
+INSERT_BATCH_SIZE = 5000
+
+
+def parse_applications(stream):
+    # Read loan applications from a JSON array or NDJSON text stream
+    text = stream.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def validate_application(application):
+    # Validate a single loan application, returning (cleaned_data, errors)
+    if not isinstance(application, dict):
+        return None, {"non_field_errors": ["Expected an object."]}
+
+    cleaned = {}
+    errors = {}
+    email = application.get("email")
+    if not email:
+        errors["email"] = ["This field is required."]
+    cleaned["email"] = email
+
+    # Numeric fields are coerced the same way LoanView.post does
+    for field in ("amount", "tenure", "interest_rate"):
+        value = application.get(field)
+        if value is None:
+            errors[field] = ["This field is required."]
+            continue
+        try:
+            cleaned[field] = int(value)
+        except (TypeError, ValueError):
+            errors[field] = ["A valid integer is required."]
+
+    if cleaned.get("amount") is not None and cleaned["amount"] <= 0:
+        errors["amount"] = ["Amount must be greater than zero."]
+    elif cleaned.get("amount") is not None and cleaned["amount"] > MAX_AMOUNT:
+        errors["amount"] = [f"Amount must be at most {MAX_AMOUNT}."]
+    if cleaned.get("tenure") is not None and cleaned["tenure"] <= 0:
+        errors["tenure"] = ["Tenure must be at least one month."]
+    elif cleaned.get("tenure") is not None and cleaned["tenure"] > MAX_TENURE:
+        errors["tenure"] = [f"Tenure must be at most {MAX_TENURE} months."]
+    if cleaned.get("interest_rate") is not None and cleaned["interest_rate"] < 0:
+        errors["interest_rate"] = ["Interest rate cannot be negative."]
+    elif cleaned.get("interest_rate") is not None and cleaned["interest_rate"] > MAX_INTEREST_RATE:
+        errors["interest_rate"] = [f"Interest rate must be at most {MAX_INTEREST_RATE}."]
+
+    # Money columns hold at most MAX_AMOUNT, so a loan whose total would overflow them is rejected here
+    # rather than failing its whole chunk on insert
+    if not errors and quote_terms(cleaned["amount"], cleaned["tenure"], cleaned["interest_rate"])[2] > MAX_AMOUNT:
+        errors["amount"] = ["Total payable for these terms is too large."]
+
+    return (None, errors) if errors else (cleaned, None)
+
+
+def _originate_chunk(chunk, start_date):
+    # Create loans (and, unless schedules are virtual, their full schedules) for one chunk of
+    # (index, cleaned, user) in a single transaction
+    loan_ids = Loan.allocate_loan_ids(len(chunk))
+    loans_changed([user.pk for _, _, user in chunk])
+    loans = []
+    terms_list = []
+    for loan_id, (_, cleaned, user) in zip(loan_ids, chunk):
+        terms = calculate_loan_terms(cleaned["amount"], cleaned["tenure"], cleaned["interest_rate"])
+        terms_list.append(terms)
+        loans.append(Loan(
+            loan_id=loan_id,
+            user=user,
+            amount=cleaned["amount"],
+            tenure=cleaned["tenure"],
+            interest_rate=cleaned["interest_rate"],
+            status="ACTIVE",
+            amount_remaining=terms["total_payable"],
+            **terms
+        ))
+
+    if default_schedule_mode() == "VIRTUAL":
+        # Nothing to store per installment; the schedule is derived from the terms when read
+        for loan in loans:
+            loan.schedule_mode = "VIRTUAL"
+            loan.schedule_start = start_date
+        first_due_dates = [due_dates(start_date, loan.tenure)[0] for loan in loans]
+        Loan.objects.bulk_create(loans, batch_size=INSERT_BATCH_SIZE)
+        record_new_loans((loan, [row[1:4] for row in schedule_rows(loan)]) for loan in loans)
+        return _chunk_results(chunk, loans, terms_list, first_due_dates)
+
+    schedules = amortize_batch(
+        [(loan.amount, loan.tenure, loan.interest_rate, loan.monthly_installment) for loan in loans],
+        start_date,
+    )
+    schedule_entries = [
+        PaymentSchedule(
+            loan_id=loan.loan_id,
+            installment_number=number,
+            due_date=due_date,
+            principal_component=principal,
+            interest_component=interest,
+            remaining_balance=balance,
+        )
+        for loan, schedule in zip(loans, schedules)
+        for number, due_date, principal, interest, balance in schedule.rows()
+    ]
+
+    Loan.objects.bulk_create(loans, batch_size=INSERT_BATCH_SIZE)
+    PaymentSchedule.objects.bulk_create(schedule_entries, batch_size=INSERT_BATCH_SIZE)
+    record_new_loans(
+        (loan, [row[1:4] for row in schedule.rows()]) for loan, schedule in zip(loans, schedules)
+    )
+    return _chunk_results(chunk, loans, terms_list, [schedule.due_dates[0] for schedule in schedules])
+
+
+def _chunk_results(chunk, loans, terms_list, first_due_dates):
+    # Per-application results for a created chunk
+    return [
+        {
+            "index": index,
+            "success": True,
+            "loan_id": loan.loan_id,
+            "email": cleaned["email"],
+            "monthly_installment": terms["monthly_installment"],
+            "total_interest": terms["total_interest"],
+            "total_amount": terms["total_payable"],
+            "first_due_date": first_due_date,
+            "status": loan.status,
+        }
+        for (index, cleaned, _), loan, terms, first_due_date in zip(chunk, loans, terms_list, first_due_dates)
+    ]
+
+
+def originate_loans(applications, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Validate every application, then create valid loans chunk by chunk.
+    # Returns one result dict per application, in input order.
+    results = [None] * len(applications)
+    valid = []
+    for index, application in enumerate(applications):
+        cleaned, errors = validate_application(application)
+        if errors:
+            results[index] = {"index": index, "success": False, "errors": errors}
+        else:
+            valid.append((index, cleaned))
+
+    # Resolve all borrowers with a single query
+    users = User.objects.in_bulk({cleaned["email"] for _, cleaned in valid}, field_name="email")
+    ready = []
+    for index, cleaned in valid:
+        user = users.get(cleaned["email"])
+        if user is None:
+            results[index] = {"index": index, "success": False, "errors": {"email": ["User not found."]}}
+        else:
+            ready.append((index, cleaned, user))
+
+    start_date = now().date()
+    for offset in range(0, len(ready), chunk_size):
+        chunk = ready[offset:offset + chunk_size]
+        try:
+            with transaction.atomic():
+                chunk_results = _originate_chunk(chunk, start_date)
+        except DatabaseError as e:
+            chunk_results = [
+                {"index": index, "success": False, "errors": {"non_field_errors": [str(e)]}}
+                for index, _, _ in chunk
+            ]
+        for result in chunk_results:
+            results[result["index"]] = result
+
+    return results
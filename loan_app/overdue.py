@@ -0,0 +1,124 @@
+# File: overdue.py
+# Description: Batch engine that ages loans: marks overdue installments, accrues late fees and refreshes loans.
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import DateField, DecimalField, F, Func, IntegerField, Max, Min, Subquery, Value
+from django.db.models.functions import Greatest, Round
+from django.utils.timezone import now
+
+from .models import UNPAID_STATUSES, Loan, PaymentSchedule
+from .response_cache import loans_changed
+
+# Loans aged per statement batch (and per transaction)
+DEFAULT_CHUNK_SIZE = 5000
+
+# Late fee policy used when LATE_FEE_DAILY_RATE / LATE_FEE_GRACE_DAYS are not configured
+DEFAULT_LATE_FEE_DAILY_RATE = "0.0005"  # Fraction of the installment charged per day past the grace period
+DEFAULT_LATE_FEE_GRACE_DAYS = 0
+
+
+class DaysBetween(Func):
+    # Whole days from `start` to `end` (both date expressions), evaluated by the database
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL and Oracle subtract dates into a number of days
+        return super().as_sql(compiler, connection, template="(%(expressions)s)", arg_joiner=" - ", **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(", **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function="DATEDIFF", **extra_context)
+
+
+def late_fee_policy():
+    # Return (daily rate, grace days) from settings
+    rate = Decimal(str(getattr(settings, "LATE_FEE_DAILY_RATE", DEFAULT_LATE_FEE_DAILY_RATE)))
+    grace_days = int(getattr(settings, "LATE_FEE_GRACE_DAYS", DEFAULT_LATE_FEE_GRACE_DAYS))
+    return rate, grace_days
+
+
+def loan_id_ranges(chunk_size=DEFAULT_CHUNK_SIZE, shard=0, shards=1):
+    # Split the Loan primary key space into [start, end) ranges; with shards > 1 only every
+    # shards-th range starting at `shard` is returned, so separate processes can share the work
+    bounds = Loan.objects.filter(status="ACTIVE").aggregate(low=Min("id"), high=Max("id"))
+    low, high = bounds["low"], bounds["high"]
+    if low is None:
+        return []
+    ranges = [(start, start + chunk_size) for start in range(low, high + 1, chunk_size)]
+    return ranges[shard::shards]
+
+
+def age_loan_range(start, end, as_of, rate, grace_days):
+    # Age the active loans with start <= id < end as of the given date with set-based UPDATEs.
+    # Returns the number of installments that are overdue afterwards.
+    from .portfolio import record_closures  # portfolio imports virtual_schedule, which imports this module
+
+    as_of_value = Value(as_of, output_field=DateField())
+    loan_ids = Loan.objects.filter(id__gte=start, id__lt=end, status="ACTIVE").values("loan_id")
+    installments = PaymentSchedule.objects.filter(loan_id__in=Subquery(loan_ids), status__in=UNPAID_STATUSES)
+    days_past_due = DaysBetween(as_of_value, F("due_date"))
+    money = DecimalField(max_digits=10, decimal_places=2)
+
+    with transaction.atomic():
+        # Installments past their due date: overdue, with days past due and the accrued late fee
+        overdue = installments.filter(due_date__lt=as_of).update(
+            status="OVERDUE",
+            days_past_due=days_past_due,
+            late_fee=Round(
+                (F("principal_component") + F("interest_component"))
+                * Value(rate, output_field=DecimalField(max_digits=12, decimal_places=8))
+                * Greatest(days_past_due - Value(grace_days), Value(0)),
+                2,
+                output_field=money,
+            ),
+        )
+
+        # Installments not due yet (only changes anything when re-running for an earlier date)
+        installments.filter(status="OVERDUE", due_date__gte=as_of).update(status="PENDING", days_past_due=0, late_fee=0)
+
+        # Loans: next due date is the earliest unpaid installment; loans with nothing left to pay are closed,
+        # and move to the CLOSED portfolio bucket (locked first, so a concurrent payment cannot close them too)
+        loans = Loan.objects.filter(id__gte=start, id__lt=end, status="ACTIVE")
+        record_closures(loans.closable().select_for_update().only("created_at", "amount", "total_interest"))
+        loans.refresh_due_state()
+    return overdue
+
+
+def _age_ranges(ranges, as_of, rate, grace_days):
+    # Age a list of ranges on this thread's own database connection
+    try:
+        return sum(age_loan_range(start, end, as_of, rate, grace_days) for start, end in ranges)
+    finally:
+        connections.close_all()
+
+
+def run_overdue(as_of=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, shard=0, shards=1):
+    # Age all active loans (or one shard of them) as of a date, today by default.
+    # Returns (number of loan id ranges processed, overdue installments).
+    as_of = as_of or now().date()
+    rate, grace_days = late_fee_policy()
+    ranges = loan_id_ranges(chunk_size, shard, shards)
+
+    if workers <= 1:
+        overdue = sum(age_loan_range(start, end, as_of, rate, grace_days) for start, end in ranges)
+    else:
+        # Each thread works on its own connection; the database does the heavy lifting in parallel
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            overdue = sum(executor.map(
+                _age_ranges, [ranges[index::workers] for index in range(workers)],
+                [as_of] * workers, [rate] * workers, [grace_days] * workers,
+            ))
+    loans_changed()  # Statuses, fees and due dates may have moved for anyone
+    return len(ranges), overdue
@@ -0,0 +1,89 @@
+# File: pagination.py
+# Description: Keyset (cursor) pagination for loan lists ordered by (created_at, id), newest first.
+
+import base64
+import json
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+# Page size used when LOAN_PAGE_SIZE is not configured, and the largest page a client may request
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at, pk):
+    # Build an opaque cursor pointing just after the given row
+    payload = json.dumps([created_at.isoformat(), pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Decode a cursor produced by encode_cursor, raising ValueError if it was tampered with
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, pk = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def page_size(value):
+    # Parse the requested page size, applying the configured default and the upper bound
+    if value in (None, ""):
+        return getattr(settings, "LOAN_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer.")
+    if size < 1:
+        raise ValueError("limit must be at least 1.")
+    return min(size, MAX_PAGE_SIZE)
+
+
+def _row_value(row, name):
+    # Read a field from a model instance or a .values() dict
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def paginate_loans(queryset, params):
+    # Return (rows, next_cursor) for one page. Rows are ordered by (created_at, id) descending and the
+    # cursor condition is a plain range predicate, so every page costs the same as the first one.
+    limit = page_size(params.get("limit"))
+    queryset = queryset.order_by("-created_at", "-id")
+
+    cursor = params.get("cursor")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_row_value(rows[-1], "created_at"), _row_value(rows[-1], "id"))
+    return rows, next_cursor
+
+
+def wants_total(params):
+    # True when the client asked for an (approximate) total count
+    return str(params.get("include_total", "")).lower() in ("1", "true", "yes")
+
+
+def estimate_count(queryset):
+    # Approximate the number of matching rows. PostgreSQL answers from the planner's estimate
+    # without scanning; other databases fall back to an exact COUNT.
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, sql_params = queryset.values("id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}", sql_params)
+        plan = cursor.fetchone()[0]
+    match = re.search(r"rows=(\d+)", plan)
+    return int(match.group(1)) if match else None
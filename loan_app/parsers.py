@@ -0,0 +1,24 @@
+# File: parsers.py
+# Description: Request parsers for bulk API payloads.
+
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .origination import parse_applications
+
+
+# Parser for newline-delimited JSON request bodies
+class NDJSONParser(BaseParser):
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # Decode the body and return one parsed object per non-empty line
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            return parse_applications(codecs.getreader(encoding)(stream))
+        except ValueError as exc:
+            raise ParseError(f"NDJSON parse error - {exc}")
@@ -0,0 +1,226 @@
+# File: payments.py
+# Description: Atomic installment payments: single payments and batches allocated across unpaid installments.
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+
+from .counters import counter_values
+from .models import UNPAID_STATUSES, Loan, PaymentSchedule
+from .portfolio import record_payments
+from .response_cache import loans_changed
+from .virtual_schedule import (
+    installment_ref, next_due_date, parse_installment_ref, schedule_rows, unpaid_numbers, virtual_schedule,
+    with_paid,
+)
+
+
+class PaymentError(Exception):
+    # Raised when a payment cannot be applied; `status` is the HTTP status to answer with
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _lock_loan(user, not_found="Loan not found.", **lookup):
+    # Lock and return the loan matching the lookup. Regular users can only reach their own loans.
+    loans = Loan.objects.select_for_update(of=("self",))
+    if user.role != "admin":
+        loans = loans.filter(user_id=user.pk)
+    loan = loans.filter(**lookup).first()
+    if loan is None:
+        raise PaymentError(not_found, status=404)
+    return loan
+
+
+def _paid_totals(count, late_fees):
+    # Counter expressions after paying `count` more installments and `late_fees` on them, computed from
+    # the row's current column values, never from memory
+    late_fees_paid = F("late_fees_paid") + late_fees
+    return {"late_fees_paid": late_fees_paid, **counter_values(F("paid_installments") + count, late_fees_paid)}
+
+
+def virtual_late_fees(loan):
+    # Late fee of each unpaid installment of a virtual-schedule loan, as of today
+    return {installment.installment_number: installment.late_fee for installment in virtual_schedule(loan)}
+
+
+def _record_payments(loan, payment_ids):
+    # Mark the (already locked) installments paid, collecting their late fees, and update the loan's totals,
+    # due date and status with one UPDATE each, then move the amounts between portfolio buckets
+    installments = PaymentSchedule.objects.filter(pk__in=payment_ids)
+    rows = list(installments.values_list("due_date", "principal_component", "interest_component", "late_fee"))
+    installments.update(status="PAID")
+    loans = Loan.objects.filter(pk=loan.pk)
+    loans.refresh_due_state(**_paid_totals(len(payment_ids), sum((row[3] for row in rows), Decimal("0"))))
+    closed = loan.status == "ACTIVE" and loans.filter(status="CLOSED").exists()
+    record_payments(loan, [row[:3] for row in rows], closed)
+    loans_changed([loan.user_id])
+
+
+def _record_virtual_payments(loan, numbers):
+    # Virtual schedule: set the installments' bits in the (locked) loan's bitmap with a single UPDATE,
+    # collecting the late fees they accrued
+    late_fees = virtual_late_fees(loan)
+    mask = with_paid(loan.paid_mask, numbers)
+    due_date = next_due_date(loan, mask)
+    Loan.objects.filter(pk=loan.pk).update(
+        paid_mask=mask,
+        next_due_date=due_date,
+        status=loan.status if due_date else "CLOSED",
+        version=F("version") + 1,
+        **_paid_totals(len(numbers), sum((late_fees[number] for number in numbers), Decimal("0"))),
+    )
+    rows = schedule_rows(loan)
+    record_payments(loan, [rows[number - 1][1:4] for number in numbers], loan.status == "ACTIVE" and not due_date)
+    loans_changed([loan.user_id])
+
+
+def pay_installment(user, payment_id):
+    # Pay one installment in a single transaction (4 statements, whatever the schedule size).
+    # Concurrent requests for the same loan are serialized by the loan row lock.
+    reference = parse_installment_ref(payment_id)
+    if reference is not None:
+        return _pay_virtual_installment(user, *reference)
+
+    with transaction.atomic():
+        loan = _lock_loan(user, "Payment not found.", schedule__pk=payment_id)
+        payment = PaymentSchedule.objects.select_for_update().filter(pk=payment_id).values("status").first()
+        if payment["status"] not in UNPAID_STATUSES:
+            raise PaymentError("Payment already made.")
+        _record_payments(loan, [payment_id])
+
+
+def _pay_virtual_installment(user, loan_id, number):
+    # Pay installment `number` of a virtual-schedule loan (2 statements)
+    with transaction.atomic():
+        loan = _lock_loan(user, "Payment not found.", loan_id=loan_id, schedule_mode="VIRTUAL")
+        if not 1 <= number <= loan.tenure:
+            raise PaymentError("Payment not found.", status=404)
+        if number not in unpaid_numbers(loan):
+            raise PaymentError("Payment already made.")
+        _record_virtual_payments(loan, [number])
+
+
+def _virtual_installment_numbers(loan, payment_ids):
+    # Installment numbers addressed by "<loan_id>-<number>" references, or None if any is not for this loan
+    numbers = set()
+    for payment_id in payment_ids:
+        reference = parse_installment_ref(str(payment_id))
+        if reference is None or reference[0] != loan.loan_id:
+            return None
+        numbers.add(reference[1])
+    return numbers
+
+
+def parse_amount(value):
+    # Parse a positive payment amount
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise PaymentError("Invalid amount.")
+    if not amount.is_finite() or amount <= 0:
+        raise PaymentError("Amount must be positive.")
+    return amount
+
+
+def allocate_payment(user, loan_id, amount=None, payment_ids=None):
+    # Apply a payment to a loan in one transaction, either as an amount spread over unpaid installments
+    # in installment order (whole installments only) or as an explicit list of installment ids.
+    # Each installment costs its EMI plus the late fee it accrued, which is collected first. Returns a result
+    # dict with the paid installment numbers, the amount applied (late fees included) and the part of the
+    # amount left over (not taken).
+    if (amount is None) == (payment_ids is None):
+        raise PaymentError("Provide either an amount or a list of payment_ids.")
+    if amount is not None:
+        amount = parse_amount(amount)
+    elif not isinstance(payment_ids, list) or not payment_ids:
+        raise PaymentError("payment_ids must be a non-empty list.")
+
+    with transaction.atomic():
+        loan = _lock_loan(user, loan_id=loan_id)
+        if loan.is_virtual:
+            selected = _select_virtual(loan, amount, payment_ids)
+            _record_virtual_payments(loan, [number for _, number, _ in selected])
+            return _allocation_result(loan, selected, amount)
+
+        if payment_ids is not None:
+            try:
+                payment_ids = {int(payment_id) for payment_id in payment_ids}
+            except (TypeError, ValueError):
+                raise PaymentError("payment_ids must be a list of integers.")
+
+        unpaid = PaymentSchedule.objects.select_for_update().filter(
+            loan_id=loan.loan_id, status__in=UNPAID_STATUSES
+        ).order_by("installment_number")
+
+        if amount is not None:
+            count = int(amount // loan.monthly_installment) if loan.monthly_installment > 0 else 0
+            selected = _affordable(loan, unpaid.values_list("pk", "installment_number", "late_fee")[:count], amount)
+            if not selected:
+                raise PaymentError("Amount does not cover the next installment.")
+        else:
+            selected = list(unpaid.filter(pk__in=payment_ids).values_list("pk", "installment_number", "late_fee"))
+            if len(selected) != len(payment_ids):
+                raise PaymentError("Some payments are not unpaid installments of this loan.")
+
+        _record_payments(loan, [pk for pk, _, _ in selected])
+    return _allocation_result(loan, selected, amount)
+
+
+def _select_virtual(loan, amount, payment_ids):
+    # (reference, installment number, late fee) triples to pay on a virtual-schedule loan
+    unpaid = unpaid_numbers(loan)
+    late_fees = virtual_late_fees(loan)
+    if amount is not None:
+        selected = _affordable(loan, [(installment_ref(loan.loan_id, number), number, late_fees[number])
+                                      for number in unpaid], amount)
+        if not selected:
+            raise PaymentError("Amount does not cover the next installment.")
+        return selected
+    requested = _virtual_installment_numbers(loan, payment_ids)
+    if requested is None or not requested <= set(unpaid):
+        raise PaymentError("Some payments are not unpaid installments of this loan.")
+    return [(installment_ref(loan.loan_id, number), number, late_fees[number]) for number in sorted(requested)]
+
+
+def _affordable(loan, installments, amount):
+    # The leading (key, installment number, late fee) installments the amount pays in full, fees included
+    selected, total = [], Decimal("0")
+    for installment in installments:
+        total += loan.monthly_installment + installment[2]
+        if total > amount:
+            break
+        selected.append(installment)
+    return selected
+
+
+def _allocation_result(loan, selected, amount):
+    late_fees = sum((late_fee for _, _, late_fee in selected), Decimal("0"))
+    applied = loan.monthly_installment * len(selected) + late_fees
+    return {
+        "loan_id": loan.loan_id,
+        "paid_installments": [number for _, number, _ in selected],
+        "amount_applied": applied,
+        "late_fees_paid": late_fees,
+        "unallocated": amount - applied if amount is not None else Decimal("0"),
+    }
+
+
+def allocate_payments(user, items):
+    # Apply a list of payment requests ({"loan_id", "amount" | "payment_ids"}), each in its own
+    # transaction. Returns one result dict per item, in input order.
+    results = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("loan_id"):
+            results.append({"index": index, "success": False, "error": "Each payment needs a loan_id."})
+            continue
+        try:
+            result = allocate_payment(user, item["loan_id"], item.get("amount"), item.get("payment_ids"))
+        except PaymentError as e:
+            results.append({"index": index, "success": False, "loan_id": item["loan_id"], "error": e.message})
+        else:
+            results.append({"index": index, "success": True, **result})
+    return results
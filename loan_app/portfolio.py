@@ -0,0 +1,308 @@
+# File: portfolio.py
+# Description: Portfolio summary buckets maintained incrementally with upserts, plus a parallel full rebuild.
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, DateField, F, Max, Min, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import localtime, now
+
+from .models import Loan, PaymentSchedule, PortfolioBucket
+from .virtual_schedule import paid_numbers, schedule_rows
+
+# Loans aggregated per rebuild query
+DEFAULT_CHUNK_SIZE = 20000
+
+ZERO = Decimal("0")
+
+
+def month_of(value):
+    # First day of the month of a date or (aware) datetime, in the current time zone like TruncMonth
+    if isinstance(value, datetime):
+        value = localtime(value).date()
+    return value.replace(day=1)
+
+
+class PortfolioDelta:
+    # Accumulates changes to portfolio buckets so they can be applied with a single statement
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [0, ZERO, ZERO])
+
+    def add(self, kind, month, status, count, principal, interest):
+        bucket = self.buckets[(kind, month, status)]
+        bucket[0] += count
+        bucket[1] += Decimal(principal)
+        bucket[2] += Decimal(interest)
+
+    def loan(self, loan, status, sign=1):
+        # Count a loan (sign=1) or take it out again (sign=-1)
+        self.add("LOAN", month_of(loan.created_at), status, sign, sign * Decimal(loan.amount), sign * loan.total_interest)
+
+    def installments(self, rows, status, sign=1):
+        # Count installments given as (due_date, principal, interest) rows under DUE or PAID
+        for due_date, principal, interest in rows:
+            self.add("INSTALLMENT", month_of(due_date), status, sign, sign * principal, sign * interest)
+
+    def new_loan(self, loan, rows):
+        # A created loan: the loan itself and all of its installments, still due
+        self.loan(loan, loan.status)
+        self.installments(rows, "DUE")
+
+    def paid(self, rows):
+        # Installments moving from DUE to PAID
+        self.installments(rows, "DUE", -1)
+        self.installments(rows, "PAID")
+
+    def closed(self, loan):
+        # A loan moving from ACTIVE to CLOSED
+        self.loan(loan, "ACTIVE", -1)
+        self.loan(loan, "CLOSED")
+
+    def waived(self, loan, sign=1):
+        # Interest a foreclosed loan was let off (its foreclosure discount), kept apart from collections
+        self.add("LOAN", month_of(loan.created_at), "WAIVED", sign, ZERO, sign * loan.foreclosure_discount)
+
+    def merge(self, other):
+        for key, (count, principal, interest) in other.buckets.items():
+            self.add(*key, count, principal, interest)
+
+    def apply(self, using="default"):
+        # Add the accumulated changes to the stored buckets (INSERT ... ON CONFLICT DO UPDATE). Rows go in
+        # bucket key order, so concurrent upserts lock shared buckets in the same order and cannot deadlock.
+        rows = sorted(
+            (
+                (kind, month, status, count, principal, interest)
+                for (kind, month, status), (count, principal, interest) in self.buckets.items()
+                if count or principal or interest
+            ),
+            key=lambda row: row[:3],
+        )
+        if rows:
+            _upsert(rows, using)
+        self.buckets.clear()
+
+    def apply_on_commit(self, using="default"):
+        # Apply once the current transaction commits, as a statement of its own: every origination and payment
+        # touches this month's buckets, which would otherwise stay locked until the end of each writer's
+        # transaction and serialize them all. A crash between the commit and the upsert leaves drift that
+        # rebuild_portfolio repairs.
+        transaction.on_commit(partial(self.apply, using), using=using)
+
+
+def _upsert(rows, using):
+    db = connections[using]
+    if db.vendor not in ("postgresql", "sqlite"):
+        # No portable increment-on-conflict; fall back to update-or-create per bucket
+        for kind, month, status, count, principal, interest in rows:
+            updated = PortfolioBucket.objects.using(using).filter(kind=kind, month=month, status=status).update(
+                count=F("count") + count, principal=F("principal") + principal, interest=F("interest") + interest
+            )
+            if not updated:
+                PortfolioBucket.objects.using(using).create(
+                    kind=kind, month=month, status=status, count=count, principal=principal, interest=interest
+                )
+        return
+
+    quote = db.ops.quote_name
+    table = quote(PortfolioBucket._meta.db_table)
+    columns = ", ".join(quote(name) for name in ("kind", "month", "status", "count", "principal", "interest"))
+    increments = ", ".join(
+        f"{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}" for name in ("count", "principal", "interest")
+    )
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+    params = []
+    for kind, month, status, count, principal, interest in rows:
+        params += [
+            kind, db.ops.adapt_datefield_value(month), status, count,
+            db.ops.adapt_decimalfield_value(principal), db.ops.adapt_decimalfield_value(interest),
+        ]
+    with db.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+            f"ON CONFLICT ({quote('kind')}, {quote('month')}, {quote('status')}) DO UPDATE SET {increments}",
+            params,
+        )
+
+
+def record_new_loans(loans_with_rows):
+    # Add created loans, given as (loan, [(due_date, principal, interest), ...]) pairs
+    delta = PortfolioDelta()
+    for loan, rows in loans_with_rows:
+        delta.new_loan(loan, rows)
+    delta.apply_on_commit()
+
+
+def record_payments(loan, rows, closed=False):
+    # Move paid installments from DUE to PAID, and the loan to CLOSED when the payment settled it
+    delta = PortfolioDelta()
+    delta.paid(rows)
+    if closed:
+        delta.closed(loan)
+    delta.apply_on_commit()
+
+
+def record_foreclosure(loan, rows):
+    # Settle a foreclosed loan's unpaid installments (given as rows) and close it. Installments move to PAID
+    # at their full amounts; the discount goes to the WAIVED bucket, which collections are net of.
+    delta = PortfolioDelta()
+    delta.paid(rows)
+    delta.closed(loan)
+    delta.waived(loan)
+    delta.apply_on_commit()
+
+
+def unpaid_rows(loan):
+    # (due_date, principal, interest) rows of the loan's unpaid installments
+    if loan.is_virtual:
+        paid = paid_numbers(loan.paid_mask)
+        return [(due_date, principal, interest) for number, due_date, principal, interest, _ in schedule_rows(loan)
+                if number not in paid]
+    return list(PaymentSchedule.objects.filter(loan_id=loan.loan_id).exclude(status="PAID").values_list(
+        "due_date", "principal_component", "interest_component"
+    ))
+
+
+def record_deleted_loan(loan):
+    # Take a loan and all of its installments out of the buckets (call before deleting it)
+    delta = PortfolioDelta()
+    delta.loan(loan, loan.status, -1)
+    if loan.foreclosure_date is not None:
+        delta.waived(loan, -1)
+    if loan.is_virtual:
+        paid = paid_numbers(loan.paid_mask)
+        for number, due_date, principal, interest, _ in schedule_rows(loan):
+            delta.installments([(due_date, principal, interest)], "PAID" if number in paid else "DUE", -1)
+    else:
+        for due_date, principal, interest, installment_status in PaymentSchedule.objects.filter(
+            loan_id=loan.loan_id
+        ).values_list("due_date", "principal_component", "interest_component", "status"):
+            delta.installments([(due_date, principal, interest)], "PAID" if installment_status == "PAID" else "DUE", -1)
+    delta.apply_on_commit()
+
+
+def record_closures(loans):
+    # Move loans about to be closed by refresh_due_state() (lock them first) from ACTIVE to CLOSED
+    delta = PortfolioDelta()
+    for loan in loans:
+        delta.closed(loan)
+    delta.apply_on_commit()
+
+
+def portfolio_summary(today=None):
+    # Read the buckets (one row per month and status) into the admin dashboard summary
+    today = today or now().date()
+    current_month = month_of(today)
+    loans = {status: {"count": 0, "principal": ZERO, "interest": ZERO} for status in ("ACTIVE", "CLOSED")}
+    installments = {status: {"count": 0, "principal": ZERO, "interest": ZERO} for status in ("DUE", "PAID")}
+    cash_flow = []
+    past_due = ZERO
+    waived = ZERO
+
+    for bucket in PortfolioBucket.objects.order_by("kind", "month", "status"):
+        totals = (loans if bucket.kind == "LOAN" else installments).setdefault(
+            bucket.status, {"count": 0, "principal": ZERO, "interest": ZERO}
+        )
+        totals["count"] += bucket.count
+        totals["principal"] += bucket.principal
+        totals["interest"] += bucket.interest
+        if bucket.kind == "LOAN" and bucket.status == "WAIVED":
+            waived += bucket.interest
+        if bucket.kind == "INSTALLMENT" and bucket.status == "DUE" and bucket.count:
+            if bucket.month < current_month:
+                past_due += bucket.principal + bucket.interest
+            else:
+                cash_flow.append({
+                    "month": bucket.month.strftime("%Y-%m"),
+                    "installments": bucket.count,
+                    "principal": bucket.principal,
+                    "interest": bucket.interest,
+                    "total": bucket.principal + bucket.interest,
+                })
+
+    return {
+        "active_loans": loans["ACTIVE"]["count"],
+        "closed_loans": loans["CLOSED"]["count"],
+        "disbursed_principal": loans["ACTIVE"]["principal"] + loans["CLOSED"]["principal"],
+        "outstanding_principal": installments["DUE"]["principal"],
+        "expected_interest_income": installments["DUE"]["interest"],
+        "collected": installments["PAID"]["principal"] + installments["PAID"]["interest"] - waived,
+        "interest_waived": waived,
+        "past_due": past_due,
+        "cash_flow": cash_flow,
+    }
+
+
+def _collect_range(start, end):
+    # Aggregate the loans with start <= id < end (and their installments) into a fresh delta
+    delta = PortfolioDelta()
+    loans = Loan.objects.filter(id__gte=start, id__lt=end)
+
+    for row in loans.annotate(month=TruncMonth("created_at", output_field=DateField())).values("month", "status").annotate(
+        count=Count("id"), principal=Sum("amount"), interest=Sum("total_interest")
+    ).order_by():
+        delta.add("LOAN", row["month"], row["status"], row["count"], row["principal"], row["interest"])
+
+    for row in loans.filter(foreclosure_date__isnull=False).annotate(
+        month=TruncMonth("created_at", output_field=DateField())
+    ).values("month").annotate(count=Count("id"), interest=Sum("foreclosure_discount")).order_by():
+        delta.add("LOAN", row["month"], "WAIVED", row["count"], ZERO, row["interest"])
+
+    materialized = loans.filter(schedule_mode="MATERIALIZED").values("loan_id")
+    for row in PaymentSchedule.objects.filter(loan_id__in=Subquery(materialized)).annotate(
+        month=TruncMonth("due_date"),
+        bucket=Case(When(status="PAID", then=Value("PAID")), default=Value("DUE")),
+    ).values("month", "bucket").annotate(
+        count=Count("id"), principal=Sum("principal_component"), interest=Sum("interest_component")
+    ).order_by():
+        delta.add("INSTALLMENT", row["month"], row["bucket"], row["count"], row["principal"], row["interest"])
+
+    for loan in loans.filter(schedule_mode="VIRTUAL"):
+        paid = paid_numbers(loan.paid_mask)
+        for number, due_date, principal, interest, _ in schedule_rows(loan):
+            delta.add("INSTALLMENT", month_of(due_date), "PAID" if number in paid else "DUE", 1, principal, interest)
+    return delta
+
+
+def _collect_ranges(ranges):
+    # Aggregate a list of ranges on this thread's own database connection
+    try:
+        delta = PortfolioDelta()
+        for start, end in ranges:
+            delta.merge(_collect_range(start, end))
+        return delta
+    finally:
+        connections.close_all()
+
+
+def rebuild_portfolio(chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    # Recompute every bucket from the loan and schedule tables, aggregating loan id ranges in parallel,
+    # then swap the result in with one transaction. Returns the number of buckets written.
+    bounds = Loan.objects.aggregate(low=Min("id"), high=Max("id"))
+    ranges = []
+    if bounds["low"] is not None:
+        ranges = [(start, start + chunk_size) for start in range(bounds["low"], bounds["high"] + 1, chunk_size)]
+
+    total = PortfolioDelta()
+    if workers <= 1:
+        for start, end in ranges:
+            total.merge(_collect_range(start, end))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for delta in executor.map(_collect_ranges, [ranges[index::workers] for index in range(workers)]):
+                total.merge(delta)
+
+    buckets = [
+        PortfolioBucket(kind=kind, month=month, status=status, count=count, principal=principal, interest=interest)
+        for (kind, month, status), (count, principal, interest) in total.buckets.items()
+        if count
+    ]
+    with transaction.atomic():
+        PortfolioBucket.objects.all().delete()
+        PortfolioBucket.objects.bulk_create(buckets)
+    return len(buckets)
@@ -0,0 +1,163 @@
+# File: projections.py
+# Description: Fast read-only serialization of list endpoints: serializer fields compiled into converters over values_list rows.
+
+import decimal
+from functools import cached_property
+from operator import attrgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import fields
+from rest_framework.settings import api_settings
+
+from .instrumentation import timed_serialization
+from .models import Loan, PaymentSchedule
+from .serializers import LoanSerializer, PaymentScheduleSerializer
+
+
+def _identity(value):
+    return value
+
+
+def _decimal_converter(field):
+    # DecimalField.to_representation; values already at the field's scale (as databases return them) skip
+    # the quantize() call
+    as_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    places = field.decimal_places
+    Decimal = decimal.Decimal
+
+    def convert(value):
+        if type(value) is not Decimal:
+            value = Decimal(str(value).strip())
+        text = format(value, "f")
+        point = text.rfind(".")
+        if (len(text) - point - 1 if point >= 0 else 0) != places:
+            value = field.quantize(value)
+            text = format(value, "f")
+        return text if as_string else value
+    return convert
+
+
+def _datetime_converter(field, default_timezone):
+    # DateTimeField.to_representation in ISO 8601, in the field's (or the current) time zone
+    zone = getattr(field, "timezone", default_timezone)
+    if zone is None:
+        return None
+
+    def convert(value):
+        if timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(zone).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return convert
+
+
+def _converter(field, default_timezone):
+    # Function turning a non-None attribute into what field.to_representation() returns, or None when the
+    # field needs the generic path
+    kind = type(field)
+    if kind is fields.DecimalField and field.decimal_places is not None and not field.normalize_output and not field.localize:
+        return _decimal_converter(field)
+    if kind is fields.DateTimeField and getattr(field, "format", api_settings.DATETIME_FORMAT) == fields.ISO_8601:
+        return _datetime_converter(field, default_timezone)
+    if kind is fields.DateField and getattr(field, "format", api_settings.DATE_FORMAT) == fields.ISO_8601:
+        return lambda value: value.isoformat()
+    if kind is fields.ChoiceField:
+        if all(key == value for key, value in field.choice_strings_to_values.items()):
+            return _identity if field.choice_strings_to_values else None
+        return None
+    if kind is fields.CharField:
+        return lambda value: value if type(value) is str else str(value)
+    if kind is fields.IntegerField:
+        return lambda value: value if type(value) is int else int(value)
+    if kind is fields.FloatField:
+        return float
+    return None
+
+
+class Projection:
+    # The readable fields of a (non-nested) serializer, read from rows with matching attribute names
+    # (values_list(named=True) rows, __slots__ objects, model instances) and converted without field objects.
+    # Fields listed in `computed` are produced by a function of the row passed to compile().
+    def __init__(self, serializer_class, computed=()):
+        self.serializer_class = serializer_class
+        self.computed = set(computed)
+
+    @cached_property
+    def fields(self):
+        return [field for field in self.serializer_class().fields.values() if not field.write_only]
+
+    @cached_property
+    def columns(self):
+        # Attributes (and values_list lookups) the rows must provide
+        return tuple(field.source for field in self.fields if field.field_name not in self.computed)
+
+    def compile(self, **computed):
+        # Return a function turning one row into the serializer's output dict. Converters are bound to the
+        # current time zone, so compile once per response.
+        default_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        steps = []
+        for field in self.fields:
+            name = field.field_name
+            if name in self.computed:
+                steps.append((name, computed[name], _identity))
+                continue
+            convert = _converter(field, default_timezone)
+            if convert is None:
+                convert = field.to_representation
+            steps.append((name, attrgetter(field.source), convert))
+        steps = tuple(steps)
+
+        def project(row):
+            data = {}
+            for name, get, convert in steps:
+                value = get(row)
+                data[name] = None if value is None else convert(value)
+            return data
+        return project
+
+
+LOAN_PROJECTION = Projection(LoanSerializer, computed=("user", "payment_schedule"))
+SCHEDULE_PROJECTION = Projection(PaymentScheduleSerializer)
+
+# Loan columns read besides the serialized ones: the pagination cursor, the user, and what virtual
+# schedules are derived from
+LOAN_EXTRA_COLUMNS = (
+    "id", "created_at", "user__id", "user__username", "user__email", "schedule_mode", "schedule_start", "paid_mask",
+)
+
+# Loan fields a virtual schedule is derived from
+VIRTUAL_SCHEDULE_FIELDS = (
+    "loan_id", "amount", "tenure", "interest_rate", "monthly_installment", "schedule_mode", "schedule_start", "paid_mask",
+)
+
+
+def loan_rows(queryset):
+    # Named tuples with every column serialize_loans() needs, for paginate_loans() or direct iteration
+    return queryset.values_list(*dict.fromkeys(LOAN_EXTRA_COLUMNS + LOAN_PROJECTION.columns), named=True)
+
+
+def load_schedules(rows):
+    # Ordered installments of each loan row by loan_id: stored rows in one query, virtual ones derived
+    schedules = {row.loan_id: [] for row in rows if row.schedule_mode != "VIRTUAL"}
+    if schedules:
+        for installment in PaymentSchedule.objects.filter(loan_id__in=list(schedules)).order_by(
+            "loan_id", "installment_number"
+        ).values_list("loan_id", *SCHEDULE_PROJECTION.columns, named=True):
+            schedules[installment.loan_id].append(installment)
+    for row in rows:
+        if row.schedule_mode == "VIRTUAL":
+            loan = Loan(**{name: getattr(row, name) for name in VIRTUAL_SCHEDULE_FIELDS})
+            schedules[row.loan_id] = loan.installments()
+    return schedules
+
+
+def serialize_loans(rows, schedules):
+    # LoanSerializer(many=True).data for loan_rows() rows and their load_schedules(), with the same JSON
+    with timed_serialization():
+        installment = SCHEDULE_PROJECTION.compile()
+        project = LOAN_PROJECTION.compile(
+            user=lambda row: {"id": row.user__id, "username": row.user__username, "email": row.user__email},
+            payment_schedule=lambda row: [installment(item) for item in schedules[row.loan_id]],
+        )
+        return [project(row) for row in rows]
@@ -0,0 +1,185 @@
+# File: query_budget.py
+# Description: Query budgets for views and code blocks, with detection of repeated same-shape (N+1) queries.
+
+import logging
+import re
+import traceback
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Executions of one query shape allowed in a budgeted block before they are reported as an N+1 pattern
+DEFAULT_REPEAT_LIMIT = 3
+
+# Stack frames shown for a repeated query
+STACK_DEPTH = 6
+
+# Budgets open in this context, outermost first
+_active = ContextVar("query_budgets", default=())
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")  # Literals the ORM inlines (LIMIT / OFFSET)
+
+
+class QueryBudgetExceeded(AssertionError):
+    # Raised in "raise" mode; an AssertionError so that tests report it as a failure
+    pass
+
+
+def query_mode():
+    # "off" (nothing recorded), "warn" (log problems) or "raise"
+    return getattr(settings, "QUERY_BUDGET_MODE", "off")
+
+
+def query_shape(sql):
+    # SQL with parameter lists and inlined numbers folded, so that one query per row has one shape
+    return _NUMBER.sub("N", _IN_LIST.sub("IN (...)", sql))
+
+
+def record_query(execute, sql, params, many, context):
+    # Execute wrapper installed on every database connection (see signals.py): counts the statement in
+    # every open budget. A budget with repeats=False hides repeats from the budgets around it.
+    budgets = _active.get()
+    if budgets:
+        shape = query_shape(sql)
+        track_repeats = True
+        for budget in reversed(budgets):
+            budget.record(shape, track_repeats)
+            track_repeats = track_repeats and budget.repeats is not False
+    return execute(sql, params, many, context)
+
+
+def _caller_stack():
+    # Innermost project frames leading to the current query (library frames when there are none)
+    frames = traceback.extract_stack()[:-3]
+    base = str(settings.BASE_DIR)
+    own = [frame for frame in frames if frame.filename.startswith(base) and frame.filename != __file__]
+    return "".join(traceback.format_list((own or frames)[-STACK_DEPTH:]))
+
+
+class QueryBudget:
+    # Context manager recording the queries run on any database connection inside it, then checking them
+    # against `limit` (None: no limit) and the repeat limit (`repeats=False`: views that work item by item on
+    # purpose). Also usable as a decorator (see query_budget).
+    def __init__(self, limit=None, repeats=None, name=None, mode=None):
+        self.limit = limit
+        self.repeats = repeats if repeats is not None else getattr(
+            settings, "QUERY_BUDGET_REPEAT_LIMIT", DEFAULT_REPEAT_LIMIT
+        )
+        self.name = name
+        self.mode = mode
+        self.count = 0
+        self.shapes = {}  # shape -> executions
+        self.stacks = {}  # shape -> stack of its first repeat
+        self.problems = []
+
+    def __call__(self, func):
+        # Decorate a view (or method, sync or async): each call is checked in a fresh budget when the mode is not "off".
+        # The declaration is kept on the wrapper as `query_budget`.
+        def budget():
+            return QueryBudget(self.limit, self.repeats, self.name or func.__qualname__, self.mode)
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if (self.mode or query_mode()) == "off":
+                    return await func(*args, **kwargs)
+                with budget():
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if (self.mode or query_mode()) == "off":
+                    return func(*args, **kwargs)
+                with budget():
+                    return func(*args, **kwargs)
+        wrapper.query_budget = self
+        return wrapper
+
+    def __enter__(self):
+        self._token = None
+        if (self.mode or query_mode()) != "off":
+            self._token = _active.set(_active.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._token is not None:
+            _active.reset(self._token)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def record(self, shape, track_repeats=True):
+        self.count += 1
+        if not track_repeats:
+            return
+        executions = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if executions == 2:
+            self.stacks[shape] = _caller_stack()
+
+    def check(self):
+        name = self.name or "block"
+        if self.limit is not None and self.count > self.limit:
+            self.problems.append(f"{name}: {self.count} queries, budget is {self.limit}")
+        for shape, executions in self.shapes.items():
+            if self.repeats is not False and executions > self.repeats:
+                self.problems.append(
+                    f"{name}: the same query ran {executions} times (possible N+1):\n    {shape}\n"
+                    f"  first repeated at:\n{self.stacks[shape]}"
+                )
+        if not self.problems:
+            return
+        if (self.mode or query_mode()) == "raise":
+            raise QueryBudgetExceeded("\n".join(self.problems))
+        for problem in self.problems:
+            logger.warning(problem)
+
+
+def query_budget(limit=None, repeats=None, name=None, mode=None):
+    # @query_budget(3) on a view method (or above @api_view on a function view) declares and, when
+    # QUERY_BUDGET_MODE is "warn" or "raise", enforces its budget; `with query_budget(3):` checks a block
+    return QueryBudget(limit, repeats, name, mode)
+
+
+def declared_budget(view, method):
+    # Budget declared for `method` of a resolved view callable (None when undeclared)
+    budget = getattr(view, "query_budget", None)
+    if budget is None:
+        handler = getattr(getattr(view, "view_class", None), method.lower(), None)
+        budget = getattr(handler, "query_budget", None)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    # Middleware mode: checks whole requests (middleware and authentication included) for repeated query
+    # shapes, and against QUERY_BUDGET_REQUEST_LIMIT when set. Declared view budgets are checked by the
+    # views themselves; repeats inside a view declared with repeats=False are not reported here either.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _budget(self, request):
+        return QueryBudget(getattr(settings, "QUERY_BUDGET_REQUEST_LIMIT", None), name=f"{request.method} {request.path}")
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if query_mode() == "off":
+            return self.get_response(request)
+        with self._budget(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if query_mode() == "off":
+            return await self.get_response(request)
+        with self._budget(request):
+            return await self.get_response(request)
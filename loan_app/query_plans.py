@@ -0,0 +1,97 @@
+# File: query_plans.py
+# Description: EXPLAIN-based regression checks making sure hot-path queries are served by indexes.
+
+import re
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .models import UNPAID_STATUSES, Loan, PaymentSchedule
+from .pagination import DEFAULT_PAGE_SIZE
+
+# Plan lines that mean a table is read from start to end (PostgreSQL / SQLite)
+SEQUENTIAL_SCAN_PATTERNS = [
+    re.compile(r"Seq Scan on (\w+)"),
+    re.compile(r"\bSCAN (\w+)(?! USING)(?:\s|$)"),
+]
+
+
+def hot_queries():
+    # Return (name, queryset, index) triples mirroring the queries issued by the busiest code paths, with the
+    # index each one is meant to use (None: the loan foreign key's, whose name is generated).
+    # Sample keys are taken from the current database, which must contain at least one loan.
+    loan = Loan.objects.order_by("id").first()
+    if loan is None:
+        raise ValueError("The database has no loans; seed it before checking query plans.")
+    today = now().date()
+    # SQLite cannot tell that "status IN (?, ?)" with bound values satisfies the partial index's condition
+    unpaid_index = "schedule_unpaid_idx" if connections[Loan.objects.db].vendor == "postgresql" else None
+
+    return [
+        ("pay_installment: next pending installment",
+         PaymentSchedule.objects.filter(loan=loan, status__in=UNPAID_STATUSES).order_by("installment_number")[:1],
+         unpaid_index),
+        ("loan_details_view: ordered schedule",
+         PaymentSchedule.objects.filter(loan=loan).order_by("installment_number"), None),
+        ("counters: paid installments",
+         PaymentSchedule.objects.filter(loan=loan, status="PAID").values("id"), "schedule_loan_status_idx"),
+        ("foreclosure_quote: installments due so far",
+         PaymentSchedule.objects.filter(loan=loan, due_date__lte=today), "schedule_loan_due_idx"),
+        ("exports, AdminLoanListView: schedules of a chunk of loans",
+         PaymentSchedule.objects.filter(loan_id__in=[loan.loan_id]).order_by("loan_id", "installment_number"), None),
+        ("ForecloseLoanView: user's active loan",
+         Loan.objects.filter(user_id=loan.user_id, status="ACTIVE"), "loan_user_status_idx"),
+        ("LoanView.get: first page",
+         Loan.objects.filter(user_id=loan.user_id).order_by("-created_at", "-id")[:DEFAULT_PAGE_SIZE + 1],
+         "loan_user_created_idx"),
+        ("AdminLoanListView: first page",
+         Loan.objects.order_by("-created_at", "-id")[:DEFAULT_PAGE_SIZE + 1], "loan_created_id_idx"),
+        ("AdminLoanListView: later page",
+         Loan.objects.filter(
+             Q(created_at__lt=loan.created_at) | Q(created_at=loan.created_at, id__lt=loan.id)
+         ).order_by("-created_at", "-id")[:DEFAULT_PAGE_SIZE + 1], "loan_created_id_idx"),
+        ("Active loans due soon",
+         Loan.objects.filter(status="ACTIVE", next_due_date__lte=today + timedelta(days=7)), "loan_active_due_idx"),
+    ]
+
+
+def explain(queryset):
+    # Return the query plan text. On PostgreSQL sequential scans are priced out of the planner's
+    # choices, so a "Seq Scan" in the plan means no usable index exists at all.
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.explain()
+    with transaction.atomic(using=queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+
+def find_sequential_scans(plan):
+    # Return the names of tables the plan reads sequentially
+    tables = []
+    for pattern in SEQUENTIAL_SCAN_PATTERNS:
+        tables.extend(pattern.findall(plan))
+    return tables
+
+
+def missing_index(plan, index):
+    # Whether the plan does not read through the expected index (any index will do for None)
+    return index is not None and re.search(rf"\b{index}\b", plan) is None
+
+
+def check_query_plans():
+    # Explain every hot query; return a list of (name, plan, problems), where problems lists the sequentially
+    # scanned tables and the expected index when the plan does not use it. Sequential scans are priced out on
+    # PostgreSQL, so any index passes the first check; the second one tells whether the intended index is
+    # the cheapest the planner found.
+    results = []
+    for name, queryset, index in hot_queries():
+        plan = explain(queryset)
+        problems = find_sequential_scans(plan)
+        if missing_index(plan, index):
+            problems.append(f"not using {index}")
+        results.append((name, plan, problems))
+    return results
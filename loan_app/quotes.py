@@ -0,0 +1,96 @@
+# File: quotes.py
+# Description: Anonymous loan quotes (EMI, interest, optional schedule) for one loan or a tenure x rate grid.
+
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from .amortization import amortize_batch, calculate_loan_terms, cents_to_decimal, due_dates
+
+# Bounds keeping a single request cheap
+MAX_AMOUNT = 99_999_999  # Largest amount a Loan can store
+MAX_TENURE = 600  # Months
+MAX_INTEREST_RATE = 100  # Percent per year
+MAX_GRID_CELLS = 400  # Quotes per request
+MAX_SCHEDULE_CELLS = 24  # Quotes per request that may include a full schedule
+
+# Entries kept in each memo when QUOTE_MEMO_SIZE / QUOTE_SCHEDULE_MEMO_SIZE are not configured. A schedule
+# entry holds three columns of up to MAX_TENURE cents (about 65 KB), so far fewer of them are kept.
+DEFAULT_MEMO_SIZE = 4096
+DEFAULT_SCHEDULE_MEMO_SIZE = 64
+
+
+@lru_cache(maxsize=getattr(settings, "QUOTE_MEMO_SIZE", DEFAULT_MEMO_SIZE))
+def quote_terms(amount, tenure, interest_rate):
+    # Memoized (monthly_installment, total_interest, total_payable), exactly as LoanView.post stores them
+    terms = calculate_loan_terms(amount, tenure, interest_rate)
+    return terms["monthly_installment"], terms["total_interest"], terms["total_payable"]
+
+
+@lru_cache(maxsize=getattr(settings, "QUOTE_SCHEDULE_MEMO_SIZE", DEFAULT_SCHEDULE_MEMO_SIZE))
+def quote_schedule(amount, tenure, interest_rate):
+    # Memoized (principal, interest, balance) cent columns; they do not depend on the start date
+    schedule = amortize_batch([(amount, tenure, interest_rate, quote_terms(amount, tenure, interest_rate)[0])])[0]
+    return tuple(schedule.principal), tuple(schedule.interest), tuple(schedule.balance)
+
+
+def parse_values(value, field, low, high):
+    # Parse an integer or a list of integers (JSON list or comma-separated string) within [low, high].
+    # Raises ValueError with a readable message.
+    if isinstance(value, str):
+        value = [part for part in value.split(",") if part.strip()]
+    values = value if isinstance(value, list) else [value]
+    if not values or values == [None]:
+        raise ValueError(f"{field} is required.")
+    try:
+        numbers = [int(item) for item in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer or a list of integers.")
+    if any(number < low or number > high for number in numbers):
+        raise ValueError(f"{field} must be between {low} and {high}.")
+    return list(dict.fromkeys(numbers))  # Drop duplicates, keep order
+
+
+def _schedule_rows(amount, tenure, interest_rate, start_date):
+    principal, interest, balance = quote_schedule(amount, tenure, interest_rate)
+    return [
+        {
+            "installment_no": number,
+            "due_date": due_date.strftime("%Y-%m-%d"),
+            "amount": float(cents_to_decimal(principal_cents + interest_cents)),
+            "principal_component": cents_to_decimal(principal_cents),
+            "interest_component": cents_to_decimal(interest_cents),
+            "remaining_balance": cents_to_decimal(balance_cents),
+        }
+        for number, due_date, principal_cents, interest_cents, balance_cents in zip(
+            range(1, tenure + 1), due_dates(start_date, tenure), principal, interest, balance
+        )
+    ]
+
+
+def build_quotes(amount, tenures, interest_rates, with_schedule=False, start_date=None):
+    # Return one quote dict per (tenure, rate) pair, tenure-major. Raises ValueError for oversized grids.
+    cells = len(tenures) * len(interest_rates)
+    if cells > MAX_GRID_CELLS:
+        raise ValueError(f"At most {MAX_GRID_CELLS} quotes can be requested at once.")
+    if with_schedule and cells > MAX_SCHEDULE_CELLS:
+        raise ValueError(f"Schedules are available for at most {MAX_SCHEDULE_CELLS} quotes at once.")
+
+    start_date = start_date or now().date()
+    quotes = []
+    for tenure in tenures:
+        for interest_rate in interest_rates:
+            monthly_installment, total_interest, total_payable = quote_terms(amount, tenure, interest_rate)
+            quote = {
+                "amount": amount,
+                "tenure": tenure,
+                "interest_rate": interest_rate,
+                "monthly_installment": monthly_installment,
+                "total_interest": total_interest,
+                "total_amount": total_payable,
+            }
+            if with_schedule:
+                quote["payment_schedule"] = _schedule_rows(amount, tenure, interest_rate, start_date)
+            quotes.append(quote)
+    return quotes
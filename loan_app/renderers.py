@@ -0,0 +1,68 @@
+# File: renderers.py
+# Description: Response renderers for list endpoints.
+
+import msgpack
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .columnar import columnar_response
+
+try:
+    import orjson
+except ImportError:  # Optional: without it FastJSONRenderer renders like JSONRenderer
+    orjson = None
+
+# Line separators DRF escapes so that JSON stays a strict JavaScript subset (as UTF-8 bytes)
+LINE_SEPARATORS = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+
+# JSONRenderer producing the same bytes with orjson when it is installed and ORJSON_RENDERER is on.
+# Datetimes, Decimals and other non-JSON types still go through DRF's encoder. Known differences: floats
+# below 1e-4 or from 1e16 are written without the exponent sign and zero padding ("1e-5", "1e16"),
+# and NaN / infinity become null instead of failing.
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or not getattr(settings, "ORJSON_RENDERER", True) or data is None
+                or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:  # E.g. integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in content:
+                content = content.replace(separator, escaped)
+        return content
+
+
+# Lists of records in the columnar layout (see columnar.py), for bulk consumers:
+# Accept: application/vnd.loans.columnar+json or ?format=columnar
+class ColumnarJSONRenderer(FastJSONRenderer):
+    media_type = "application/vnd.loans.columnar+json"
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar_response(data), accepted_media_type, renderer_context)
+
+
+# The columnar layout as MessagePack: Accept: application/msgpack or ?format=msgpack. Values are the ones
+# the JSON renderers write (Decimals of numeric fields as floats, dates as ISO strings).
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(columnar_response(data), default=JSONEncoder().default, use_bin_type=True)
+
+
+# Renderers offered by list endpoints on top of JSON
+BULK_RENDERERS = [ColumnarJSONRenderer, MessagePackRenderer]
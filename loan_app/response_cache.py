@@ -0,0 +1,144 @@
+# File: response_cache.py
+# Description: Per-user cached loan list responses keyed on loan-set versions, with ETag revalidation.
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from .db_routing import primary_reads, sticky_seconds
+
+# Seconds a rendered response is kept when LOAN_RESPONSE_CACHE_TTL is not configured
+DEFAULT_TTL = 60
+
+# Loan-set version keys. Every loan write bumps its owner's version and "all" (admin lists); batch jobs that
+# touch any number of users bump "bulk", which every user's responses also depend on.
+ALL = "all"
+BULK = "bulk"
+
+
+def _cache():
+    # The response cache, or None when it is turned off
+    alias = getattr(settings, "LOAN_RESPONSE_CACHE", None)
+    return caches[alias] if alias is not None else None
+
+
+def _version_key(scope):
+    return f"loan-set:{scope}"
+
+
+def _bump(scopes):
+    # Versions are nanosecond timestamps, so they never repeat after an eviction
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    current = cache.get_many(keys)
+    stamp = time.time_ns()
+    cache.set_many({key: max(stamp, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def loans_changed(user_ids=None):
+    # Invalidate cached loan lists once the current transaction commits: those of the given users, or of
+    # everyone when user_ids is None (batch jobs)
+    if _cache() is None:
+        return
+    scopes = [ALL, BULK] if user_ids is None else [ALL, *(f"user:{user_id}" for user_id in set(user_ids))]
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _versions(scopes):
+    # Current versions of the scopes, starting any that are missing (never set or evicted) at "now"
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        stamp = time.time_ns()
+        for key in missing:
+            cache.add(key, stamp, None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def _recent(versions):
+    # Whether a loan set changed too recently for replicas to have the change. Responses are cached under
+    # the new version, so they must not be built from a lagging replica: not even for readers who are not
+    # sticky themselves (admins, users whose loans a batch job changed).
+    return time.time_ns() - max(versions) < sticky_seconds() * 1_000_000_000
+
+
+def _response_key(scopes, versions, response_format, path):
+    key_source = ":".join([*scopes, *map(str, versions), response_format, path])
+    return "loan-response:" + hashlib.sha256(key_source.encode()).hexdigest()
+
+
+def _entry(response):
+    # What is cached of a rendered response
+    return {
+        "content": response.content,
+        "content_type": response["Content-Type"],
+        "etag": '"%s"' % hashlib.sha256(response.content).hexdigest()[:32],
+    }
+
+
+def _conditional(request, entry, response=None):
+    # The cached (or just rendered) response with its ETag, or 304 when the client's copy is current.
+    # Revalidation is on the ETag only: dates have whole-second resolution, and two writes within a second
+    # would leave a client revalidating with If-Modified-Since on stale data.
+    if response is None:
+        response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    response["Cache-Control"] = "private, no-cache"  # Clients may keep it but must revalidate
+    patch_vary_headers(response, ["Accept", "Authorization"])
+    return get_conditional_response(request, etag=entry["etag"], response=response)
+
+
+def _ttl():
+    return getattr(settings, "LOAN_RESPONSE_CACHE_TTL", DEFAULT_TTL)
+
+
+def cached_loan_response(scopes):
+    # Decorator for APIView GET handlers whose response only depends on the request path, the negotiated
+    # format and the loan sets returned by scopes(request) (None: do not cache this request). Rendered
+    # 200 responses are cached until a version changes; a matching If-None-Match is answered with 304
+    # without running the handler. With the cache off, responses are rendered every time and a matching
+    # If-None-Match still gets a 304.
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            request_scopes = scopes(request)
+            if request_scopes is None:
+                return handler(view, request, *args, **kwargs)
+
+            key = entry = response = None
+            if _cache() is not None:
+                versions = _versions(request_scopes)
+                key = _response_key(request_scopes, versions, request.accepted_renderer.format, request.get_full_path())
+                entry = _cache().get(key)
+            if entry is None:
+                with primary_reads(key is not None and _recent(versions)):
+                    response = handler(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response = view.finalize_response(request, response, *args, **kwargs)
+                response.render()
+                entry = _entry(response)
+                if key is not None:
+                    _cache().set(key, entry, _ttl())
+            return _conditional(request._request, entry, response)
+        return wrapper
+    return decorator
+
+
+def user_scopes(request):
+    # A user's own loans
+    return [f"user:{request.user.pk}", BULK]
+
+
+def admin_scopes(request):
+    # Every loan; staff only, others get the view's own answer
+    return [ALL] if request.user.is_staff else None
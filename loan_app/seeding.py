@@ -0,0 +1,227 @@
+# File: seeding.py
+# Description: Deterministic synthetic data generator writing users, loans and schedules with multi-row INSERTs or COPY.
+
+import csv
+import io
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+from .amortization import amortize_batch, cents_to_decimal
+from .id_allocation import loan_numbers
+from .models import Loan, PaymentSchedule
+from .quotes import quote_terms
+
+# Get the active user model
+User = get_user_model()
+
+# Loans generated and written per task (one transaction each)
+DEFAULT_CHUNK_SIZE = 2000
+
+# Most rows per INSERT statement when COPY is not available
+INSERT_BATCH_SIZE = 5000
+
+# Columns written for each model, in row tuple order
+LOAN_FIELDS = (
+    "loan_id", "user_id", "amount", "tenure", "interest_rate", "monthly_installment", "total_interest",
+    "total_payable", "status", "amount_paid", "amount_remaining", "paid_installments", "next_due_date",
+    "created_at", "version", "schedule_mode", "paid_mask", "late_fees_paid",
+)
+SCHEDULE_FIELDS = (
+    "loan_id", "installment_number", "due_date", "principal_component", "interest_component",
+    "remaining_balance", "status", "days_past_due", "late_fee",
+)
+
+
+class SeedConfig:
+    # Distributions of the generated loans. Ranges are (low, high) tuples; tenures are (months, weight) pairs.
+    def __init__(self, seed=0, as_of=None, amount=(10_000, 1_000_000), amount_step=1000,
+                 tenures=((12, 4), (24, 3), (36, 2), (60, 1)), rate=(6, 18), paid=(0.0, 1.0)):
+        self.seed = seed
+        self.as_of = as_of or datetime.now(dt_timezone.utc).date()
+        self.amount = amount
+        self.amount_step = amount_step
+        self.tenures = [months for months, _ in tenures]
+        self.tenure_weights = [weight for _, weight in tenures]
+        self.rate = rate
+        self.paid = paid
+
+
+def parse_range(value, cast=int):
+    # "LOW:HIGH" (or a single value) -> (low, high)
+    low, _, high = str(value).partition(":")
+    low, high = cast(low), cast(high or low)
+    if high < low:
+        raise ValueError(f"Invalid range {value!r}: high is below low.")
+    return low, high
+
+
+def parse_weights(value):
+    # "12:4,24:3" -> ((12, 4), (24, 3)); weights default to 1
+    pairs = []
+    for part in str(value).split(","):
+        months, _, weight = part.strip().partition(":")
+        pairs.append((int(months), float(weight or 1)))
+    if not pairs or any(months < 1 or weight < 0 for months, weight in pairs):
+        raise ValueError(f"Invalid tenure distribution {value!r}.")
+    return tuple(pairs)
+
+
+def generate_chunk(config, chunk_index, loan_ids, user_ids):
+    # Loan and schedule row tuples for one chunk. Each chunk draws from its own generator seeded by
+    # (seed, chunk index), so the output does not depend on the number of workers or their order.
+    rng = random.Random(f"{config.seed}:{chunk_index}")
+    log_low, log_high = math.log(config.amount[0]), math.log(config.amount[1])
+    loans = []
+    for loan_id in loan_ids:
+        amount = round(math.exp(rng.uniform(log_low, log_high)) / config.amount_step) * config.amount_step
+        amount = min(max(amount, config.amount[0]), config.amount[1])
+        tenure = rng.choices(config.tenures, config.tenure_weights)[0]
+        rate = rng.randint(*config.rate)
+        paid = min(int(rng.uniform(*config.paid) * tenure), tenure)
+        # Start far enough back that every paid installment has fallen due
+        start_date = config.as_of - timedelta(days=31 * paid + rng.randint(0, 27))
+        created_at = datetime.combine(start_date, time(rng.randint(0, 23), rng.randint(0, 59)), dt_timezone.utc)
+        loans.append((loan_id, user_ids[rng.randrange(len(user_ids))], amount, tenure, rate, paid, start_date, created_at))
+
+    terms = [quote_terms(amount, tenure, rate) for _, _, amount, tenure, rate, _, _, _ in loans]
+    schedules = amortize_batch([
+        (amount, tenure, rate, emi, start_date)
+        for (_, _, amount, tenure, rate, _, start_date, _), (emi, _, _) in zip(loans, terms)
+    ])
+
+    loan_rows, schedule_rows = [], []
+    for (loan_id, user_id, amount, tenure, rate, paid, _, created_at), (emi, interest, payable), schedule in zip(
+        loans, terms, schedules
+    ):
+        amount_paid = round(paid * emi, 2)
+        amount_remaining = Decimal("0.00") if paid == tenure else round(payable - amount_paid, 2)  # As counters.py
+        loan_rows.append((
+            loan_id, user_id, amount, tenure, rate, emi, interest, payable,
+            "CLOSED" if paid == tenure else "ACTIVE", amount_paid, amount_remaining, paid,
+            schedule.due_dates[paid] if paid < tenure else None, created_at, 0, "MATERIALIZED", b"", Decimal("0.00"),
+        ))
+        for number, due_date, principal, interest_cents, balance in zip(
+            schedule.installment_numbers, schedule.due_dates, schedule.principal, schedule.interest, schedule.balance
+        ):
+            schedule_rows.append((
+                loan_id, number, due_date, cents_to_decimal(principal), cents_to_decimal(interest_cents),
+                cents_to_decimal(balance), "PAID" if number <= paid else "PENDING", 0, 0,
+            ))
+    return loan_rows, schedule_rows
+
+
+def _copy(model, fields, rows):
+    # Stream rows into the model's table with PostgreSQL COPY (CSV; empty unquoted fields are NULL)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\x" + value.hex() if isinstance(value, bytes) else value for value in row])
+    buffer.seek(0)
+    columns = ", ".join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+
+def _insert(model, fields, rows):
+    # Multi-row INSERTs of values prepared by the model fields, skipping model instances altogether
+    connection = connections[DEFAULT_DB_ALIAS]  # The wrapper itself; the proxy costs a lookup per value
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in model_fields)
+    sql = f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES "
+    placeholders = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    batch_size = min(INSERT_BATCH_SIZE, connection.ops.bulk_batch_size(model_fields, rows) or INSERT_BATCH_SIZE)
+    # Generated numbers, strings and dates go to the driver as they are; only values with backend-specific
+    # storage (aware datetimes, bytes) are prepared by their field
+    prepare = [
+        field.get_db_prep_save if field.get_internal_type() in ("DateTimeField", "BinaryField") else None
+        for field in model_fields
+    ]
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            params = [
+                value if prep is None else prep(value, connection)
+                for row in batch
+                for prep, value in zip(prepare, row)
+            ]
+            cursor.execute(sql + ", ".join([placeholders] * len(batch)), params)
+
+
+def write_rows(model, fields, rows):
+    if connection.vendor == "postgresql":
+        _copy(model, fields, rows)
+    else:
+        _insert(model, fields, rows)
+
+
+def write_chunk(config, chunk_index, loan_ids, user_ids):
+    # Generate and store one chunk in its own transaction; returns (loans, schedule rows) written
+    loan_rows, schedule_rows = generate_chunk(config, chunk_index, loan_ids, user_ids)
+    with transaction.atomic():
+        write_rows(Loan, LOAN_FIELDS, loan_rows)
+        write_rows(PaymentSchedule, SCHEDULE_FIELDS, schedule_rows)
+    return len(loan_rows), len(schedule_rows)
+
+
+# Worker process state, set once per process instead of being pickled with every task
+_worker = {}
+
+
+def _init_worker(config, user_ids):
+    django.setup()
+    _worker.update(config=config, user_ids=user_ids)
+
+
+def _write_task(chunk_index, loan_ids):
+    return write_chunk(_worker["config"], chunk_index, loan_ids, _worker["user_ids"])
+
+
+def create_users(count, prefix="seed", password="password"):
+    # Create `count` verified borrowers sharing one pre-hashed password; returns their ids in order
+    hashed = make_password(password)  # Hashing once keeps user creation a pure insert
+    users = User.objects.bulk_create([
+        User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=hashed, role="user", is_verified=True)
+        for i in range(count)
+    ], batch_size=INSERT_BATCH_SIZE)
+    if users and users[0].pk is None:  # Backend cannot return inserted ids
+        return list(User.objects.filter(email__in=[user.email for user in users]).order_by("id").values_list("id", flat=True))
+    return [user.pk for user in users]
+
+
+def seed_loans(users, loans, config, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, prefix="seed", password="password",
+               progress=None):
+    # Create the users, then the loans and their schedules chunk by chunk, on a process pool when workers > 1.
+    # Returns (users, loans, schedule rows) created.
+    user_ids = create_users(users, prefix, password)
+    loan_ids = [f"LOAN{number:03}" for number in loan_numbers.allocate(loans)]
+    chunks = [loan_ids[offset:offset + chunk_size] for offset in range(0, loans, chunk_size)]
+
+    totals = [0, 0]
+    if workers <= 1:
+        results = (write_chunk(config, index, chunk, user_ids) for index, chunk in enumerate(chunks))
+        for written in results:
+            totals = [totals[0] + written[0], totals[1] + written[1]]
+            if progress:
+                progress(*totals)
+    else:
+        connections.close_all()  # Children must not share the parent's database connection
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(config, user_ids)) as executor:
+            for written in executor.map(_write_task, range(len(chunks)), chunks):
+                totals = [totals[0] + written[0], totals[1] + written[1]]
+                if progress:
+                    progress(*totals)
+    return len(user_ids), totals[0], totals[1]
@@ -2,7 +2,10 @@
 # Description: Defines serializers for User, Loan, and PaymentSchedule models to handle data serialization.
 
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
+from .authentication import tokens_for_user
+from .instrumentation import TimedSerializerMixin
 from .models import Loan, PaymentSchedule
 
 # Get the active user model
@@ -10,7 +13,7 @@ User = get_user_model()
 
 
 # Serializer for User model
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role', 'password']  # Fields to serialize
@@ -22,22 +25,29 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+# Token serializer for /api/token/ that embeds the same role claims as UserLoginView
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return tokens_for_user(user)
+
+
 # Serializer for PaymentSchedule model
-class PaymentScheduleSerializer(serializers.ModelSerializer):
+class PaymentScheduleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PaymentSchedule
         fields = [
             "installment_number", "due_date", "principal_component", 
-            "interest_component", "remaining_balance", "status"
+            "interest_component", "remaining_balance", "status", "days_past_due", "late_fee"
         ]  # Fields to serialize for payment schedule
 
 
 # Serializer for Loan model
-class LoanSerializer(serializers.ModelSerializer):
+class LoanSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # Nested serializer for payment schedule
-    payment_schedule = PaymentScheduleSerializer(many=True, read_only=True, source="schedule")  # Links via related_name="schedule"
-    amount_paid = serializers.SerializerMethodField()  # Custom field for calculated amount paid
-    amount_remaining = serializers.SerializerMethodField()  # Custom field for calculated remaining amount
+    payment_schedule = PaymentScheduleSerializer(many=True, read_only=True, source="installments")  # Stored or virtual schedule
+    amount_paid = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)  # Stored counter
+    amount_remaining = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)  # Stored counter
     user = serializers.SerializerMethodField()  # Custom field for user details
 
     class Meta:
@@ -45,21 +55,13 @@ class LoanSerializer(serializers.ModelSerializer):
         fields = [
             "loan_id", "user", "amount", "tenure", "interest_rate", "monthly_installment",
             "total_interest", "total_payable", "status", "foreclosure_date", "foreclosure_discount",
-            "final_settlement_amount", "created_at", "amount_paid", "amount_remaining", "payment_schedule"
+            "final_settlement_amount", "created_at", "amount_paid", "amount_remaining", "paid_installments",
+            "payment_schedule"
         ]  # Fields to serialize for loan
         read_only_fields = [
-            "loan_id", "monthly_installment", "total_interest", "total_payable", "created_at"
-        ]  # Fields that cannot be modified via API
-
-    def get_amount_paid(self, obj):
-        # Calculate total amount paid based on paid installments
-        paid_installments = obj.schedule.filter(status="PAID").count()
-        return round(paid_installments * obj.monthly_installment, 2)
-
-    def get_amount_remaining(self, obj):
-        # Calculate remaining amount based on paid installments
-        paid_installments = obj.schedule.filter(status="PAID").count()
-        return round(obj.total_payable - (paid_installments * obj.monthly_installment), 2)
+            "loan_id", "monthly_installment", "total_interest", "total_payable", "created_at",
+            "amount_paid", "amount_remaining", "paid_installments"
+        ]  # Fields that cannot be modified via API (repayment counters are maintained by payments, see counters.py)
 
     def get_user(self, obj):
         # Return user details as a dictionary
@@ -0,0 +1,38 @@
+# File: signals.py
+# Description: Model signal handlers keeping per-process caches consistent with the database.
+
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import instrumentation, query_budget
+from .user_cache import mark_user_changed, user_cache
+
+# Get the active user model
+User = get_user_model()
+
+# User fields that affect authentication and permission checks
+AUTH_FIELDS = {"role", "is_verified", "is_staff", "is_superuser", "is_active", "password"}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Drop the cached copy; tokens issued earlier stop being trusted if auth fields may have changed
+    user_cache.invalidate(instance.pk)
+    if not created and (update_fields is None or AUTH_FIELDS & set(update_fields)):
+        mark_user_changed(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+    mark_user_changed(instance.pk)
+
+
+@receiver(connection_created)
+def install_query_recorders(sender, connection, **kwargs):
+    # Request timings and query budgets see every statement through these (no-ops unless active)
+    for wrapper in (instrumentation.record_query, query_budget.record_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
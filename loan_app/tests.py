@@ -1,3 +1,1778 @@
-from django.test import TestCase
+# File: tests.py
+# Description: Tests for the amortization engine and loan API behaviour.
 
-# Create your tests here.
+import os
+import re
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .amortization import amortize, amortize_batch, calculate_loan_terms, due_dates
+from .models import Loan, PaymentSchedule
+
+User = get_user_model()
+
+
+def legacy_schedule(amount, tenure, interest_rate, monthly_installment, start_date):
+    # Reference implementation: the per-row Decimal loop LoanView used before the engine existed
+    balance = Decimal(amount)
+    emi = Decimal(monthly_installment)
+    rate = Decimal(interest_rate) / 12 / 100
+    rows = []
+    for i in range(1, tenure + 1):
+        interest = balance * rate
+        principal = emi - interest
+        balance -= principal
+        rows.append((i, start_date + relativedelta(months=i), round(principal, 2), round(interest, 2), round(balance, 2)))
+    return rows
+
+
+def clear_response_cache():
+    # Cached loan lists survive between tests, whose users reuse ids and whose writes never commit
+    from django.conf import settings
+    from django.core.cache import caches
+
+    if settings.LOAN_RESPONSE_CACHE is not None:
+        caches[settings.LOAN_RESPONSE_CACHE].clear()
+
+
+class AmortizationEngineTests(SimpleTestCase):
+    cases = [
+        (10000, 12, 10),
+        (250000, 240, 9),
+        (5000000, 360, 7),
+        (1234, 6, 1),
+        (999999, 1, 30),
+    ]
+
+    def test_matches_legacy_decimal_schedule(self):
+        start = date(2024, 1, 31)
+        for amount, tenure, rate in self.cases:
+            emi = calculate_loan_terms(amount, tenure, rate)["monthly_installment"]
+            expected = legacy_schedule(amount, tenure, rate, emi, start)
+            actual = list(amortize(amount, tenure, rate, emi, start).rows())
+            with self.subTest(amount=amount, tenure=tenure, rate=rate):
+                self.assertEqual(actual[:-1], expected[:-1])
+                # The final installment keeps the same interest and clears the balance exactly
+                self.assertEqual(actual[-1][:2], expected[-1][:2])
+                self.assertEqual(actual[-1][3], expected[-1][3])
+                self.assertEqual(actual[-1][4], Decimal("0.00"))
+
+    def test_principal_reconciles_to_amount(self):
+        schedules = amortize_batch(
+            [(amount, tenure, rate, calculate_loan_terms(amount, tenure, rate)["monthly_installment"])
+             for amount, tenure, rate in self.cases],
+            date(2024, 3, 15),
+        )
+        for (amount, _, _), schedule in zip(self.cases, schedules):
+            self.assertEqual(sum(schedule.principal), amount * 100)
+
+    def test_stored_decimal_emi_gives_same_schedule(self):
+        emi = calculate_loan_terms(10000, 12, 10)["monthly_installment"]
+        from_float = amortize(10000, 12, 10, emi, date(2024, 1, 1))
+        from_db = amortize(Decimal("10000.00"), 12, 10.0, Decimal(str(emi)), date(2024, 1, 1))
+        self.assertEqual(list(from_float.rows()), list(from_db.rows()))
+
+    def test_due_dates_clamp_to_month_end(self):
+        start = date(2024, 1, 31)
+        self.assertEqual(due_dates(start, 3), (date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)))
+
+    def test_zero_interest_rate(self):
+        terms = calculate_loan_terms(1200, 12, 0)
+        self.assertEqual(terms["monthly_installment"], 100.0)
+        schedule = amortize(1200, 12, 0, terms["monthly_installment"], date(2024, 1, 1))
+        self.assertEqual(set(schedule.interest), {0})
+
+
+class LoanViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_loan_materializes_schedule(self):
+        response = self.client.post(reverse("list_loan"), {"amount": 10000, "tenure": 12, "interest_rate": 10}, format="json")
+        self.assertEqual(response.status_code, 201)
+        data = response.data["data"]
+        self.assertEqual(data["monthly_installment"], 879.16)
+        self.assertEqual(len(data["payment_schedule"]), 12)
+
+        loan = Loan.objects.get(loan_id=data["loan_id"])
+        self.assertEqual(PaymentSchedule.objects.filter(loan=loan).count(), 12)
+        self.assertEqual(
+            sum(p.principal_component for p in PaymentSchedule.objects.filter(loan=loan)), Decimal("10000.00")
+        )
+
+
+class BulkLoanOriginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.borrower = User.objects.create_user(username="borrower", email="borrower@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_creates_loans_and_schedules_with_per_item_results(self):
+        applications = [
+            {"email": "borrower@example.com", "amount": 10000, "tenure": 12, "interest_rate": 10},
+            {"email": "missing@example.com", "amount": 5000, "tenure": 6, "interest_rate": 8},
+            {"email": "borrower@example.com", "amount": "abc", "tenure": 6, "interest_rate": 8},
+            {"email": "borrower@example.com", "amount": 20000, "tenure": 24, "interest_rate": 12},
+        ]
+        response = self.client.post(reverse("bulk_loan_origination") + "?chunk_size=1", applications, format="json")
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual([result["success"] for result in results], [True, False, False, True])
+        self.assertIn("email", results[1]["errors"])
+        self.assertIn("amount", results[2]["errors"])
+        self.assertEqual(results[0]["monthly_installment"], 879.16)
+        self.assertNotEqual(results[0]["loan_id"], results[3]["loan_id"])
+
+        self.assertEqual(Loan.objects.filter(user=self.borrower).count(), 2)
+        self.assertEqual(PaymentSchedule.objects.filter(loan_id=results[3]["loan_id"]).count(), 24)
+
+    def test_rejects_out_of_range_applications_without_failing_their_chunk(self):
+        applications = [
+            {"email": "borrower@example.com", "amount": 10000, "tenure": 12, "interest_rate": 10},
+            {"email": "borrower@example.com", "amount": 10 ** 9, "tenure": 12, "interest_rate": 10},
+            {"email": "borrower@example.com", "amount": 5000, "tenure": 601, "interest_rate": 10},
+            {"email": "borrower@example.com", "amount": 90_000_000, "tenure": 360, "interest_rate": 20},
+            {"email": "borrower@example.com", "amount": 20000, "tenure": 24, "interest_rate": 12},
+        ]
+        response = self.client.post(reverse("bulk_loan_origination"), applications, format="json")
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual([result["success"] for result in results], [True, False, False, False, True])
+        self.assertIn("amount", results[1]["errors"])
+        self.assertIn("tenure", results[2]["errors"])
+        self.assertIn("amount", results[3]["errors"])
+        self.assertEqual(Loan.objects.filter(user=self.borrower).count(), 2)
+
+    def test_accepts_ndjson(self):
+        body = "\n".join([
+            '{"email": "borrower@example.com", "amount": 10000, "tenure": 12, "interest_rate": 10}',
+            '{"email": "borrower@example.com", "amount": 15000, "tenure": 6, "interest_rate": 9}',
+        ])
+        response = self.client.post(reverse("bulk_loan_origination"), body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(PaymentSchedule.objects.count(), 18)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(self.borrower)
+        response = self.client.post(reverse("bulk_loan_origination"), [], format="json")
+        self.assertEqual(response.status_code, 403)
+
+
+class LoanIdAllocationTests(TestCase):
+    def setUp(self):
+        from .id_allocation import loan_numbers
+
+        loan_numbers.reset()
+        self.user = User.objects.create_user(username="borrower", email="borrower@example.com", password="secret")
+
+    def create_loan(self):
+        return Loan.objects.create(
+            user=self.user, amount=1000, tenure=1, interest_rate=1,
+            monthly_installment=1000, total_interest=0, total_payable=1000,
+        )
+
+    def test_ids_keep_format_and_do_not_repeat(self):
+        loan_ids = [self.create_loan().loan_id for _ in range(5)]
+        self.assertEqual(len(set(loan_ids)), 5)
+        self.assertTrue(all(re.fullmatch(r"LOAN\d{3,}", loan_id) for loan_id in loan_ids))
+        # The database sequence is not rolled back between tests, so only the order is predictable
+        numbers = [int(loan_id[4:]) for loan_id in loan_ids]
+        self.assertEqual(numbers, sorted(numbers))
+
+    def test_save_does_not_look_up_latest_loan(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.create_loan()
+        with CaptureQueriesContext(connection) as queries:
+            self.create_loan()
+        self.assertFalse(any('ORDER BY "loan_app_loan"."id" DESC' in query["sql"] for query in queries))
+
+
+class LoanIdBlockReservationTests(TransactionTestCase):
+    def test_reservation_outside_transactions_keeps_a_block(self):
+        from .id_allocation import BlockAllocator
+
+        allocator = BlockAllocator("test", "unused_seq")
+        with self.settings(LOAN_ID_BLOCK_SIZE=10):
+            first = allocator.allocate(2)
+            second = allocator.allocate(3)
+        self.assertEqual(first + second, [1, 2, 3, 4, 5])
+        self.assertEqual(len(allocator._numbers), 5)  # Rest of the block stays in memory
+
+
+class AdminLoanListQueryTests(TestCase):
+    def setUp(self):
+        clear_response_cache()
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_loans(self, count):
+        applications = [
+            {"email": f"borrower{i}@example.com", "amount": 1000 + i, "tenure": 6, "interest_rate": 10}
+            for i in range(count)
+        ]
+        User.objects.bulk_create([
+            User(username=f"borrower{i}", email=f"borrower{i}@example.com") for i in range(count)
+        ], ignore_conflicts=True)
+        from .counters import reconcile_counters
+        from .origination import originate_loans
+
+        with self.captureOnCommitCallbacks(execute=True):  # Invalidates the cached list
+            originate_loans(applications)
+            PaymentSchedule.objects.filter(installment_number__lte=2).update(status="PAID")
+            reconcile_counters()  # Rows were changed behind the loans' backs
+
+    def count_list_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin-loans-api"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data["loans"]
+
+    def test_query_count_does_not_grow_with_loans(self):
+        self.create_loans(2)
+        few_queries, loans = self.count_list_queries()
+        self.create_loans(20)
+        many_queries, loans = self.count_list_queries()
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(loans), 22)
+        loan = loans[0]
+        self.assertEqual(loan["amount_paid"], round(2 * Decimal(loan["monthly_installment"]), 2))
+        self.assertEqual([row["installment_number"] for row in loan["payment_schedule"]], [1, 2, 3, 4, 5, 6])
+        self.assertIn("email", loan["user"])
+
+
+class AdminLoanExportTests(TestCase):
+    def setUp(self):
+        from .origination import originate_loans
+
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        User.objects.create_user(username="borrower", email="borrower@example.com", password="secret")
+        results = originate_loans([
+            {"email": "borrower@example.com", "amount": 10000, "tenure": 3, "interest_rate": 10},
+            {"email": "borrower@example.com", "amount": 5000, "tenure": 2, "interest_rate": 8},
+        ])
+        self.closed_loan_id = results[1]["loan_id"]
+        Loan.objects.filter(loan_id=self.closed_loan_id).update(status="CLOSED")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_streams_one_row_per_installment(self):
+        import csv
+        import io
+
+        response = self.client.get(reverse("admin-loans-export"), {"status": "active"}, HTTP_ACCEPT="text/csv")
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row["installment_number"] for row in rows], ["1", "2", "3"])
+        self.assertEqual(rows[0]["email"], "borrower@example.com")
+        self.assertEqual(rows[0]["payment_status"], "PENDING")
+
+    def test_ndjson_nests_schedules_per_loan(self):
+        import json
+
+        response = self.client.get(reverse("admin-loans-export"), {"output": "ndjson"})
+        loans = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([len(loan["payment_schedule"]) for loan in loans], [3, 2])
+        self.assertEqual(loans[1]["status"], "CLOSED")
+        self.assertEqual(loans[0]["amount"], "10000.00")
+
+    def test_schedules_are_streamed_in_loan_order(self):
+        from .exports import iter_loans_with_schedules
+        from .origination import originate_loans
+
+        with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+            originate_loans([{"email": "borrower@example.com", "amount": 2000, "tenure": 4, "interest_rate": 9}])
+        originate_loans([{"email": "borrower@example.com", "amount": 3000, "tenure": 5, "interest_rate": 9}])
+        for chunk_size in (1, 2, 100):
+            pairs = list(iter_loans_with_schedules(Loan.objects.all(), chunk_size=chunk_size))
+            self.assertEqual([len(schedule) for _, schedule in pairs], [3, 2, 4, 5])
+            self.assertEqual([row[0] for _, schedule in pairs for row in schedule], [1, 2, 3, 1, 2, 1, 2, 3, 4, 1, 2, 3, 4, 5])
+
+    def test_rejects_bad_filters(self):
+        response = self.client.get(reverse("admin-loans-export"), {"created_from": "not-a-date"})
+        self.assertEqual(response.status_code, 400)
+
+
+class LoanPaginationTests(TestCase):
+    def setUp(self):
+        from .origination import originate_loans
+
+        clear_response_cache()
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.borrower = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user"
+        )
+        User.objects.create_user(username="other", email="other@example.com", password="secret", role="user")
+        originate_loans(
+            [{"email": "borrower@example.com", "amount": 1000 + i, "tenure": 2, "interest_rate": 5} for i in range(7)]
+            + [{"email": "other@example.com", "amount": 500, "tenure": 2, "interest_rate": 5}]
+        )
+        self.client = APIClient()
+
+    def walk(self, url, params, key):
+        # Follow next_cursor links and return the loan ids of every page
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params, **({"cursor": cursor} if cursor else {}))
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            body = response.data["data"] if key == "data" else response.data
+            pages.append([loan["loan_id"] for loan in body["loans"]])
+            cursor = body["next_cursor"]
+            if not cursor:
+                return pages
+
+    def test_user_pages_cover_every_loan_once(self):
+        self.client.force_authenticate(self.borrower)
+        pages = self.walk(reverse("list_loan"), {"limit": 3}, "data")
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        loan_ids = [loan_id for page in pages for loan_id in page]
+        expected = list(Loan.objects.filter(user=self.borrower).order_by("-created_at", "-id").values_list("loan_id", flat=True))
+        self.assertEqual(loan_ids, expected)
+
+    def test_admin_filters_and_total(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("admin-loans-api"), {"email": "other@example.com", "include_total": "1"})
+        self.assertEqual(len(response.data["loans"]), 1)
+        self.assertEqual(response.data["total_estimate"], 1)
+        self.assertIsNone(response.data["next_cursor"])
+
+        pages = self.walk(reverse("admin-loans-api"), {"limit": 5, "status": "ACTIVE"}, "admin")
+        self.assertEqual(sum(len(page) for page in pages), 8)
+
+    def test_rejects_tampered_cursor(self):
+        self.client.force_authenticate(self.borrower)
+        response = self.client.get(reverse("list_loan"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        from .origination import originate_loans
+        from .query_plans import check_query_plans
+
+        User.objects.create_user(username="borrower", email="borrower@example.com", password="secret")
+        originate_loans([{"email": "borrower@example.com", "amount": 1000 + i, "tenure": 12, "interest_rate": 5} for i in range(20)])
+        for name, plan, problems in check_query_plans():
+            with self.subTest(query=name):
+                self.assertEqual(problems, [], plan)
+
+    def test_detects_sequential_scans(self):
+        from .query_plans import find_sequential_scans
+
+        self.assertEqual(find_sequential_scans("Seq Scan on loan_app_loan  (cost=0.00..1.01 rows=1)"), ["loan_app_loan"])
+        self.assertEqual(find_sequential_scans("2 0 0 SCAN loan_app_paymentschedule"), ["loan_app_paymentschedule"])
+        self.assertEqual(find_sequential_scans("2 0 0 SCAN loan_app_loan USING INDEX loan_created_id_idx"), [])
+        self.assertEqual(find_sequential_scans("Index Scan using loan_user_status_idx on loan_app_loan"), [])
+
+    def test_detects_other_indexes(self):
+        from .query_plans import missing_index
+
+        plan = "Index Scan using schedule_loan_status_idx on loan_app_paymentschedule"
+        self.assertFalse(missing_index(plan, "schedule_loan_status_idx"))
+        self.assertTrue(missing_index(plan, "schedule_loan_due_idx"))
+        self.assertTrue(missing_index("SEARCH loan_app_loan USING INDEX loan_user_created_idx2 (user_id=?)", "loan_user_created_idx"))
+        self.assertFalse(missing_index(plan, None))
+
+
+# A cache every worker process would see, for code that only trusts shared caches
+SHARED_CACHE = {
+    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+    "LOCATION": os.path.join(tempfile.gettempdir(), "loan-app-tests-shared"),
+}
+
+
+@override_settings(CACHES={**settings.CACHES, "shared": SHARED_CACHE}, AUTH_REVOCATION_CACHE="shared")
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from .user_cache import user_cache
+
+        caches["shared"].clear()  # Revocation markers of users from earlier tests (ids get reused)
+        user_cache.clear()
+        clear_response_cache()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post(reverse("login"), {"email": "borrower@example.com", "password": "secret"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access_token']}")
+        return response.data["access_token"]
+
+    def user_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query for query in queries if 'FROM "loan_app_customuser"' in query["sql"]]
+
+    def test_tokens_carry_role_claims(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = AccessToken(self.login())
+        self.assertEqual(token["role"], "user")
+        self.assertTrue(token["is_verified"])
+        self.assertTrue(token["is_active"])
+        self.assertIn("claims_at", token)
+
+    def test_user_row_is_cached_between_requests(self):
+        self.login()
+        response, first = self.user_queries(reverse("list_loan"))
+        self.assertEqual(response.status_code, 200)
+        response, second = self.user_queries(reverse("list_loan"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+
+    def test_permission_check_uses_claims_only(self):
+        self.login()
+        response, queries = self.user_queries(reverse("foreclosure_details", args=["LOAN999"]))
+        self.assertEqual(response.status_code, 404)  # Passed the IsUser check without loading the user
+        self.assertEqual(queries, [])
+
+    def test_role_change_revokes_stale_claims(self):
+        self.login()
+        self.assertEqual(self.client.get(reverse("list_loan")).status_code, 200)
+        self.user.role = "admin"
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("list_loan")).status_code, 403)
+
+    def test_deleted_user_is_rejected(self):
+        self.login()
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse("list_loan")).status_code, 401)
+
+    def test_change_log_is_shared_by_default(self):
+        from loan_management import settings as project_settings
+        from .checks import check_revocation_cache
+        from .user_cache import change_log_shared
+
+        with override_settings(AUTH_REVOCATION_CACHE=project_settings.AUTH_REVOCATION_CACHE, WEB_CONCURRENCY=4):
+            self.assertTrue(change_log_shared())
+            self.assertEqual(check_revocation_cache(None), [])
+        with override_settings(AUTH_REVOCATION_CACHE="default", WEB_CONCURRENCY=4):
+            self.assertEqual([warning.id for warning in check_revocation_cache(None)], ["loan_app.W001"])
+
+    def test_per_process_change_log_loads_the_user_every_time(self):
+        # Another worker could have changed the user without this one hearing of it
+        self.login()
+        with override_settings(AUTH_REVOCATION_CACHE="default"):
+            for _ in range(2):
+                response, queries = self.user_queries(reverse("foreclosure_details", args=["LOAN999"]))
+                self.assertEqual((response.status_code, len(queries)), (404, 1))
+            User.objects.filter(pk=self.user.pk).update(is_active=False)  # Bypasses signals, as another worker would
+            self.assertEqual(self.client.get(reverse("list_loan")).status_code, 401)
+
+
+class EmailOutboxTests(TestCase):
+    def register(self, email="new@example.com"):
+        return APIClient().post(
+            reverse("register"), {"username": email.split("@")[0], "email": email, "password": "secret"}, format="json"
+        )
+
+    def test_registration_only_enqueues(self):
+        from django.core import mail
+        from .models import EmailOutbox
+
+        self.assertEqual(self.register().status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.status, "PENDING")
+        self.assertEqual(queued.recipients, ["new@example.com"])
+        self.assertIn(User.objects.get(email="new@example.com").otp, queued.body)
+
+    def test_dispatch_delivers_over_one_connection_per_worker(self):
+        from unittest import mock
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from .email_outbox import dispatch_batch
+        from .models import EmailOutbox
+
+        for index in range(5):
+            self.register(f"user{index}@example.com")
+        with mock.patch.object(EmailBackend, "open", autospec=True, return_value=True) as opened:
+            counts = dispatch_batch(batch_size=10, workers=2)
+        self.assertEqual(counts["sent"], 5)
+        self.assertEqual(opened.call_count, 2)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailOutbox.objects.filter(status="SENT").count(), 5)
+        self.assertEqual(dispatch_batch()["claimed"], 0)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        from unittest import mock
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from django.core.management import call_command
+        from django.utils.timezone import now
+        from .email_outbox import dispatch_batch
+        from .models import EmailOutbox
+
+        self.register()
+        with mock.patch.object(EmailBackend, "send_messages", side_effect=OSError("connection refused")):
+            counts = dispatch_batch()
+        self.assertEqual(counts["retried"], 1)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ("PENDING", 1))
+        self.assertGreater(queued.next_attempt_at, now())
+        self.assertIn("connection refused", queued.last_error)
+
+        # Not due yet; once due, the worker command delivers it
+        call_command("run_email_outbox", "--once", stdout=mock.MagicMock())
+        self.assertEqual(mail.outbox, [])
+        EmailOutbox.objects.update(next_attempt_at=now())
+        call_command("run_email_outbox", "--once", stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailOutbox.objects.get().status, "SENT")
+
+    def test_gives_up_after_max_attempts(self):
+        from unittest import mock
+        from django.core.mail.backends.locmem import EmailBackend
+        from .email_outbox import dispatch_batch
+        from .models import EmailOutbox
+
+        self.register()
+        EmailOutbox.objects.update(attempts=4)
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=5), \
+                mock.patch.object(EmailBackend, "send_messages", side_effect=OSError("mailbox unavailable")):
+            self.assertEqual(dispatch_batch()["failed"], 1)
+        self.assertEqual(EmailOutbox.objects.get().status, "FAILED")
+
+
+class OverdueEngineTests(TestCase):
+    def setUp(self):
+        from .origination import originate_loans
+
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        originate_loans([
+            {"email": "borrower@example.com", "amount": 10000, "tenure": 3, "interest_rate": 12},
+            {"email": "borrower@example.com", "amount": 5000, "tenure": 2, "interest_rate": 10},
+        ])
+        self.loan = Loan.objects.order_by("id").first()
+        self.schedule = list(self.loan.schedule.order_by("installment_number"))
+
+    def age(self, as_of, **options):
+        from .overdue import run_overdue
+
+        with self.settings(LATE_FEE_DAILY_RATE="0.001", LATE_FEE_GRACE_DAYS=2):
+            return run_overdue(as_of, chunk_size=1, **options)
+
+    def test_marks_overdue_installments_with_late_fees(self):
+        first, second = self.schedule[0], self.schedule[1]
+        batches, overdue = self.age(first.due_date + relativedelta(days=10))
+        self.assertEqual((batches, overdue), (2, 2))  # First installment of each loan
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.days_past_due), ("OVERDUE", 10))
+        self.assertEqual(
+            first.late_fee, ((first.principal_component + first.interest_component) * Decimal("0.008")).quantize(Decimal("0.01"))
+        )
+        self.assertEqual((second.status, second.days_past_due, second.late_fee), ("PENDING", 0, Decimal("0")))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.next_due_date, first.due_date)
+
+        # Ageing to an earlier date undoes it
+        self.age(first.due_date)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.days_past_due, first.late_fee), ("PENDING", 0, Decimal("0")))
+
+    def test_overdue_installment_can_be_paid(self):
+        self.age(self.schedule[0].due_date + relativedelta(days=3))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse("pay_installment"), {"payment_id": self.schedule[0].pk}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.next_due_date, self.schedule[1].due_date)
+
+    def test_closes_fully_paid_loans(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        self.loan.schedule.update(status="PAID")
+        output = StringIO()
+        call_command("run_overdue", "--as-of", self.schedule[-1].due_date.isoformat(), "--shard", "0/1", stdout=output)
+        self.assertIn("installments are overdue", output.getvalue())
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.status, self.loan.next_due_date), ("CLOSED", None))
+        self.assertEqual(Loan.objects.get(id__gt=self.loan.id).status, "ACTIVE")
+
+
+class InstallmentPaymentTests(TestCase):
+    def setUp(self):
+        from .origination import originate_loans
+
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        User.objects.create_user(username="other", email="other@example.com", password="secret", role="user")
+        originate_loans([
+            {"email": "borrower@example.com", "amount": 10000, "tenure": 3, "interest_rate": 12},
+            {"email": "borrower@example.com", "amount": 20000, "tenure": 24, "interest_rate": 12},
+            {"email": "other@example.com", "amount": 5000, "tenure": 2, "interest_rate": 10},
+        ])
+        self.short, self.long, self.others = Loan.objects.order_by("id")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pay(self, payment):
+        return self.client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")
+
+    def test_pays_installment_in_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for loan in (self.short, self.long):
+            payment = loan.schedule.order_by("installment_number").first()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.pay(payment).status_code, 200)
+            counts.append(len(queries))
+            loan.refresh_from_db()
+            self.assertEqual(loan.amount_paid, loan.monthly_installment)
+            self.assertEqual(loan.amount_remaining, loan.total_payable - loan.monthly_installment)
+            self.assertEqual(loan.paid_installments, 1)
+            self.assertEqual(loan.next_due_date, loan.schedule.get(installment_number=2).due_date)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rejects_double_payment_and_foreign_installments(self):
+        payment = self.short.schedule.order_by("installment_number").first()
+        self.assertEqual(self.pay(payment).status_code, 200)
+        self.assertEqual(self.pay(payment).status_code, 400)
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.amount_paid, self.short.monthly_installment)
+        self.assertEqual(self.pay(self.others.schedule.first()).status_code, 404)
+
+    def test_paying_last_installment_closes_loan(self):
+        for payment in self.short.schedule.order_by("installment_number"):
+            self.assertEqual(self.pay(payment).status_code, 200)
+        self.short.refresh_from_db()
+        self.assertEqual((self.short.status, self.short.next_due_date), ("CLOSED", None))
+
+    def test_batch_allocates_amounts_and_ids(self):
+        emi = self.long.monthly_installment
+        third = self.short.schedule.get(installment_number=3)
+        self.long.schedule.filter(installment_number=1).update(status="OVERDUE", days_past_due=9, late_fee="4.50")
+        response = self.client.post(reverse("payment_batch"), [
+            {"loan_id": self.long.loan_id, "amount": str(emi * 2 + 5)},
+            {"loan_id": self.short.loan_id, "payment_ids": [third.pk]},
+            {"loan_id": self.others.loan_id, "amount": "1000"},
+            {"loan_id": self.long.loan_id, "amount": "1"},
+        ], format="json")
+        self.assertEqual(response.status_code, 207)
+        results = response.data["results"]
+        self.assertEqual(results[0]["paid_installments"], [1, 2])
+        self.assertEqual((results[0]["late_fees_paid"], results[0]["unallocated"]), (Decimal("4.50"), Decimal("0.50")))
+        self.assertEqual(results[0]["amount_applied"], emi * 2 + Decimal("4.50"))
+        self.assertEqual(results[1]["paid_installments"], [3])
+        self.assertEqual([result["success"] for result in results], [True, True, False, False])
+
+        self.long.refresh_from_db()
+        self.assertEqual((self.long.amount_paid, self.long.late_fees_paid), (emi * 2 + Decimal("4.50"), Decimal("4.50")))
+        self.assertEqual(self.long.next_due_date, self.long.schedule.get(installment_number=3).due_date)
+        self.assertEqual(self.short.schedule.get(installment_number=1).status, "PENDING")
+
+    def test_late_fees_are_paid_first(self):
+        from .counters import reconcile_counters
+
+        emi = self.long.monthly_installment
+        self.long.schedule.filter(installment_number=1).update(status="OVERDUE", days_past_due=30, late_fee="7.00")
+        response = self.client.post(reverse("payment_batch"), {"loan_id": self.long.loan_id, "amount": str(emi + 6)}, format="json")
+        self.assertEqual(response.data["results"][0]["error"], "Amount does not cover the next installment.")
+
+        self.assertEqual(self.pay(self.long.schedule.get(installment_number=1)).status_code, 200)
+        self.long.refresh_from_db()
+        self.assertEqual((self.long.amount_paid, self.long.late_fees_paid), (emi + 7, 7))
+        self.assertEqual(self.long.amount_remaining, self.long.total_payable - emi)
+        self.assertEqual(reconcile_counters(fix=False), [])
+
+
+class ForeclosureQuoteTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .origination import originate_loans
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        originate_loans([{"email": "borrower@example.com", "amount": 10000, "tenure": 6, "interest_rate": 12}])
+        self.loan = Loan.objects.get()
+        # Two installments already due
+        self.loan.schedule.filter(installment_number__lte=2).update(due_date=date.today() - relativedelta(days=1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def schedule_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query for query in queries if 'FROM "loan_app_paymentschedule"' in query["sql"]]
+
+    def test_quote_matches_settlement_and_is_cached(self):
+        url = reverse("foreclosure_details", args=[self.loan.loan_id])
+        response, queries = self.schedule_queries(url)
+        self.assertEqual(len(queries), 1)
+
+        # Installments merely due are still owed, and their interest is not discounted
+        due = list(self.loan.schedule.filter(installment_number__lte=2))
+        discount = (self.loan.total_interest - sum(p.interest_component for p in due)) * Decimal("0.05")
+        self.assertEqual(response.data["total_paid"], 0)
+        self.assertEqual(response.data["remaining_balance"], self.loan.total_payable)
+        self.assertEqual(response.data["foreclosure_discount"], round(discount, 2))
+
+        response, queries = self.schedule_queries(url)
+        self.assertEqual(queries, [])
+
+        settled = self.client.post(reverse("foreclose-loan", args=[self.loan.loan_id]))
+        self.assertEqual(settled.status_code, 200)
+        self.assertEqual(settled.data["final_settlement_amount"], response.data["final_settlement_amount"])
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, "CLOSED")
+        self.assertEqual(self.loan.final_settlement_amount, response.data["final_settlement_amount"])
+
+    def test_overdue_installment_is_settled_with_its_late_fee(self):
+        from .counters import reconcile_counters
+        from .models import PaymentSchedule
+
+        first, second = self.loan.schedule.filter(installment_number__lte=2).order_by("installment_number")
+        self.client.post(reverse("pay_installment"), {"payment_id": first.pk}, format="json")
+        PaymentSchedule.objects.filter(pk=second.pk).update(status="OVERDUE", days_past_due=20, late_fee=Decimal("4.25"))
+        self.loan.refresh_from_db()
+
+        response = self.client.get(reverse("foreclosure_details", args=[self.loan.loan_id]))
+        paid = first.principal_component + first.interest_component
+        remaining_interest = self.loan.total_interest - first.interest_component - second.interest_component
+        discount = round(remaining_interest * Decimal("0.05"), 2)
+        self.assertEqual(response.data["total_paid"], paid)
+        self.assertEqual(response.data["remaining_balance"], self.loan.total_payable - paid)
+        self.assertEqual(response.data["late_fees"], Decimal("4.25"))
+        self.assertEqual(response.data["foreclosure_discount"], discount)
+        self.assertEqual(
+            response.data["final_settlement_amount"], self.loan.total_payable - paid - discount + Decimal("4.25")
+        )
+
+        self.assertEqual(self.client.post(reverse("foreclose-loan", args=[self.loan.loan_id])).status_code, 200)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.late_fees_paid, Decimal("4.25"))
+        self.assertEqual(self.loan.amount_paid, paid + response.data["final_settlement_amount"])
+        self.assertEqual(reconcile_counters(fix=False), [])
+
+    def test_payment_invalidates_cached_quote(self):
+        url = reverse("foreclosure_details", args=[self.loan.loan_id])
+        self.schedule_queries(url)
+        payment = self.loan.schedule.get(installment_number=1)
+        self.client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")
+        response, queries = self.schedule_queries(url)
+        self.assertEqual(len(queries), 1)
+
+    def test_other_users_loans_are_hidden(self):
+        other = User.objects.create_user(username="other", email="other@example.com", password="secret", role="user")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse("foreclosure_details", args=[self.loan.loan_id])).status_code, 404)
+
+
+class LoanQuoteTests(TestCase):
+    def test_single_quote_matches_created_loan(self):
+        user = User.objects.create_user(username="borrower", email="borrower@example.com", password="secret", role="user")
+        client = APIClient()
+        client.force_authenticate(user)
+        created = client.post(reverse("list_loan"), {"amount": 10000, "tenure": 12, "interest_rate": 10}, format="json").data["data"]
+
+        with self.assertNumQueries(0):
+            response = APIClient().get(reverse("loan_quote"), {"amount": 10000, "tenure": 12, "interest_rate": 10, "schedule": "true"})
+        self.assertEqual(response.status_code, 200)
+        quote = response.data["data"]
+        for field in ("monthly_installment", "total_interest", "total_amount"):
+            self.assertEqual(quote[field], created[field])
+        self.assertEqual(
+            [(row["installment_no"], row["due_date"], row["amount"]) for row in quote["payment_schedule"]],
+            [(row["installment_no"], row["due_date"], row["amount"]) for row in created["payment_schedule"]],
+        )
+
+    def test_grid_quotes_are_memoized(self):
+        from .quotes import quote_terms
+
+        quote_terms.cache_clear()
+        url = reverse("loan_quote") + "?amount=50000&tenure=12,24,36&interest_rate=9,10"
+        quotes = APIClient().get(url).data["data"]["quotes"]
+        self.assertEqual([(quote["tenure"], quote["interest_rate"]) for quote in quotes], [
+            (12, 9), (12, 10), (24, 9), (24, 10), (36, 9), (36, 10),
+        ])
+        APIClient().post(reverse("loan_quote"), {"amount": 50000, "tenure": [12, 24, 36], "interest_rate": [9, 10]}, format="json")
+        self.assertEqual((quote_terms.cache_info().hits, quote_terms.cache_info().misses), (6, 6))
+
+    def test_schedule_memo_is_small(self):
+        from .quotes import quote_schedule, quote_terms
+
+        self.assertLessEqual(quote_schedule.cache_parameters()["maxsize"], 64)
+        self.assertGreater(quote_terms.cache_parameters()["maxsize"], quote_schedule.cache_parameters()["maxsize"])
+
+    def test_rejects_invalid_and_oversized_requests(self):
+        url = reverse("loan_quote")
+        self.assertEqual(APIClient().get(url, {"amount": "abc", "tenure": 12, "interest_rate": 10}).status_code, 400)
+        self.assertEqual(APIClient().get(url, {"amount": 1000, "interest_rate": 10}).status_code, 400)
+        self.assertEqual(APIClient().get(url, {"amount": 1000, "tenure": 5000, "interest_rate": 10}).status_code, 400)
+        grid = {"amount": 1000, "tenure": ",".join(map(str, range(1, 31))), "interest_rate": 10, "schedule": "1"}
+        self.assertEqual(APIClient().get(url, grid).status_code, 400)
+
+
+class VirtualScheduleTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        terms = {"amount": 20000, "tenure": 24, "interest_rate": 11}
+        self.stored = self.create_loan(terms)
+        with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+            self.virtual = self.create_loan(terms)
+
+    def create_loan(self, terms):
+        response = self.client.post(reverse("list_loan"), terms, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Loan.objects.get(loan_id=response.data["data"]["loan_id"])
+
+    def serialized_schedule(self, loan):
+        from .serializers import LoanSerializer
+
+        loan = Loan.objects.with_schedule_summary().get(pk=loan.pk)
+        return LoanSerializer(loan).data["payment_schedule"]
+
+    def test_virtual_loan_reads_like_a_stored_one(self):
+        self.assertTrue(self.virtual.is_virtual)
+        self.assertFalse(PaymentSchedule.objects.filter(loan_id=self.virtual.loan_id).exists())
+        self.assertEqual(self.serialized_schedule(self.virtual), self.serialized_schedule(self.stored))
+
+        quotes = [self.client.get(reverse("foreclosure_details", args=[loan.loan_id])).data for loan in (self.stored, self.virtual)]
+        self.assertEqual(quotes[0], quotes[1])
+
+    def test_pays_virtual_installments(self):
+        reference = f"{self.virtual.loan_id}-1"
+        self.assertEqual(self.client.post(reverse("pay_installment"), {"payment_id": reference}, format="json").status_code, 200)
+        self.assertEqual(self.client.post(reverse("pay_installment"), {"payment_id": reference}, format="json").status_code, 400)
+        response = self.client.post(reverse("payment_batch"), {"loan_id": self.virtual.loan_id, "amount": str(self.virtual.monthly_installment * 2 + 1)}, format="json")
+        self.assertEqual(response.data["results"][0]["paid_installments"], [2, 3])
+
+        self.virtual.refresh_from_db()
+        schedule = self.serialized_schedule(self.virtual)
+        self.assertEqual([row["status"] for row in schedule[:4]], ["PAID", "PAID", "PAID", "PENDING"])
+        self.assertEqual(self.virtual.amount_paid, self.virtual.monthly_installment * 3)
+        self.assertEqual(str(self.virtual.next_due_date), schedule[3]["due_date"])
+
+        details = self.client.get(reverse("loan_details"), {"loan_id": self.virtual.loan_id})
+        self.assertContains(details, f'data-payment-id="{self.virtual.loan_id}-4"')
+
+    def test_virtual_payments_collect_late_fees(self):
+        from dateutil.relativedelta import relativedelta
+        from .virtual_schedule import virtual_schedule
+
+        Loan.objects.filter(pk=self.virtual.pk).update(schedule_start=date.today() - relativedelta(months=2))
+        self.virtual.refresh_from_db()
+        late_fee = virtual_schedule(self.virtual)[0].late_fee
+        self.assertGreater(late_fee, 0)
+        reference = f"{self.virtual.loan_id}-1"
+        self.assertEqual(self.client.post(reverse("pay_installment"), {"payment_id": reference}, format="json").status_code, 200)
+        self.virtual.refresh_from_db()
+        self.assertEqual(self.virtual.amount_paid, self.virtual.monthly_installment + late_fee)
+
+    def test_convert_schedules_round_trip(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        first = self.stored.schedule.get(installment_number=1)
+        self.client.post(reverse("pay_installment"), {"payment_id": first.pk}, format="json")
+        before = self.serialized_schedule(self.stored)
+
+        call_command("convert_schedules", "--to", "virtual", stdout=StringIO())
+        self.stored.refresh_from_db()
+        self.assertTrue(self.stored.is_virtual)
+        self.assertEqual(PaymentSchedule.objects.count(), 0)
+        self.assertEqual(self.serialized_schedule(self.stored), before)
+
+        call_command("convert_schedules", "--to", "materialized", "--loan-id", self.stored.loan_id, stdout=StringIO())
+        self.stored.refresh_from_db()
+        self.assertFalse(self.stored.is_virtual)
+        self.assertEqual(self.stored.schedule.count(), 24)
+        self.assertEqual(self.serialized_schedule(self.stored), before)
+
+
+    def test_converts_schedules_written_before_final_reconciliation(self):
+        from io import StringIO
+        from dateutil.relativedelta import relativedelta
+        from django.core.management import call_command
+
+        # The schedule as LoanView wrote it originally: a full EMI in every row, the balance left as it falls
+        PaymentSchedule.objects.filter(loan_id=self.stored.loan_id).delete()
+        balance, emi = Decimal(self.stored.amount), Decimal(float(self.stored.monthly_installment))
+        rate, start_date = Decimal(self.stored.interest_rate) / 12 / 100, self.stored.created_at.date()
+        legacy = []
+        for number in range(1, self.stored.tenure + 1):
+            interest = balance * rate
+            principal = emi - interest
+            balance -= principal
+            legacy.append(PaymentSchedule(
+                loan_id=self.stored.loan_id, installment_number=number, due_date=start_date + relativedelta(months=number),
+                principal_component=round(principal, 2), interest_component=round(interest, 2),
+                remaining_balance=round(balance, 2), status="PAID" if number == 1 else "PENDING",
+            ))
+        PaymentSchedule.objects.bulk_create(legacy)
+        self.assertNotEqual(legacy[-1].remaining_balance, 0)
+        before = self.serialized_schedule(self.stored)
+
+        call_command("convert_schedules", "--to", "virtual", stdout=StringIO())
+        self.stored.refresh_from_db()
+        self.assertTrue(self.stored.is_virtual)
+        after = self.serialized_schedule(self.stored)
+        self.assertEqual(after[:-1], before[:-1])
+        self.assertEqual((after[-1]["interest_component"], after[-1]["remaining_balance"]),
+                         (before[-1]["interest_component"], "0.00"))
+
+        # Rows that no generator wrote are left alone
+        Loan.objects.filter(pk=self.virtual.pk).update(schedule_mode="MATERIALIZED")
+        PaymentSchedule.objects.bulk_create([PaymentSchedule(
+            loan_id=self.virtual.loan_id, installment_number=number, due_date=start_date + relativedelta(months=number),
+            principal_component=1, interest_component=1, remaining_balance=0,
+        ) for number in range(1, 25)])
+        out = StringIO()
+        call_command("convert_schedules", "--to", "virtual", stderr=out, stdout=StringIO())
+        self.assertIn(self.virtual.loan_id, out.getvalue())
+
+
+class PortfolioSummaryTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        terms = {"amount": 12000, "tenure": 12, "interest_rate": 10}
+        with self.captureOnCommitCallbacks(execute=True):  # Buckets are updated once writes commit
+            self.loans = [self.create_loan(terms), self.create_loan({**terms, "amount": 6000})]
+            with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+                self.loans.append(self.create_loan(terms))
+
+    def create_loan(self, terms):
+        response = self.client.post(reverse("list_loan"), terms, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Loan.objects.get(loan_id=response.data["data"]["loan_id"])
+
+    def buckets(self):
+        from .models import PortfolioBucket
+
+        return {
+            (bucket.kind, bucket.month, bucket.status): (bucket.count, bucket.principal, bucket.interest)
+            for bucket in PortfolioBucket.objects.all()
+            if bucket.count
+        }
+
+    def assert_matches_rebuild(self):
+        from .portfolio import rebuild_portfolio
+
+        incremental = self.buckets()
+        rebuild_portfolio(chunk_size=1)
+        self.assertEqual(incremental, self.buckets())
+
+    def summary(self):
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        response = admin.get(reverse("admin-portfolio"))
+        self.assertEqual(response.status_code, 200)
+        return response.data["portfolio"]
+
+    def test_buckets_follow_loan_lifecycle(self):
+        stored, small, virtual = self.loans
+        summary = self.summary()
+        self.assertEqual(summary["active_loans"], 3)
+        self.assertEqual(summary["disbursed_principal"], 30000)
+        self.assertEqual(summary["outstanding_principal"], Decimal("30000.00"))
+        self.assertEqual(len(summary["cash_flow"]), 12)
+        self.assert_matches_rebuild()
+
+        first = stored.schedule.get(installment_number=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("pay_installment"), {"payment_id": first.pk}, format="json")
+            self.client.post(reverse("pay_installment"), {"payment_id": f"{virtual.loan_id}-1"}, format="json")
+        self.assertEqual(self.summary()["collected"], stored.monthly_installment + virtual.monthly_installment)
+        self.assert_matches_rebuild()
+
+        from .virtual_schedule import schedule_rows
+
+        collected = self.summary()["collected"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("payment_batch"), {"loan_id": small.loan_id, "amount": str(small.monthly_installment * 12)}, format="json")
+            self.client.post(reverse("foreclose-loan", args=[virtual.loan_id]))
+        summary = self.summary()
+        self.assertEqual((summary["active_loans"], summary["closed_loans"]), (1, 2))
+        # Foreclosure collects the virtual loan's remaining installments less the waived interest
+        virtual.refresh_from_db()
+        self.assertGreater(virtual.foreclosure_discount, 0)
+        self.assertEqual(summary["interest_waived"], virtual.foreclosure_discount)
+        settled = sum(p.principal_component + p.interest_component for p in small.schedule.all()) + sum(
+            principal + interest for number, _, principal, interest, _ in schedule_rows(virtual) if number > 1
+        )
+        self.assertEqual(summary["collected"], collected + settled - virtual.foreclosure_discount)
+        self.assert_matches_rebuild()
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(admin.delete(reverse("delete-loan", args=[stored.loan_id])).status_code, 200)
+        self.assertEqual(self.summary()["active_loans"], 0)
+        self.assert_matches_rebuild()
+
+    def test_overdue_run_records_the_loans_it_closes(self):
+        from .overdue import run_overdue
+
+        stored = self.loans[0]
+        stored.schedule.update(status="PAID")  # Paid off without closing the loan (e.g. data fixed by hand)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_overdue()
+        stored.refresh_from_db()
+        self.assertEqual(stored.status, "CLOSED")
+        self.assertEqual(self.summary()["closed_loans"], 1)
+        from .portfolio import rebuild_portfolio
+
+        def loan_buckets():
+            return {key: value for key, value in self.buckets().items() if key[0] == "LOAN"}
+
+        incremental = loan_buckets()
+        rebuild_portfolio()  # Installments were changed behind the buckets' back; loans must match
+        self.assertEqual(incremental, loan_buckets())
+
+    def test_upserts_lock_buckets_in_key_order(self):
+        from unittest import mock
+        from .portfolio import PortfolioDelta
+
+        delta = PortfolioDelta()
+        for month in (date(2026, 3, 1), date(2026, 1, 1), date(2026, 2, 1)):
+            delta.add("LOAN", month, "ACTIVE", 1, 1, 1)
+            delta.add("INSTALLMENT", month, "DUE", 1, 1, 1)
+        with mock.patch("loan_app.portfolio._upsert") as upsert:
+            delta.apply()
+        keys = [row[:3] for row in upsert.call_args.args[0]]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_rebuild_command_repairs_drift(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import PortfolioBucket
+
+        expected = self.buckets()
+        PortfolioBucket.objects.filter(kind="LOAN").delete()
+        call_command("rebuild_portfolio", "--chunk-size", "2", stdout=StringIO())
+        self.assertEqual(self.buckets(), expected)
+
+    def test_requires_admin(self):
+        self.assertEqual(self.client.get(reverse("admin-portfolio")).status_code, 403)
+
+
+class LoanCounterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        terms = {"amount": 12000, "tenure": 6, "interest_rate": 12}
+        self.stored = self.create_loan(terms)
+        with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+            self.virtual = self.create_loan(terms)
+
+    def create_loan(self, terms):
+        response = self.client.post(reverse("list_loan"), terms, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Loan.objects.get(loan_id=response.data["data"]["loan_id"])
+
+    def drifted(self):
+        from .counters import reconcile_counters
+
+        return sorted(reconcile_counters(fix=False))
+
+    def test_counters_follow_payments_and_foreclosure(self):
+        self.assertEqual((self.stored.amount_paid, self.stored.amount_remaining), (0, self.stored.total_payable))
+        self.client.post(reverse("pay_installment"), {"payment_id": self.stored.schedule.get(installment_number=1).pk}, format="json")
+        self.client.post(reverse("pay_installment"), {"payment_id": f"{self.virtual.loan_id}-1"}, format="json")
+        for loan in (self.stored, self.virtual):
+            loan.refresh_from_db()
+            self.assertEqual(loan.paid_installments, 1)
+            self.assertEqual(loan.amount_remaining, loan.total_payable - loan.monthly_installment)
+
+        self.client.post(reverse("foreclose-loan", args=[self.virtual.loan_id]))
+        self.virtual.refresh_from_db()
+        self.assertEqual(self.virtual.paid_installments, 6)
+        self.assertEqual(self.virtual.amount_paid, self.virtual.total_payable - self.virtual.foreclosure_discount)
+        self.assertEqual(self.virtual.amount_remaining, 0)
+        self.assertEqual(self.drifted(), [])
+
+    def test_fully_paid_loans_owe_nothing(self):
+        for payment in self.stored.schedule.order_by("installment_number"):
+            self.client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")
+        for number in range(1, 7):
+            self.client.post(reverse("pay_installment"), {"payment_id": f"{self.virtual.loan_id}-{number}"}, format="json")
+        for loan in (self.stored, self.virtual):
+            loan.refresh_from_db()
+            self.assertEqual((loan.status, loan.paid_installments), ("CLOSED", 6))
+            self.assertEqual(loan.amount_paid, loan.monthly_installment * 6)
+            self.assertEqual(loan.amount_remaining, 0)
+        self.assertEqual(self.drifted(), [])
+
+    def test_reconcile_repairs_drift(self):
+        PaymentSchedule.objects.filter(loan_id=self.stored.loan_id, installment_number__lte=2).update(status="PAID")
+        Loan.objects.filter(pk=self.virtual.pk).update(amount_paid=5, paid_installments=3)
+        from io import StringIO
+        from django.core.management import call_command
+
+        self.assertEqual(self.drifted(), sorted([self.stored.loan_id, self.virtual.loan_id]))
+        out = StringIO()
+        call_command("reconcile_loan_counters", "--chunk-size", "1", stdout=out)
+        self.assertIn("Repaired 2 loans", out.getvalue())
+        self.assertEqual(self.drifted(), [])
+
+        self.stored.refresh_from_db()
+        self.virtual.refresh_from_db()
+        self.assertEqual(self.stored.paid_installments, 2)
+        self.assertEqual(self.stored.amount_paid, self.stored.monthly_installment * 2)
+        self.assertEqual((self.virtual.paid_installments, self.virtual.amount_paid), (0, 0))
+
+
+@override_settings(LOAN_RESPONSE_CACHE="responses")
+class LoanResponseCacheTests(TestCase):
+    def setUp(self):
+        clear_response_cache()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("list_loan"), {"amount": 6000, "tenure": 6, "interest_rate": 12}, format="json")
+        self.loan = Loan.objects.get()
+
+    def get(self, client, url, **headers):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, headers=headers)
+        return response, len(queries)
+
+    def test_unchanged_polls_cost_no_queries(self):
+        for client, url in ((self.client, reverse("list_loan")), (self.admin_client, reverse("admin-loans-api"))):
+            first, _ = self.get(client, url)
+            self.assertEqual(first.status_code, 200)
+            again, queries = self.get(client, url)
+            self.assertEqual((again.content, again["ETag"], queries), (first.content, first["ETag"], 0))
+
+            not_modified, queries = self.get(client, url, if_none_match=first["ETag"])
+            self.assertEqual((not_modified.status_code, queries), (304, 0))
+            self.assertFalse(first.has_header("Last-Modified"))  # Revalidation is on the ETag only
+
+    def test_writes_invalidate_cached_lists(self):
+        url = reverse("list_loan")
+        first, _ = self.get(self.client, url)
+        admin_first, _ = self.get(self.admin_client, reverse("admin-loans-api"))
+
+        payment = self.loan.schedule.get(installment_number=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")
+
+        response, queries = self.get(self.client, url, if_none_match=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(Decimal(str(response.json()["data"]["loans"][0]["amount_paid"])), self.loan.monthly_installment)
+        admin_response, _ = self.get(self.admin_client, reverse("admin-loans-api"), if_none_match=admin_first["ETag"])
+        self.assertEqual(admin_response.status_code, 200)
+
+    def test_cache_off_still_revalidates(self):
+        url = reverse("list_loan")
+        with override_settings(LOAN_RESPONSE_CACHE=None):
+            first, _ = self.get(self.client, url)
+            again, queries = self.get(self.client, url, if_none_match=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertGreater(queries, 0)
+
+    def test_per_process_cache_fails_the_check_with_several_workers(self):
+        from .checks import check_response_cache
+
+        self.assertEqual(check_response_cache(None), [])
+        with override_settings(WEB_CONCURRENCY=4):
+            self.assertEqual([error.id for error in check_response_cache(None)], ["loan_app.E001"])
+        with override_settings(WEB_CONCURRENCY=4, LOAN_RESPONSE_CACHE=None):
+            self.assertEqual(check_response_cache(None), [])
+
+    def test_lists_are_per_user(self):
+        other = User.objects.create_user(username="other", email="other@example.com", password="secret", role="user")
+        self.get(self.client, reverse("list_loan"))
+        client = APIClient()
+        client.force_authenticate(other)
+        response, _ = self.get(client, reverse("list_loan"))
+        self.assertEqual(response.json()["data"]["loans"], [])
+
+
+class BenchmarkTests(TestCase):
+    def test_runs_every_scenario_within_budget(self):
+        from .benchmarks import QUERY_BUDGETS, compare, over_budget, run_benchmarks
+
+        report = run_benchmarks(rows=120, iterations=2, warmup=0)
+        self.assertEqual(set(report["results"]), set(QUERY_BUDGETS))
+        self.assertEqual(report["meta"]["database"], "sqlite")
+        self.assertEqual(over_budget(report), [])
+        self.assertEqual(compare(report, report), [])
+
+        slower = {"results": {"pay_installment": {**report["results"]["pay_installment"], "queries": 1, "p50_ms": 0.001}}}
+        regressions = compare(slower, report)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith("pay_installment:") for line in regressions))
+
+    def test_serialization_paths_render_the_same_bytes(self):
+        from .benchmarks import run_serialization, serialization_paths
+
+        report = run_serialization(loans=20, iterations=1)
+        self.assertTrue(report["identical"])
+        self.assertEqual(set(report["results"]), set(serialization_paths()))
+        formats = report["formats"]
+        self.assertLess(formats["columnar"]["bytes"], formats["json"]["bytes"])
+        self.assertLess(formats["json"]["gzip_bytes"], formats["json"]["bytes"] / 5)
+
+
+class SeedLoansTests(TestCase):
+    def seed(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+
+        stderr = StringIO()
+        call_command("seed_loans", "--users", "5", "--loans", "30", "--chunk-size", "7", "--as-of", "2026-01-15",
+                     "--seed", "3", *args, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_generates_consistent_loans_and_schedules(self):
+        from .counters import reconcile_counters
+        from .models import PortfolioBucket
+
+        self.seed("--tenure", "6:1,12:1", "--paid", "0.5:1")
+        loans = Loan.objects.all()
+        self.assertEqual((User.objects.count(), loans.count()), (5, 30))
+        self.assertEqual(PaymentSchedule.objects.count(), sum(loan.tenure for loan in loans))
+        self.assertTrue(all(loan.paid_installments >= loan.tenure // 2 for loan in loans))
+        self.assertFalse(PaymentSchedule.objects.filter(status="PAID", due_date__gt=date(2026, 1, 15)).exists())
+        self.assertEqual(reconcile_counters(fix=False), [])
+        self.assertTrue(PortfolioBucket.objects.exists())
+        self.assertTrue(self.client.login(email="seed0@example.com", password="password"))
+
+    def test_fully_paid_loans_are_seeded_closed(self):
+        from .counters import reconcile_counters
+
+        self.seed("--paid", "1:1")
+        self.assertEqual(set(Loan.objects.values_list("status", "amount_remaining")), {("CLOSED", 0)})
+        self.assertEqual(reconcile_counters(fix=False), [])
+
+    def test_defaults_to_one_worker_on_sqlite(self):
+        from unittest import mock
+
+        with mock.patch("os.cpu_count", return_value=8):
+            self.assertEqual(self.seed(), "")
+        self.assertIn("single worker", self.seed("--prefix", "other", "--workers", "2"))
+
+    def test_output_is_deterministic(self):
+        from .seeding import SeedConfig, generate_chunk
+
+        config = SeedConfig(seed=9, as_of=date(2026, 1, 15))
+        self.assertEqual(generate_chunk(config, 2, ["LOAN1", "LOAN2"], [1, 2, 3]),
+                         generate_chunk(config, 2, ["LOAN1", "LOAN2"], [1, 2, 3]))
+        self.assertNotEqual(generate_chunk(config, 1, ["LOAN1"], [1]), generate_chunk(config, 2, ["LOAN1"], [1]))
+
+    def test_refuses_existing_prefix(self):
+        from django.core.management.base import CommandError
+
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+@override_settings(METRICS_PUBLIC=True)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        from .instrumentation import registry
+
+        clear_response_cache()
+        registry.reset()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_loan(self):
+        return self.client.post(reverse("list_loan"), {"amount": 6000, "tenure": 6, "interest_rate": 12}, format="json")
+
+    def test_server_timing_header_breaks_down_the_request(self):
+        import re
+        from django.test import override_settings
+
+        admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.create_loan()
+        self.client.force_authenticate(admin)
+        with override_settings(SERVER_TIMING_HEADER=True):
+            response = self.client.get(reverse("admin-loans-api"))
+        self.assertEqual(response.status_code, 200)
+        timings = dict(re.findall(r"(\w+);dur=([\d.]+)", response["Server-Timing"]))
+        self.assertEqual(set(timings), {"db", "serialize", "render", "total"})
+        self.assertGreater(float(timings["serialize"]), 0)
+        self.assertGreaterEqual(float(timings["total"]), float(timings["db"]) + float(timings["serialize"]))
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+        with override_settings(SERVER_TIMING_HEADER=False):
+            self.assertNotIn("Server-Timing", self.create_loan())
+
+    def test_metrics_endpoint_exposes_histograms(self):
+        self.create_loan()
+        self.client.get(reverse("list_loan"))
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('loan_http_requests_total{view="list_loan",method="POST",status="201"} 1', body)
+        self.assertIn('loan_http_request_duration_seconds_count{view="list_loan",method="GET"} 1', body)
+        self.assertIn('loan_http_request_db_queries_bucket{view="list_loan",method="POST",le="+Inf"} 1', body)
+        self.assertIn("# TYPE loan_http_request_serialize_duration_seconds histogram", body)
+
+    def test_unsampled_requests_are_only_counted(self):
+        from django.test import override_settings
+
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0, SERVER_TIMING_HEADER=True):
+            response = self.client.get(reverse("list_loan"))
+        self.assertNotIn("Server-Timing", response)
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('loan_http_requests_total{view="list_loan",method="GET",status="200"} 1', body)
+        self.assertNotIn('duration_seconds_count{view="list_loan"', body)
+
+    def test_metrics_token(self):
+        from django.test import override_settings
+
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            self.assertEqual(self.client.get("/metrics", headers={"authorization": "Bearer s3cret"}).status_code, 200)
+        with override_settings(METRICS_PUBLIC=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)  # No token configured
+
+    def test_timings_are_private_by_default(self):
+        from loan_management import settings as project_settings
+
+        self.assertFalse(project_settings.SERVER_TIMING_HEADER)
+        self.assertFalse(project_settings.METRICS_PUBLIC)
+        self.assertNotIn("Server-Timing", self.client.get(reverse("list_loan")))
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        clear_response_cache()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+        for amount in (6000, 7000, 8000):
+            self.client.post(reverse("list_loan"), {"amount": amount, "tenure": 6, "interest_rate": 12}, format="json")
+        self.loans = list(Loan.objects.order_by("id"))
+
+    def requests(self):
+        # (endpoint, request) for every budgeted API view method
+        anonymous = APIClient()
+        first, second, third = self.loans
+        payment = PaymentSchedule.objects.get(loan=first, installment_number=1)
+        return [
+            ("register", lambda: anonymous.post(reverse("register"), {
+                "username": "new", "email": "new@example.com", "password": "secret-pass"}, format="json")),
+            ("verify_otp", lambda: anonymous.post(reverse("verify_otp"), {
+                "email": "new@example.com", "otp": User.objects.get(email="new@example.com").otp}, format="json")),
+            ("login", lambda: anonymous.post(reverse("login"), {"email": "borrower@example.com", "password": "secret"},
+                                              format="json")),
+            ("user_info", lambda: self.client.get(reverse("user_info"))),
+            ("logout", lambda: self.client.post(reverse("logout"))),
+            ("loan_list", lambda: self.client.get(reverse("list_loan"))),
+            ("create_loan", lambda: self.client.post(reverse("list_loan"), {
+                "amount": 9000, "tenure": 6, "interest_rate": 12}, format="json")),
+            ("quote", lambda: anonymous.get(reverse("loan_quote"), {"amount": 5000, "tenure": 12, "interest_rate": 9})),
+            ("quote_post", lambda: anonymous.post(reverse("loan_quote"), {
+                "amount": 5000, "tenure": 12, "interest_rate": 9}, format="json")),
+            ("bulk", lambda: self.admin_client.post(reverse("bulk_loan_origination"), [
+                {"email": "borrower@example.com", "amount": 5000 + i, "tenure": 6, "interest_rate": 10}
+                for i in range(5)], format="json")),
+            ("pay", lambda: self.client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")),
+            ("payment_batch", lambda: self.client.post(reverse("payment_batch"), [
+                {"loan_id": second.loan_id, "amount": str(second.monthly_installment)},
+                {"loan_id": first.loan_id, "amount": str(first.monthly_installment)}], format="json")),
+            ("foreclosure_details", lambda: self.client.get(reverse("foreclosure_details", args=[third.loan_id]))),
+            ("foreclose", lambda: self.client.post(reverse("foreclose-loan", args=[third.loan_id]))),
+            ("admin_loans", lambda: self.admin_client.get(reverse("admin-loans-api"))),
+            ("portfolio", lambda: self.admin_client.get(reverse("admin-portfolio"))),
+            ("export", lambda: self.admin_client.get(reverse("admin-loans-export"))),
+            ("delete", lambda: self.admin_client.delete(reverse("delete-loan", args=[second.loan_id]))),
+        ]
+
+    def test_views_stay_within_their_budgets(self):
+        from django.test import override_settings
+
+        with override_settings(QUERY_BUDGET_MODE="raise"):
+            for name, call in self.requests():
+                with self.subTest(name):
+                    self.assertLess(call().status_code, 500)
+
+    def test_every_api_view_declares_a_budget(self):
+        from django.urls import get_resolver
+        from rest_framework.views import APIView
+        from .query_budget import declared_budget
+
+        for pattern in get_resolver("loan_app.urls").url_patterns:
+            view_class = getattr(pattern.callback, "view_class", None)
+            if view_class is None or not issubclass(view_class, APIView) or view_class.__module__ != "loan_app.views":
+                continue
+            for method in view_class.http_method_names:
+                if method != "options" and hasattr(view_class, method):
+                    with self.subTest(pattern.name, method=method):
+                        self.assertIsNotNone(declared_budget(pattern.callback, method))
+
+    def test_repeated_queries_are_reported_with_their_origin(self):
+        from .query_budget import QueryBudgetExceeded, query_budget
+
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with query_budget(repeats=2, mode="raise"):
+                for loan in self.loans:
+                    PaymentSchedule.objects.filter(loan=loan).count()
+        self.assertIn("ran 3 times (possible N+1)", str(raised.exception))
+        self.assertIn("tests.py", str(raised.exception))
+
+        with self.assertLogs("loan_app.query_budget", "WARNING") as logs:
+            with query_budget(2, mode="warn"):
+                list(Loan.objects.all())
+                list(Loan.objects.filter(status="ACTIVE"))
+                list(User.objects.all())
+        self.assertIn("3 queries, budget is 2", logs.output[0])
+
+    def test_budgets_are_free_when_off(self):
+        from django.test import override_settings
+        from .query_budget import query_budget
+
+        with override_settings(QUERY_BUDGET_MODE="off"):
+            with query_budget(0) as budget:
+                list(Loan.objects.all())
+        self.assertEqual(budget.count, 0)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches["responses"].clear()
+        self.user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        self.routed = []
+
+    def handle(self, method="get", write=False):
+        # Run a request through the routing middleware into a @replica_reads view recording its read alias
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .db_routing import ReplicaRoutingMiddleware, replica_reads
+
+        @replica_reads
+        def view(request):
+            if write:
+                Loan.objects.filter(user=self.user).update(status="ACTIVE")
+            self.routed.append(Loan.objects.all().db)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)("/")
+        request.user = self.user
+        ReplicaRoutingMiddleware(view)(request)
+        return self.routed[-1]
+
+    def test_reads_of_read_only_views_go_to_replicas(self):
+        from django.test import override_settings
+
+        with override_settings(DATABASE_REPLICAS=["replica1", "replica2"]):
+            self.assertIn(self.handle(), ["replica1", "replica2"])
+            self.assertEqual(Loan.objects.all().db, "default")  # Outside marked views
+        self.assertEqual(self.handle(), "default")  # No replicas configured
+
+    def test_writers_stick_to_the_primary(self):
+        from django.core.cache import caches
+        from django.test import override_settings
+
+        with override_settings(DATABASE_REPLICAS=["replica1"], DATABASE_REPLICA_STICKY_SECONDS=30):
+            self.assertEqual(self.handle(write=True), "default")  # Reads after a write in the same request
+            self.assertEqual(self.handle(), "default")  # and the user's next requests
+            caches["responses"].clear()  # The sticky window ends
+            self.assertEqual(self.handle(), "replica1")
+            self.handle(method="post")
+            self.assertEqual(self.handle(), "default")
+
+    def test_lists_built_right_after_a_change_read_the_primary(self):
+        import time
+        from django.core.cache import caches
+        from django.test import RequestFactory
+        from rest_framework.response import Response
+        from rest_framework.test import force_authenticate
+        from rest_framework.views import APIView
+        from .db_routing import ReplicaRoutingMiddleware, replica_reads
+        from .response_cache import ALL, _bump, cached_loan_response, user_scopes
+
+        routed = self.routed
+
+        class View(APIView):
+            @replica_reads
+            @cached_loan_response(user_scopes)
+            def get(self, request):
+                routed.append(Loan.objects.all().db)
+                return Response({})
+
+        def handle(path):
+            request = RequestFactory().get(path)
+            force_authenticate(request, self.user)
+            ReplicaRoutingMiddleware(View.as_view())(request)
+            return routed[-1]
+
+        with override_settings(DATABASE_REPLICAS=["replica1"], LOAN_RESPONSE_CACHE="responses", DATABASE_REPLICA_STICKY_SECONDS=30):
+            self.assertEqual(handle("/?a"), "default")  # Versions just started
+            old = time.time_ns() - 60 * 1_000_000_000
+            caches["responses"].set_many({f"loan-set:user:{self.user.pk}": old, "loan-set:bulk": old}, None)
+            self.assertEqual(handle("/?b"), "replica1")
+            _bump([ALL, f"user:{self.user.pk}"])  # A write handled by another worker (this reader is not sticky)
+            self.assertEqual(handle("/?b"), "default")
+
+    def test_replicas_require_a_shared_sticky_cache(self):
+        from django.conf import settings
+        from .checks import check_sticky_cache
+
+        self.assertEqual(check_sticky_cache(None), [])
+        with override_settings(DATABASE_REPLICAS=["replica1"]):
+            self.assertEqual([error.id for error in check_sticky_cache(None)], ["loan_app.E002"])
+        shared = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/loan-sticky"}
+        with override_settings(DATABASE_REPLICAS=["replica1"], CACHES={**settings.CACHES, "shared": shared},
+                               DATABASE_STICKY_CACHE="shared"):
+            self.assertEqual(check_sticky_cache(None), [])
+
+    def test_database_cache_is_read_from_the_primary(self):
+        from django.core.cache.backends.db import DatabaseCache
+        from django.test import override_settings
+        from .db_routing import ReplicaRouter, RoutingState, _state
+
+        state = RoutingState()
+        state.replica = "replica1"
+        token = _state.set(state)
+        try:
+            with override_settings(DATABASE_REPLICAS=["replica1"]):
+                router = ReplicaRouter()
+                self.assertIsNone(router.db_for_read(DatabaseCache("cache", {}).cache_model_class))
+                self.assertEqual(router.db_for_read(Loan), "replica1")
+                self.assertFalse(router.allow_migrate("replica1", "loan_app"))
+        finally:
+            _state.reset(token)
+
+
+class AsgiHandlerTests(TestCase):
+    def test_asgi_handler_serves_the_same_loan_list(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        from .authentication import tokens_for_user
+
+        clear_response_cache()
+        user = User.objects.create_user(
+            username="borrower", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse("list_loan"), {"amount": 6000, "tenure": 6, "interest_rate": 12}, format="json")
+
+        # The middleware runs in async mode under ASGI
+        headers = {"authorization": f"Bearer {tokens_for_user(user).access_token}"}
+        expected = self.client.get(reverse("list_loan"), headers=headers)
+        response = async_to_sync(AsyncClient().get)(reverse("list_loan"), headers=headers)
+        self.assertEqual((response.status_code, response.content), (200, expected.content))
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        clear_response_cache()
+        self.user = User.objects.create_user(
+            username="bórrower \u2028", email="borrower@example.com", password="secret", role="user", is_verified=True
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for terms in ({"amount": 6000, "tenure": 6, "interest_rate": 12}, {"amount": 12345, "tenure": 12, "interest_rate": 9}):
+            client.post(reverse("list_loan"), terms, format="json")
+        with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+            client.post(reverse("list_loan"), {"amount": 20000, "tenure": 24, "interest_rate": 11}, format="json")
+        loan = Loan.objects.filter(schedule_mode="MATERIALIZED").order_by("id").first()
+        payment = loan.schedule.get(installment_number=1)
+        client.post(reverse("pay_installment"), {"payment_id": payment.pk}, format="json")
+        Loan.objects.filter(pk=loan.pk).update(
+            foreclosure_date=date(2025, 1, 31), foreclosure_discount=Decimal("12.5"), interest_rate=9.75
+        )
+
+    def test_serialize_loans_renders_like_loan_serializer(self):
+        from rest_framework.renderers import JSONRenderer
+        from .projections import load_schedules, loan_rows, serialize_loans
+        from .renderers import FastJSONRenderer
+        from .serializers import LoanSerializer
+
+        expected = JSONRenderer().render(LoanSerializer(Loan.objects.with_schedule_summary().order_by("id"), many=True).data)
+        rows = list(loan_rows(Loan.objects.order_by("id")))
+        data = serialize_loans(rows, load_schedules(rows))
+        self.assertEqual(JSONRenderer().render(data), expected)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with self.settings(ORJSON_RENDERER=False):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertIn(b"\\u2028", expected)
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"), JSONRenderer().render(data, "application/json; indent=2")
+        )
+
+
+class BulkFormatTests(TestCase):
+    def setUp(self):
+        clear_response_cache()
+        from .compression import compressed_bodies
+
+        compressed_bodies.clear()
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret", role="admin", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        user = User.objects.create_user(username="borrower", email="borrower@example.com", password="secret", role="user")
+        borrower = APIClient()
+        borrower.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for amount in (6000, 7000, 8000):
+                borrower.post(reverse("list_loan"), {"amount": amount, "tenure": 6, "interest_rate": 12}, format="json")
+            with self.settings(LOAN_SCHEDULE_MODE="VIRTUAL"):
+                borrower.post(reverse("list_loan"), {"amount": 9000, "tenure": 3, "interest_rate": 10}, format="json")
+
+    def test_columnar_json_holds_the_same_loans(self):
+        import json
+        from .columnar import from_columns
+
+        url = reverse("admin-loans-api")
+        rows = self.client.get(url)
+        columnar = self.client.get(url, headers={"accept": "application/vnd.loans.columnar+json"})
+        self.assertEqual(columnar["Content-Type"], "application/vnd.loans.columnar+json")
+        self.assertNotEqual(columnar["ETag"], rows["ETag"])
+        body = json.loads(columnar.content)
+        self.assertEqual(body["loans"]["count"], 4)
+        self.assertEqual(body["loans"]["columns"]["payment_schedule"]["offsets"], [0, 3, 9, 15, 21])
+        self.assertEqual(from_columns(body["loans"]), json.loads(rows.content)["loans"])
+        self.assertLess(len(columnar.content), len(rows.content) * 0.7)
+        self.assertEqual(self.client.get(url + "?format=columnar").content, columnar.content)
+
+    def test_columnar_layout_round_trips_empty_objects(self):
+        from .columnar import from_columns, to_columns
+
+        records = [{"id": 1, "meta": {}}, {"id": 2, "meta": None}]
+        block = to_columns(records)
+        self.assertEqual(block["columns"]["meta"], {"columns": {}})
+        self.assertEqual(from_columns(block), [{"id": 1, "meta": {}}, {"id": 2, "meta": {}}])
+
+    def test_msgpack_holds_the_columnar_layout(self):
+        import json
+        import msgpack
+
+        url = reverse("admin-loans-api")
+        response = self.client.get(url, headers={"accept": "application/msgpack"})
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        columnar = self.client.get(url + "?format=columnar")
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(columnar.content))
+
+    def test_large_api_responses_are_compressed(self):
+        import gzip
+        from .compression import choose_encoding
+
+        url = reverse("admin-loans-api")
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        for _ in range(2):  # Compressed, then from the compressed bodies
+            compressed = self.client.get(url, headers={"accept-encoding": "br;q=0.5, gzip"})
+            self.assertEqual((compressed["Content-Encoding"], compressed["ETag"]), ("gzip", "W/" + plain["ETag"]))
+            self.assertEqual(gzip.decompress(compressed.content), plain.content)
+            self.assertIn("Accept-Encoding", compressed["Vary"])
+        not_modified = self.client.get(url, headers={"accept-encoding": "gzip", "if-none-match": compressed["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.settings(COMPRESSION_MIN_SIZE=len(plain.content) + 1):
+            self.assertFalse(self.client.get(url, headers={"accept-encoding": "gzip"}).has_header("Content-Encoding"))
+        self.assertFalse(self.client.get(url, headers={"accept-encoding": "gzip;q=0, identity"}).has_header("Content-Encoding"))
+        self.assertEqual(choose_encoding("*"), choose_encoding("br, gzip"))
+        self.assertIsNone(choose_encoding("deflate, identity"))
+
+    def test_streaming_exports_are_compressed(self):
+        import gzip
+
+        url = reverse("admin-loans-export") + "?output=ndjson"
+        plain = b"".join(self.client.get(url).streaming_content)
+        response = self.client.get(url, headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
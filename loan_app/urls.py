@@ -6,7 +6,9 @@ from .views import (
     RegisterUserView, VerifyOTPView, UserLoginView, login_page, register_page, 
     user_home, guest_page, UserInfoView, LogoutView, 
     loan_application_page, loan_list_view, loan_details_view, pay_installment, 
-    ForecloseLoanView, LoanView, foreclosure_details, AdminLoanListView, AdminDeleteLoanView, admin_home
+    ForecloseLoanView, LoanView, foreclosure_details, AdminLoanListView, AdminDeleteLoanView, admin_home,
+    BulkLoanOriginationView, AdminLoanExportView, PaymentBatchView,
+    LoanQuoteView, AdminPortfolioView
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -24,8 +26,11 @@ urlpatterns = [
     path('api/logout/', LogoutView.as_view(), name='logout'),  # User logout
 
     # Loan-related API endpoints
-    path('api/loans/', LoanView.as_view(), name='list_loan'),  # List loans (GET only)
+    path('api/loans/', LoanView.as_view(), name='list_loan'),  # List (GET) and create (POST) loans
+    path('api/loans/quote/', LoanQuoteView.as_view(), name='loan_quote'),  # Public EMI quotes (single or grid)
+    path('api/loans/bulk/', BulkLoanOriginationView.as_view(), name='bulk_loan_origination'),  # Originate loans in bulk
     path('api/payment_schedule/pay/', pay_installment, name='pay_installment'),  # Pay loan installment
+    path('api/payments/batch/', PaymentBatchView.as_view(), name='payment_batch'),  # Allocate payments across installments
     path('api/loans/<str:loan_id>/foreclose/', ForecloseLoanView.as_view(), name='foreclose-loan'),  # Foreclose a loan
     path('api/loans/<str:loan_id>/foreclosure-details/', foreclosure_details, name='foreclosure_details'),  # Get foreclosure details
 
@@ -43,5 +48,7 @@ urlpatterns = [
     # Admin-related endpoints and views
     path("admin_home/", admin_home, name="admin_home"),  # Admin dashboard
     path("api/admin/loans/", AdminLoanListView.as_view(), name="admin-loans-api"),  # List all loans for admin
+    path("api/admin/portfolio/", AdminPortfolioView.as_view(), name="admin-portfolio"),  # Portfolio totals and cash-flow projection
+    path("api/admin/loans/export/", AdminLoanExportView.as_view(), name="admin-loans-export"),  # Stream loans and schedules (CSV/NDJSON)
     path('api/admin/loans/<str:loan_id>/delete/', AdminDeleteLoanView.as_view(), name='delete-loan'),  # Delete a loan
 ]
\ No newline at end of file
@@ -0,0 +1,108 @@
+# File: user_cache.py
+# Description: Per-process TTL + LRU cache of authenticated users, invalidated through model signals.
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from .checks import is_shared_cache
+
+# Get the active user model
+User = get_user_model()
+
+# Defaults used when USER_CACHE_MAX_SIZE / USER_CACHE_TTL are not configured
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 60  # Seconds a cached user is trusted without a reload
+
+
+class UserCache:
+    # Thread-safe LRU map of user id -> (expires_at, loaded_at, user)
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, "USER_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "USER_CACHE_TTL", DEFAULT_TTL)
+
+    def get(self, user_id):
+        # Return (user, loaded_at) for a live entry, or (None, None)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, None
+            expires_at, loaded_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None, None
+            self._entries.move_to_end(user_id)
+        return copy.copy(user), loaded_at  # Callers never share a mutable instance
+
+    def set(self, user):
+        # Store a user, evicting the least recently used entries beyond max_size
+        with self._lock:
+            self._entries[user.pk] = (time.monotonic() + self.ttl, time.time(), copy.copy(user))
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide user cache
+user_cache = UserCache()
+
+
+def _change_log_alias():
+    return getattr(settings, "AUTH_REVOCATION_CACHE", "default")
+
+
+def _change_log():
+    return caches[_change_log_alias()]
+
+
+def change_log_shared():
+    # Whether user changes recorded by one worker process are seen by all of them. Token claims and cached
+    # users are only trusted then; with a per-process log (locmem) every request loads the user row.
+    return is_shared_cache(_change_log_alias())
+
+
+def mark_user_changed(user_id):
+    # Record when a user's auth-relevant state changed, so older tokens and cache entries are not trusted
+    lifetime = settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"] + settings.SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"]
+    _change_log().set(f"auth:user-changed:{user_id}", time.time(), timeout=int(lifetime.total_seconds()))
+
+
+def user_changed_at(user_id):
+    # Return the time of the user's last recorded change, or None
+    return _change_log().get(f"auth:user-changed:{user_id}")
+
+
+def get_user(user_id):
+    # Return the user with this id, from the cache unless it is missing, expired or changed since loading.
+    # Raises User.DoesNotExist.
+    if not change_log_shared():
+        return User.objects.get(pk=user_id)
+    user, loaded_at = user_cache.get(user_id)
+    changed_at = user_changed_at(user_id)
+    if user is None or (changed_at is not None and changed_at >= loaded_at):
+        user = User.objects.get(pk=user_id)
+        user_cache.set(user)
+    return user
+
@@ -2,11 +2,11 @@
 # Description: Utility functions for OTP generation, email sending, and admin access restriction.
 
 import random
-from django.core.mail import send_mail
 from django.conf import settings
 from rest_framework.response import Response
 from rest_framework import status
 from functools import wraps
+from .email_outbox import enqueue_email
 
 
 def generate_otp():
@@ -15,15 +15,15 @@ def generate_otp():
 
 
 def send_otp_email(user):
-    # Generate and send OTP to user's email
+    # Generate an OTP and queue it for delivery to the user's email (sent by run_email_outbox)
     otp = generate_otp()
     user.otp = otp  # Store OTP in the user model
-    user.save()
+    user.save(update_fields=["otp"])
 
     # Email details
     subject = "Your OTP for Email Verification"
     message = f"Your OTP for verifying your account is: {otp}"
-    send_mail(subject, message, settings.EMAIL_HOST_USER, [user.email])
+    enqueue_email(subject, message, [user.email], settings.EMAIL_HOST_USER)
 
 
 def admin_required(view_func):
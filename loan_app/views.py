@@ -6,6 +6,8 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
@@ -14,22 +16,49 @@ from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.hashers import check_password
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from dateutil.relativedelta import relativedelta
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.db import transaction
 from django.utils.timezone import now
 from datetime import timedelta, datetime
 from .serializers import UserSerializer, LoanSerializer
 from decimal import Decimal
-from .models import User, Loan, PaymentSchedule
+from .models import User, Loan, PaymentSchedule, UNPAID_STATUSES
 from .utils import send_otp_email, admin_required
+from .amortization import amortize, calculate_loan_terms
+from .origination import DEFAULT_CHUNK_SIZE, originate_loans
+from .parsers import NDJSONParser
+from .exports import EXPORT_FORMATS, stream_export
+from .filters import filter_loans
+from .pagination import estimate_count, paginate_loans, wants_total
+from .projections import load_schedules, loan_rows, serialize_loans
+from .renderers import BULK_RENDERERS, FastJSONRenderer
+import hmac
 import jwt
-import math
 from .permissions import IsAdminUser, IsUser
+from .authentication import tokens_for_user
+from . import payments
+from .counters import expected_counters
+from .db_routing import replica_reads
+from .foreclosure import foreclosure_quote
+from .virtual_schedule import default_schedule_mode, full_mask
+from .portfolio import portfolio_summary, record_deleted_loan, record_foreclosure, record_new_loans, unpaid_rows
+from .response_cache import admin_scopes, cached_loan_response, loans_changed, user_scopes
+from .instrumentation import registry as request_metrics
+from .query_budget import query_budget
+from .quotes import MAX_AMOUNT, MAX_INTEREST_RATE, MAX_TENURE, build_quotes, parse_values
 
 # Get the active user model
 User = get_user_model()
 
+# Columns of each loan in the user's loan list ("id" only builds the cursor)
+LOAN_LIST_FIELDS = (
+    "id", "loan_id", "amount", "tenure", "monthly_installment", "total_payable", "amount_paid",
+    "amount_remaining", "next_due_date", "status", "created_at",
+)
+
 
 # Admin home page view
 def admin_home(request):
@@ -39,7 +68,11 @@ def admin_home(request):
 # Admin view to list all loans
 class AdminLoanListView(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    renderer_classes = [FastJSONRenderer, *BULK_RENDERERS, BrowsableAPIRenderer]  # JSON, columnar JSON, MessagePack
 
+    @query_budget(3)  # Page of loans, their schedules and the optional total estimate
+    @replica_reads
+    @cached_loan_response(admin_scopes)  # Served from cache (or 304) until any loan changes
     def get(self, request):
         try:
             # Restrict access to staff users only
@@ -49,13 +82,21 @@ class AdminLoanListView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Fetch all loans and serialize them
-            loans = Loan.objects.all()
-            serializer = LoanSerializer(loans, many=True)
-            return Response(
-                {"success": True, "loans": serializer.data},
-                status=status.HTTP_200_OK
-            )
+            # Fetch one page of loans with their users, then the page's schedules: a fixed number of queries.
+            # Rows are serialized like LoanSerializer, without its per-field objects (see projections.py).
+            try:
+                loans = filter_loans(Loan.objects.all(), request.query_params)
+                page, next_cursor = paginate_loans(loan_rows(loans), request.query_params)
+            except ValueError as e:
+                return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            schedules = load_schedules(page)
+            with query_budget(0, name="serialize_loans"):
+                loans_data = serialize_loans(page, schedules)
+            response_data = {"success": True, "loans": loans_data, "next_cursor": next_cursor}
+            if wants_total(request.query_params):
+                response_data["total_estimate"] = estimate_count(loans)
+            return Response(response_data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
                 {"success": False, "error": str(e)},
@@ -63,10 +104,49 @@ class AdminLoanListView(APIView):
             )
 
 
+# Admin view summarizing the whole portfolio from the pre-aggregated monthly buckets
+class AdminPortfolioView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @query_budget(1)
+    def get(self, request):
+        # Reads one row per (month, status) bucket, however many loans there are
+        return Response({"success": True, "portfolio": portfolio_summary()}, status=status.HTTP_200_OK)
+
+
+# Admin view to stream loans joined with their payment schedules as CSV or NDJSON
+class AdminLoanExportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export body is not rendered by DRF, so never reject an Accept: text/csv header
+        return super().perform_content_negotiation(request, force=True)
+
+    @query_budget(0)  # Rows are queried chunk by chunk while streaming
+    def get(self, request):
+        export_format = request.query_params.get("output", "csv").lower()
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"success": False, "message": f"Unsupported output format. Use one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            loans = filter_loans(Loan.objects.all(), request.query_params)
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Rows are generated lazily while the response is being sent
+        response = StreamingHttpResponse(stream_export(export_format, loans), content_type=EXPORT_FORMATS[export_format])
+        response["Content-Disposition"] = f'attachment; filename="loans.{export_format}"'
+        return response
+
+
 # Admin view to delete a loan and its payment schedule
 class AdminDeleteLoanView(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
+    @query_budget(8)
     def delete(self, request, loan_id):
         try:
             # Fetch the loan by loan_id
@@ -83,10 +163,14 @@ class AdminDeleteLoanView(APIView):
                 "created_at": loan.created_at,
             }
 
-            # Delete associated payment schedules first
-            PaymentSchedule.objects.filter(loan=loan).delete()
-            # Delete the loan
-            loan.delete()
+            with transaction.atomic():
+                # Take the loan out of the portfolio summary
+                record_deleted_loan(loan)
+                loans_changed([loan.user_id])
+                # Delete associated payment schedules first
+                PaymentSchedule.objects.filter(loan=loan).delete()
+                # Delete the loan
+                loan.delete()
 
             return Response({
                 "success": True,
@@ -113,6 +197,7 @@ class CustomJWTAuthentication(JWTAuthentication):
 
 # User registration view
 class RegisterUserView(APIView):
+    @query_budget(5)
     def post(self, request):
         serializer = UserSerializer(data=request.data)
         if not serializer.is_valid():
@@ -152,6 +237,7 @@ class RegisterUserView(APIView):
 class VerifyOTPView(APIView):
     permission_classes = [AllowAny]
 
+    @query_budget(3)
     def post(self, request):
         email = request.data.get("email")
         otp = request.data.get("otp")
@@ -172,6 +258,7 @@ class VerifyOTPView(APIView):
 # User login view
 @method_decorator(csrf_exempt, name='dispatch')
 class UserLoginView(APIView):
+    @query_budget(1)
     def post(self, request):
         email = request.data.get("email")
         password = request.data.get("password")
@@ -197,8 +284,8 @@ class UserLoginView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        # Generate JWT tokens carrying role claims
+        refresh = tokens_for_user(user)
         return Response({
             "success": True,
             "user": {
@@ -229,14 +316,58 @@ def guest_page(request):
     return render(request, "Guest/guestPage.html")
 
 
+def metrics(request):
+    # Prometheus scrape endpoint; requires "Authorization: Bearer <METRICS_TOKEN>", and is closed without a
+    # token unless METRICS_PUBLIC is set
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token and not getattr(settings, "METRICS_PUBLIC", False):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(request_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def loan_application_page(request):
     return render(request, "User/loan_application.html")
 
 
+# Public loan quote API: EMI, totals and optionally the schedule, for one loan or a grid of
+# tenures x rates (?amount=50000&tenure=12,24,36&interest_rate=9,10,11). Needs no login or database.
+class LoanQuoteView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    @query_budget(0)
+    def get(self, request):
+        return self.quote(request.query_params)
+
+    @query_budget(0)
+    def post(self, request):
+        return self.quote(request.data)
+
+    def quote(self, params):
+        try:
+            amount = parse_values(params.get("amount"), "amount", 1, MAX_AMOUNT)
+            if len(amount) != 1:
+                raise ValueError("amount must be a single integer.")
+            tenures = parse_values(params.get("tenure"), "tenure", 1, MAX_TENURE)
+            interest_rates = parse_values(params.get("interest_rate"), "interest_rate", 0, MAX_INTEREST_RATE)
+            with_schedule = str(params.get("schedule", "")).lower() in ("1", "true", "yes")
+            quotes = build_quotes(amount[0], tenures, interest_rates, with_schedule)
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = quotes[0] if len(quotes) == 1 else {"quotes": quotes}
+        response = Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
+        response["Cache-Control"] = "public, max-age=300"
+        return response
+
+
 # User info view
 class UserInfoView(APIView):
     permission_classes = [IsAuthenticated, IsUser]
 
+    @query_budget(1)
     def get(self, request):
         user_id = request.session.get('user_id')
         if user_id:
@@ -246,6 +377,7 @@ class UserInfoView(APIView):
 
 # Logout view
 class LogoutView(APIView):
+    @query_budget(1)
     def post(self, request):
         request.session.flush()  # Clear server-side session
         response = Response({"success": True, "message": "Logged out"})
@@ -256,21 +388,31 @@ class LogoutView(APIView):
 # Loan management view
 class LoanView(APIView):
     permission_classes = [IsAuthenticated, IsUser]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
+    @query_budget(2)  # Page of loans and the optional total estimate
+    @replica_reads
+    @cached_loan_response(user_scopes)  # Served from cache (or 304) until one of the user's loans changes
     def get(self, request):
-        # Fetch loans for the authenticated user
-        loans = Loan.objects.filter(user=request.user).values(
-            "loan_id", "amount", "tenure", "monthly_installment", 
-            "total_payable", "amount_paid", "amount_remaining", 
-            "next_due_date", "status", "created_at"
-        )
+        # Fetch one page of loans for the authenticated user, newest first
+        try:
+            loans = filter_loans(Loan.objects.filter(user=request.user), request.query_params)
+            page, next_cursor = paginate_loans(loans.values(*LOAN_LIST_FIELDS), request.query_params)
+        except ValueError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        for loan in page:
+            del loan["id"]  # Only needed to build the cursor
 
         response_data = {
             "status": "success",
-            "data": {"loans": list(loans)}
+            "data": {"loans": page, "next_cursor": next_cursor}
         }
+        if wants_total(request.query_params):
+            response_data["data"]["total_estimate"] = estimate_count(loans)
         return Response(response_data, status=status.HTTP_200_OK)
 
+    @query_budget(9)
     def post(self, request):
         try:
             user = request.user
@@ -278,34 +420,30 @@ class LoanView(APIView):
             tenure = int(request.data.get("tenure"))
             interest_rate = int(request.data.get("interest_rate"))
 
-            # Calculate EMI
-            monthly_interest_rate = (interest_rate / 100) / 12
-            emi = (amount * monthly_interest_rate * (math.pow(1 + monthly_interest_rate, tenure))) / \
-                  ((math.pow(1 + monthly_interest_rate, tenure)) - 1)
-
-            # Calculate total interest and payable amount
-            interest_amount_after_all_emi = emi * tenure - amount
-            interest_total = amount * (interest_rate / 100)
-            total_interest = interest_total + interest_amount_after_all_emi
-            total_amount = amount + total_interest
-
-            # Create loan object
-            loan = Loan.objects.create(
-                user=user,
-                amount=amount,
-                tenure=tenure,
-                interest_rate=interest_rate,
-                monthly_installment=round(emi, 2),
-                total_interest=round(total_interest, 2),
-                total_payable=round(total_amount, 2),
-                status="ACTIVE"
-            )
-
-            # Generate payment schedule
-            self.generate_payment_schedule(loan)
+            # Calculate EMI, total interest and payable amount
+            terms = calculate_loan_terms(amount, tenure, interest_rate)
+
+            # Create loan object (schedule stored as rows or derived on demand, see LOAN_SCHEDULE_MODE)
+            schedule_mode = default_schedule_mode()
+            with transaction.atomic():
+                loan = Loan.objects.create(
+                    user=user,
+                    amount=amount,
+                    tenure=tenure,
+                    interest_rate=interest_rate,
+                    status="ACTIVE",
+                    schedule_mode=schedule_mode,
+                    schedule_start=now().date() if schedule_mode == "VIRTUAL" else None,
+                    amount_remaining=terms["total_payable"],
+                    **terms
+                )
 
-            # Fetch payment schedule
-            schedule = PaymentSchedule.objects.filter(loan=loan).order_by("installment_number")
+                # Generate payment schedule and count the loan in the portfolio summary
+                schedule = self.generate_payment_schedule(loan)
+                record_new_loans([(loan, [
+                    (entry.due_date, entry.principal_component, entry.interest_component) for entry in schedule
+                ])])
+                loans_changed([user.pk])
             payment_schedule = [
                 {
                     "installment_no": entry.installment_number,
@@ -322,9 +460,9 @@ class LoanView(APIView):
                     "amount": loan.amount,
                     "tenure": loan.tenure,
                     "interest_rate": f"{loan.interest_rate}% yearly",
-                    "monthly_installment": round(emi, 2),
-                    "total_interest": round(total_interest, 2),
-                    "total_amount": round(total_amount, 2),
+                    "monthly_installment": terms["monthly_installment"],
+                    "total_interest": terms["total_interest"],
+                    "total_amount": terms["total_payable"],
                     "payment_schedule": payment_schedule,
                     "status": loan.status,
                     "created_at": loan.created_at
@@ -335,32 +473,59 @@ class LoanView(APIView):
             return Response({"error": str(e)}, status=500)
 
     def generate_payment_schedule(self, loan):
-        # Generate payment schedule for the loan
-        balance = Decimal(loan.amount)
-        emi = Decimal(loan.monthly_installment)
-        interest_rate = Decimal(loan.interest_rate) / 12 / 100
-        start_date = now().date()
-
-        schedule_entries = []
-        for i in range(1, loan.tenure + 1):
-            interest_component = balance * interest_rate
-            principal_component = emi - interest_component
-            balance -= principal_component
-
-            schedule_entries.append(PaymentSchedule(
+        # Generate payment schedule for the loan with the batch amortization engine
+        if loan.is_virtual:
+            return loan.installments()  # Nothing to store
+        schedule = amortize(loan.amount, loan.tenure, loan.interest_rate, loan.monthly_installment)
+        schedule_entries = [
+            PaymentSchedule(
                 loan=loan,
-                installment_number=i,
-                due_date=start_date + relativedelta(months=i),
-                principal_component=round(principal_component, 2),
-                interest_component=round(interest_component, 2),
-                remaining_balance=round(balance, 2),
-            ))
+                installment_number=number,
+                due_date=due_date,
+                principal_component=principal,
+                interest_component=interest,
+                remaining_balance=balance,
+            )
+            for number, due_date, principal, interest, balance in schedule.rows()
+        ]
 
         PaymentSchedule.objects.bulk_create(schedule_entries)
+        return schedule_entries
+
+
+# Bulk loan origination view (admin only)
+class BulkLoanOriginationView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    @query_budget(None, repeats=False)  # Constant per chunk, one transaction per chunk
+    def post(self, request):
+        # Accept a JSON array, {"loans": [...]} or an NDJSON body of loan applications
+        applications = request.data.get("loans") if isinstance(request.data, dict) else request.data
+        if not isinstance(applications, list) or not applications:
+            return Response(
+                {"success": False, "message": "Provide a non-empty list of loan applications."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            chunk_size = int(request.query_params.get("chunk_size", DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        results = originate_loans(applications, chunk_size=max(chunk_size, 1))
+        created = sum(1 for result in results if result["success"])
+        return Response({
+            "success": created == len(results),
+            "created": created,
+            "failed": len(results) - created,
+            "results": results,
+        }, status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_207_MULTI_STATUS)
 
 
 # Loan list view
 @permission_classes([IsAuthenticated, IsUser])
+@replica_reads
 def loan_list_view(request):
     loans = Loan.objects.filter(user_id=request.GET.get("user_id"))
     return render(request, "User/loan_list.html", {"loans": loans})
@@ -368,12 +533,13 @@ def loan_list_view(request):
 
 # Loan details view
 @permission_classes([IsAuthenticated, IsUser])
+@replica_reads
 def loan_details_view(request):
     loan_id = request.GET.get("loan_id")
     loan = get_object_or_404(Loan, loan_id=loan_id)
 
-    payment_schedule = PaymentSchedule.objects.filter(loan=loan).order_by("installment_number")
-    pending_payment = payment_schedule.filter(status="PENDING").first()
+    payment_schedule = loan.installments()
+    pending_payment = next((payment for payment in payment_schedule if payment.status in UNPAID_STATUSES), None)
     balance_amount = pending_payment.remaining_balance if pending_payment else 0
 
     context = {
@@ -385,6 +551,7 @@ def loan_details_view(request):
 
 
 # Pay installment API
+@query_budget(10)  # Including the user row, loaded by authentication unless token claims are trusted
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsUser])
 def pay_installment(request):
@@ -393,68 +560,87 @@ def pay_installment(request):
         return Response({"error": "Payment ID not provided."}, status=400)
 
     try:
-        payment = PaymentSchedule.objects.get(pk=payment_id)
-    except PaymentSchedule.DoesNotExist:
+        payments.pay_installment(request.user, payment_id)
+    except payments.PaymentError as e:
+        return Response({"error": e.message}, status=e.status)
+    except (TypeError, ValueError):
         return Response({"error": "Payment not found."}, status=404)
 
-    if payment.status != "PENDING":
-        return Response({"error": "Payment already made."}, status=400)
+    return Response({"success": True})
 
-    payment.status = "PAID"
-    payment.save()
 
-    loan = payment.loan
-    if loan.amount_paid is None:
-        loan.amount_paid = 0
-    loan.amount_paid += loan.monthly_installment
-    loan.amount_remaining = loan.amount - loan.amount_paid
-    next_payment = loan.schedule.filter(status="PENDING").order_by("installment_number").first()
+# Batch payment API: spreads amounts over unpaid installments in order, or pays listed installments.
+# Users may pay their own loans; admins (e.g. bulk collection runs) any loan.
+class PaymentBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
 
-    if next_payment:
-        loan.next_due_date = next_payment.due_date
-    else:
-        loan.next_due_date = None
-        loan.status = "CLOSED"
+    @query_budget(None, repeats=False)  # About 9 per payment, one transaction per payment
+    def post(self, request):
+        # Accept a single payment object, a JSON array, {"payments": [...]} or an NDJSON body
+        items = request.data
+        if isinstance(items, dict):
+            items = items["payments"] if "payments" in items else [items]
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"success": False, "message": "Provide a payment or a non-empty list of payments."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-    loan.save()
-    return Response({"success": True})
+        results = payments.allocate_payments(request.user, items)
+        applied = sum(1 for result in results if result["success"])
+        return Response({
+            "success": applied == len(results),
+            "applied": applied,
+            "failed": len(results) - applied,
+            "results": results,
+        }, status=status.HTTP_200_OK if applied == len(results) else status.HTTP_207_MULTI_STATUS)
 
 
 # Foreclose loan view
 class ForecloseLoanView(APIView):
     permission_classes = [IsAuthenticated, IsUser]
 
+    @query_budget(8)
     def post(self, request, loan_id):
         try:
-            loan = Loan.objects.filter(user=request.user, loan_id=loan_id, status="ACTIVE").first()
-            if not loan:
-                return Response({"error": "Loan not found or already closed"}, status=400)
-
-            paid_installments = PaymentSchedule.objects.filter(loan=loan, due_date__lte=now().date())
-            total_paid = sum([entry.principal_component + entry.interest_component for entry in paid_installments])
-
-            # Calculate remaining balance and foreclosure details
-            remaining_balance = loan.total_payable - total_paid
-            remaining_interest = loan.total_interest - sum([entry.interest_component for entry in paid_installments])
-            foreclosure_discount = remaining_interest * Decimal("0.05")
-            final_settlement_amount = remaining_balance - foreclosure_discount
-
-            # Update loan details
-            loan.status = "CLOSED"
-            loan.final_settlement_amount = round(final_settlement_amount, 2)
-            loan.foreclosure_discount = round(foreclosure_discount, 2)
-            loan.foreclosure_date = now().date()
-            loan.save()
-
-            # Mark all payment schedules as paid
-            PaymentSchedule.objects.filter(loan=loan).update(status="PAID")
+            with transaction.atomic():
+                # Lock the loan so a concurrent payment cannot slip in between quoting and closing
+                loan = Loan.objects.select_for_update().filter(
+                    user_id=request.user.pk, loan_id=loan_id, status="ACTIVE"
+                ).first()
+                if not loan:
+                    return Response({"error": "Loan not found or already closed"}, status=400)
+
+                # Reuses the quote shown by foreclosure_details while the loan version is unchanged
+                quote = foreclosure_quote(loan)
+
+                # Update loan details
+                rows = unpaid_rows(loan)
+                loan.status = "CLOSED"
+                loan.final_settlement_amount = quote["final_settlement_amount"]
+                loan.foreclosure_discount = quote["foreclosure_discount"]
+                loan.foreclosure_date = now().date()
+                loan.late_fees_paid += quote["late_fees"]  # Outstanding late fees are settled too
+                if loan.is_virtual:
+                    loan.paid_mask = full_mask(loan.tenure)
+                for field, value in expected_counters(loan, loan.tenure).items():
+                    setattr(loan, field, value)
+                loan.save()
+
+                # Mark all payment schedules as paid
+                PaymentSchedule.objects.filter(loan=loan).update(status="PAID")
+
+                # Every unpaid installment is settled, less the waived interest, and the loan closes
+                record_foreclosure(loan, rows)
+                loans_changed([loan.user_id])
 
             return Response({
                 "success": "success",
                 "message": "Loan foreclosed successfully!",
                 "loan_id": loan.loan_id,
-                "foreclosure_discount": round(foreclosure_discount, 2),
-                "final_settlement_amount": round(final_settlement_amount, 2),
+                "foreclosure_discount": quote["foreclosure_discount"],
+                "final_settlement_amount": quote["final_settlement_amount"],
                 "foreclosure_date": loan.foreclosure_date,
                 "status": loan.status
             }, status=200)
@@ -464,25 +650,11 @@ class ForecloseLoanView(APIView):
 
 
 # Foreclosure details API
+@query_budget(3)  # User row (unless token claims are trusted), the loan and its quote
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsUser])
+@replica_reads
 def foreclosure_details(request, loan_id):
-    loan = get_object_or_404(Loan, loan_id=loan_id)
-    total_paid = loan.amount_paid if loan.amount_paid else Decimal("0")
-
-    # Calculate remaining balance
-    if total_paid == Decimal("0"):
-        remaining_balance = loan.amount
-    else:
-        remaining_balance = loan.amount_remaining if loan.amount_remaining is not None else (loan.amount - total_paid)
-
-    # Calculate foreclosure discount and final settlement amount
-    foreclosure_discount = Decimal("0.05") * remaining_balance
-    final_settlement_amount = remaining_balance - foreclosure_discount
-
-    return Response({
-        "total_paid": total_paid,
-        "remaining_balance": remaining_balance,
-        "foreclosure_discount": foreclosure_discount,
-        "final_settlement_amount": final_settlement_amount,
-    })
\ No newline at end of file
+    # Same quote ForecloseLoanView settles with, served from cache until the loan changes
+    loan = get_object_or_404(Loan, user_id=request.user.pk, loan_id=loan_id)
+    return Response(foreclosure_quote(loan))
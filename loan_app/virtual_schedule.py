@@ -0,0 +1,230 @@
+# File: virtual_schedule.py
+# Description: Virtual payment schedules derived from loan terms plus a paid-installment bitmap, and conversion helpers.
+
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .amortization import CENT, amortize, legacy_final_installment
+from .models import Loan, PaymentSchedule
+from .overdue import late_fee_policy
+from .response_cache import loans_changed
+
+# Schedule storage used for new loans when LOAN_SCHEDULE_MODE is not configured
+DEFAULT_SCHEDULE_MODE = "MATERIALIZED"
+
+ZERO = Decimal("0.00")
+
+
+def default_schedule_mode():
+    return getattr(settings, "LOAN_SCHEDULE_MODE", DEFAULT_SCHEDULE_MODE)
+
+
+# Paid-installment bitmap: bit (n - 1) is set when installment n is paid
+
+def paid_numbers(mask):
+    # Return the set of paid installment numbers
+    return {
+        index * 8 + bit + 1
+        for index, byte in enumerate(bytes(mask or b""))
+        for bit in range(8)
+        if byte >> bit & 1
+    }
+
+
+def paid_count(mask):
+    return sum(bin(byte).count("1") for byte in bytes(mask or b""))
+
+
+def with_paid(mask, numbers):
+    # Return a copy of the bitmap with the given installments marked paid
+    data = bytearray(bytes(mask or b""))
+    for number in numbers:
+        index, bit = divmod(number - 1, 8)
+        if index >= len(data):
+            data.extend(b"\0" * (index + 1 - len(data)))
+        data[index] |= 1 << bit
+    return bytes(data)
+
+
+def full_mask(tenure):
+    # Bitmap with every installment paid
+    return with_paid(b"", range(1, tenure + 1))
+
+
+# Installment references: virtual installments have no row id, so payments address them as "<loan_id>-<number>"
+
+def installment_ref(loan_id, number):
+    return f"{loan_id}-{number}"
+
+
+def parse_installment_ref(value):
+    # Return (loan_id, installment number) for a reference, or None for anything else (e.g. a row id)
+    if not isinstance(value, str) or "-" not in value:
+        return None
+    loan_id, _, number = value.rpartition("-")
+    if not loan_id or not number.isdigit():
+        return None
+    return loan_id, int(number)
+
+
+class VirtualInstallment:
+    # Read-only stand-in for a PaymentSchedule row of a virtual schedule
+    __slots__ = (
+        "loan_id", "installment_number", "due_date", "principal_component", "interest_component",
+        "remaining_balance", "status", "days_past_due", "late_fee",
+    )
+
+    def __init__(self, loan_id, installment_number, due_date, principal_component, interest_component,
+                 remaining_balance, status, days_past_due, late_fee):
+        self.loan_id = loan_id
+        self.installment_number = installment_number
+        self.due_date = due_date
+        self.principal_component = principal_component
+        self.interest_component = interest_component
+        self.remaining_balance = remaining_balance
+        self.status = status
+        self.days_past_due = days_past_due
+        self.late_fee = late_fee
+
+    @property
+    def id(self):
+        return installment_ref(self.loan_id, self.installment_number)
+
+    pk = id
+
+
+@lru_cache(maxsize=1024)
+def _schedule_rows(amount, tenure, interest_rate, monthly_installment, start_date):
+    # Memoized (installment_number, due_date, principal, interest, balance) rows for a set of loan terms
+    return tuple(amortize(amount, tenure, interest_rate, monthly_installment, start_date).rows())
+
+
+def schedule_rows(loan):
+    # Derived schedule rows of a virtual loan (identical to the rows a materialized loan would store)
+    return _schedule_rows(loan.amount, loan.tenure, loan.interest_rate, loan.monthly_installment, loan.schedule_start)
+
+
+def virtual_schedule(loan, as_of=None):
+    # Return the loan's installments with statuses as of a date (today by default). Unpaid installments
+    # past their due date are reported OVERDUE with the same late fee run_overdue would charge.
+    as_of = as_of or now().date()
+    rate, grace_days = late_fee_policy()
+    paid = paid_numbers(loan.paid_mask)
+
+    installments = []
+    for number, due_date, principal, interest, balance in schedule_rows(loan):
+        if number in paid:
+            status, days_past_due, late_fee = "PAID", 0, ZERO
+        elif due_date < as_of:
+            status, days_past_due = "OVERDUE", (as_of - due_date).days
+            late_fee = ((principal + interest) * rate * max(days_past_due - grace_days, 0)).quantize(CENT, ROUND_HALF_UP)
+        else:
+            status, days_past_due, late_fee = "PENDING", 0, ZERO
+        installments.append(VirtualInstallment(
+            loan.loan_id, number, due_date, principal, interest, balance, status, days_past_due, late_fee
+        ))
+    return installments
+
+
+def unpaid_numbers(loan, mask=None):
+    # Unpaid installment numbers in order
+    paid = paid_numbers(loan.paid_mask if mask is None else mask)
+    return [number for number in range(1, loan.tenure + 1) if number not in paid]
+
+
+def next_due_date(loan, mask):
+    # Due date of the first unpaid installment, or None when everything is paid
+    unpaid = unpaid_numbers(loan, mask)
+    return schedule_rows(loan)[unpaid[0] - 1][1] if unpaid else None
+
+
+def _start_date_candidates(loan):
+    # Schedules start on the creation date (UTC); neighbouring days cover loans created around midnight
+    created = loan.created_at.date()
+    return [created, created - timedelta(days=1), created + timedelta(days=1)]
+
+
+def _reproduces(loan, rows, start_date):
+    # Whether stored (number, due date, principal, interest, balance) rows are the loan's schedule from
+    # start_date. Schedules written before the final installment was reconciled end with a full EMI and a
+    # few cents of balance; that final row is accepted too and becomes the reconciled one once virtual.
+    expected = _schedule_rows(loan.amount, loan.tenure, loan.interest_rate, loan.monthly_installment, start_date)
+    if len(rows) != len(expected) or not rows or list(expected[:-1]) != rows[:-1]:
+        return False
+    number, due_date, principal, interest, balance = rows[-1]
+    if (number, due_date, interest) != (expected[-1][0], expected[-1][1], expected[-1][3]):
+        return False
+    return (principal, balance) in (
+        (expected[-1][2], expected[-1][4]),
+        legacy_final_installment(loan.amount, loan.tenure, loan.interest_rate, loan.monthly_installment),
+    )
+
+
+def virtualize_loans(loans):
+    # Convert materialized loans to virtual schedules, one transaction for the batch. Loans whose stored
+    # rows cannot be reproduced from their terms (e.g. edited by hand) are left alone.
+    # Returns (converted loan ids, skipped loan ids).
+    converted, skipped = [], []
+    with transaction.atomic():
+        loans = list(Loan.objects.select_for_update().filter(
+            pk__in=[loan.pk for loan in loans], schedule_mode="MATERIALIZED"
+        ).order_by("id"))
+        stored = {}
+        for row in PaymentSchedule.objects.filter(loan_id__in=[loan.loan_id for loan in loans]).order_by(
+            "loan_id", "installment_number"
+        ).values_list("loan_id", "installment_number", "due_date", "principal_component", "interest_component",
+                      "remaining_balance", "status"):
+            stored.setdefault(row[0], []).append(row[1:])
+
+        for loan in loans:
+            rows = stored.get(loan.loan_id, [])
+            stored_rows = [row[:5] for row in rows]
+            for start_date in _start_date_candidates(loan):
+                if _reproduces(loan, stored_rows, start_date):
+                    loan.schedule_mode = "VIRTUAL"
+                    loan.schedule_start = start_date
+                    loan.paid_mask = with_paid(b"", [row[0] for row in rows if row[5] == "PAID"])
+                    converted.append(loan)
+                    break
+            else:
+                skipped.append(loan.loan_id)
+
+        Loan.objects.bulk_update(converted, ["schedule_mode", "schedule_start", "paid_mask"])
+        Loan.objects.filter(pk__in=[loan.pk for loan in converted]).update(version=F("version") + 1)
+        PaymentSchedule.objects.filter(loan_id__in=[loan.loan_id for loan in converted]).delete()
+        loans_changed([loan.user_id for loan in converted])
+    return [loan.loan_id for loan in converted], skipped
+
+
+def materialize_loans(loans, as_of=None):
+    # Convert virtual loans back to PaymentSchedule rows in one transaction; returns the converted loan ids
+    with transaction.atomic():
+        loans = list(Loan.objects.select_for_update().filter(
+            pk__in=[loan.pk for loan in loans], schedule_mode="VIRTUAL"
+        ).order_by("id"))
+        PaymentSchedule.objects.bulk_create([
+            PaymentSchedule(
+                loan_id=loan.loan_id,
+                installment_number=installment.installment_number,
+                due_date=installment.due_date,
+                principal_component=installment.principal_component,
+                interest_component=installment.interest_component,
+                remaining_balance=installment.remaining_balance,
+                status=installment.status,
+                days_past_due=installment.days_past_due,
+                late_fee=installment.late_fee,
+            )
+            for loan in loans
+            for installment in virtual_schedule(loan, as_of)
+        ], batch_size=5000)
+        Loan.objects.filter(pk__in=[loan.pk for loan in loans]).update(
+            schedule_mode="MATERIALIZED", paid_mask=b"", version=F("version") + 1
+        )
+        loans_changed([loan.user_id for loan in loans])
+    return [loan.loan_id for loan in loans]
@@ -15,15 +15,24 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'loan_app.authentication.JWTAuthentication',
     )
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "loan_app.serializers.RoleTokenObtainPairSerializer",
 }
 
+# Authenticated user cache (per process) and token role claims. Both are only trusted when AUTH_REVOCATION_CACHE,
+# which records user changes, is shared by all workers; with a per-process cache every request loads the user row,
+# as role changes made through one worker are unseen by others. The "auth" cache alias (see CACHES below) is
+# shared by default: AUTH_CACHE_BACKEND picks where it lives.
+USER_CACHE_MAX_SIZE = 10000  # Users kept in memory per worker
+USER_CACHE_TTL = 60  # Seconds before a cached user is reloaded
+AUTH_REVOCATION_CACHE = "auth"  # Cache alias recording user changes
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -58,6 +67,9 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'loan_app.CustomUser'
 
 MIDDLEWARE = [
+    'loan_app.instrumentation.RequestMetricsMiddleware',  # Server-Timing headers and /metrics histograms (outermost: times everything)
+    'loan_app.query_budget.QueryBudgetMiddleware',  # N+1 checks of whole requests (QUERY_BUDGET_MODE)
+    'loan_app.compression.CompressionMiddleware',  # gzip / brotli for large API responses (Accept-Encoding)
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', 
     'django.middleware.security.SecurityMiddleware',
@@ -65,6 +77,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'loan_app.db_routing.ReplicaRoutingMiddleware',  # Read-your-writes stickiness for replica reads
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -102,17 +115,40 @@ WSGI_APPLICATION = 'loan_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds (default 0: one per request) and checked before reuse.
+# DB_POOL=1 uses Django's connection pool instead (needs psycopg 3 with psycopg_pool; CONN_MAX_AGE must be 0).
+DB_POOL = os.environ.get("DB_POOL", "0") == "1"
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'loan_db',
-        'USER': 'loan_user',
-        'PASSWORD': 'root',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'loan_db'),
+        'USER': os.environ.get('DB_USER', 'loan_user'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'root'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': True} if DB_POOL else {},
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS="replica1.internal,replica2.internal:5433" adds aliases replica1, replica2, ...
+# with the primary's credentials. Read-only views marked @replica_reads use them (loan_app.db_routing); tests
+# run them as mirrors of the primary. Two local databases work too, e.g. DB_REPLICA_HOSTS=localhost:5433.
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(",")), 1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"], "HOST": host, "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{index}")
+DATABASE_ROUTERS = ["loan_app.db_routing.ReplicaRouter"]
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 10))  # Reads on the primary after a write
+# Cache alias remembering recent writers; must be shared by all workers when replicas are configured (checked at
+# startup), e.g. RESPONSE_CACHE_BACKEND=db
+DATABASE_STICKY_CACHE = "responses"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -171,4 +207,98 @@ STATICFILES_DIRS = [
 ]
 
 # If using Whitenoise for deployment, add this:
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Loan ID allocation
+# Number of loan ids each worker reserves from the database at a time
+LOAN_ID_BLOCK_SIZE = int(os.environ.get("LOAN_ID_BLOCK_SIZE", 100))
+
+# Loan list pagination
+# Page size for /api/loans/ and /api/admin/loans/ when the client does not pass ?limit=
+LOAN_PAGE_SIZE = int(os.environ.get("LOAN_PAGE_SIZE", 50))
+
+# Email outbox
+# OTP emails are queued in the database and delivered by `python manage.py run_email_outbox`
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 100))  # Messages claimed per round
+EMAIL_OUTBOX_WORKERS = int(os.environ.get("EMAIL_OUTBOX_WORKERS", 4))  # Sender threads (one SMTP connection each)
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))  # Attempts before giving up
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get("EMAIL_OUTBOX_RETRY_DELAY", 30))  # First retry delay in seconds (doubles)
+EMAIL_TIMEOUT = 30  # Seconds before a stalled SMTP connection is abandoned
+
+# Overdue installments (`python manage.py run_overdue`, run daily)
+LATE_FEE_DAILY_RATE = os.environ.get("LATE_FEE_DAILY_RATE", "0.0005")  # Share of the installment charged per day late
+LATE_FEE_GRACE_DAYS = int(os.environ.get("LATE_FEE_GRACE_DAYS", 0))  # Days past due before late fees accrue
+
+# Foreclosure quotes
+# Cache alias holding quotes keyed by loan version and date (use a shared backend with several workers)
+FORECLOSURE_QUOTE_CACHE = "default"
+
+# Public loan quotes
+QUOTE_MEMO_SIZE = 4096  # (amount, tenure, rate) combinations memoized per process
+QUOTE_SCHEDULE_MEMO_SIZE = 64  # Full schedules memoized per process (up to about 65 KB each)
+
+# Payment schedule storage for new loans: "MATERIALIZED" stores one PaymentSchedule row per installment,
+# "VIRTUAL" derives the schedule from the loan terms (see `python manage.py convert_schedules`)
+LOAN_SCHEDULE_MODE = os.environ.get("LOAN_SCHEDULE_MODE", "MATERIALIZED")
+
+# Loan list response cache (GET /api/loans/ and /api/admin/loans/, with ETag / 304 revalidation)
+# RESPONSE_CACHE_BACKEND picks where rendered responses and loan-set versions live:
+#   "off"    - nothing is cached (default); lists are rendered per request and still answer If-None-Match
+#   "locmem" - per process; only correct with a single worker process (checked against WEB_CONCURRENCY)
+#   "file"   - shared by the worker processes of one host (RESPONSE_CACHE_LOCATION directory)
+#   "db"     - shared by every host; run `python manage.py createcachetable` once
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "off")
+AUTH_CACHE_BACKEND = os.environ.get("AUTH_CACHE_BACKEND", "file")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "responses": {
+        "file": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("RESPONSE_CACHE_LOCATION", os.path.join(BASE_DIR, "cache", "responses")),
+        },
+        "db": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "loan_response_cache"},
+    }.get(RESPONSE_CACHE_BACKEND, {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "loan-responses"}),
+    # User change log behind AUTH_REVOCATION_CACHE. AUTH_CACHE_BACKEND picks where it lives:
+    #   "file"   - shared by the worker processes of one host (AUTH_CACHE_LOCATION directory; default)
+    #   "db"     - shared by every host, needed with several; run `python manage.py createcachetable` once
+    #   "locmem" - per process: tokens and cached users are never trusted, every request loads the user row
+    "auth": {
+        "file": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("AUTH_CACHE_LOCATION", os.path.join(BASE_DIR, "cache", "auth")),
+        },
+        "db": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "loan_auth_cache"},
+    }.get(AUTH_CACHE_BACKEND, {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "loan-auth"}),
+}
+LOAN_RESPONSE_CACHE = None if RESPONSE_CACHE_BACKEND == "off" else "responses"  # Cache alias used for loan list responses
+LOAN_RESPONSE_CACHE_TTL = int(os.environ.get("LOAN_RESPONSE_CACHE_TTL", 60))  # Seconds a rendered response is kept
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))  # Worker processes per host (gunicorn and uvicorn read it too)
+
+# Request metrics (loan_app.instrumentation.RequestMetricsMiddleware, scraped at /metrics)
+# Every request is counted; SQL, serializer, render and total times are recorded for a sampled share.
+# Metrics are kept per process: with several workers, scrape each one or run a single worker per container.
+REQUEST_METRICS_ENABLED = os.environ.get("REQUEST_METRICS_ENABLED", "1") == "1"
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get("REQUEST_METRICS_SAMPLE_RATE", 1.0))  # 0.0 - 1.0
+# Server-Timing exposes SQL time and query counts to every client: turn it on for local profiling only
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "0") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # Bearer token /metrics requires; without one it is closed
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "0") == "1"  # Serve /metrics without a token (private networks only)
+
+# Query budgets (loan_app.query_budget): views declare @query_budget(n); QueryBudgetMiddleware also checks
+# whole requests for the same query shape running more than QUERY_BUDGET_REPEAT_LIMIT times (N+1)
+#   "off"   - nothing is recorded (default; production)
+#   "warn"  - problems are logged with the stack of the first repeated query (development)
+#   "raise" - problems raise QueryBudgetExceeded (tests)
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "off")  # Recording runs regexes over every query
+QUERY_BUDGET_REPEAT_LIMIT = int(os.environ.get("QUERY_BUDGET_REPEAT_LIMIT", 3))
+QUERY_BUDGET_REQUEST_LIMIT = None  # Most queries any single request may run (None: no limit)
+
+# List endpoints render JSON with orjson when it is installed (same bytes as DRF's JSONRenderer, see loan_app/renderers.py)
+ORJSON_RENDERER = os.environ.get("ORJSON_RENDERER", "1") == "1"
+
+# Compression of API responses (loan_app/compression.py): brotli when installed (pip install brotli), else gzip
+COMPRESSION_PATHS = ("/api/",)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))  # Smaller bodies are sent as they are
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_CACHE_BYTES = int(os.environ.get("COMPRESSION_CACHE_BYTES", 32 * 1024 * 1024))  # Compressed cached lists kept per process
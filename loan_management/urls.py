@@ -16,10 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from loan_app.views import guest_page 
+from loan_app.views import guest_page, metrics
 
 urlpatterns = [
     path('', guest_page),
     path('admin/', admin.site.urls),  
     path('api/', include('loan_app.urls')),  
+    path('metrics', metrics, name='metrics'),  # Prometheus request metrics
 ]